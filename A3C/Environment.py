@@ -1,10 +1,8 @@
 
-import os
 import gym
 from settings import ENV, FRAME_SKIP
 
-from PIL import Image
-import imageio
+from GifRecorder import GifRecorder
 
 class Environment:
 
@@ -15,7 +13,7 @@ class Environment:
         print()
         self.render = False
         self.offset = 0
-        self.images = []
+        self.recorder = GifRecorder()
 
     def get_state_size(self):
         try:
@@ -51,9 +49,7 @@ class Environment:
                 self.env_no_frame_skip.render()
 
             # Save image
-            img = Image.fromarray(self.env.render(mode='rgb_array'))
-            img.save('tmp.png')
-            self.images.append(imageio.imread('tmp.png'))
+            self.recorder.add(self.env.render(mode='rgb_array'))
 
             s_, r_tmp, done, info = self.env_no_frame_skip.step(action)
             r += r_tmp
@@ -61,9 +57,8 @@ class Environment:
         return s_, r, done, info
 
     def save_gif(self, path):
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        imageio.mimsave(path, self.images, duration=1)
-        self.images = []
+        self.recorder.save(path)
 
     def close(self):
+        self.recorder.close()
         self.env.close()
@@ -7,6 +7,7 @@ from collections import deque
 from QNetwork import QNetwork
 from ExperienceBuffer import ExperienceBuffer
 from Environment import Environment
+from VectorEnvironment import build_vector_env
 
 from settings import Settings
 
@@ -35,6 +36,9 @@ class Agent:
         self.saver = saver
 
         self.env = Environment()
+        self.vector_env = None
+        if Settings.NB_ENVS > 1:
+            self.vector_env = build_vector_env(Settings.NB_ENVS, self.env)
         self.QNetwork = QNetwork(self.sess)
         self.buffer = ExperienceBuffer()
         self.epsilon = Settings.EPSILON_START
@@ -45,6 +49,10 @@ class Agent:
         self.best_run = -1e10
         self.n_gif = 0
 
+        self.total_steps = 0
+        self.nb_ep = 1
+        self.restored = False
+
         print("Agent initialized !\n")
 
     def pre_train(self):
@@ -79,6 +87,36 @@ class Agent:
 
         print("End of the pre training !")
 
+    def get_state(self):
+        """
+        Return everything needed to resume the training besides the network
+        weights.
+        """
+        return {'epsilon': self.epsilon,
+                'best_run': self.best_run,
+                'total_steps': self.total_steps,
+                'nb_ep': self.nb_ep,
+                'learning_rate': self.QNetwork.learning_rate,
+                'buffer': self.buffer.get_state(),
+                'random_state': random.getstate(),
+                'np_random_state': np.random.get_state()}
+
+    def set_state(self, state):
+        """
+        Restore a training state built by get_state. The pre-training is then
+        skipped since the buffer is already filled.
+        """
+        self.epsilon = state['epsilon']
+        self.best_run = state['best_run']
+        self.total_steps = state['total_steps']
+        self.nb_ep = state['nb_ep']
+        self.QNetwork.learning_rate = state['learning_rate']
+        self.buffer.set_state(state['buffer'])
+        random.setstate(state['random_state'])
+        np.random.set_state(state['np_random_state'])
+
+        self.restored = True
+
     def save_best(self, episode_reward):
         self.best_run = episode_reward
         print("Save best", episode_reward)
@@ -92,11 +130,14 @@ class Agent:
         """
         print("Beginning of the run...")
 
-        self.pre_train()
-        self.QNetwork.init_target()
+        # A restored agent already has a filled buffer and a target network
+        if not self.restored:
+            self.pre_train()
+            self.QNetwork.init_target()
 
-        self.total_steps = 0
-        self.nb_ep = 1
+        if self.vector_env is not None:
+            self.run_vector()
+            return
 
         while self.nb_ep < Settings.TRAINING_EPS and not self.gui.STOP:
 
@@ -105,10 +146,7 @@ class Agent:
             done = False
 
             episode_step = 1
-            # The more episodes the agent performs, the longer they are
-            max_step = Settings.MAX_EPISODE_STEPS
-            if Settings.EP_ELONGATION > 0:
-                max_step += self.nb_ep // Settings.EP_ELONGATION
+            max_step = self.max_episode_step()
 
             # Render settings
             self.env.set_render(self.gui.render.get(self.nb_ep))
@@ -117,17 +155,15 @@ class Agent:
 
             while episode_step <= max_step and not done:
 
-                # Exploration by epsilon-greedy policy
-                if random.random() < self.epsilon:
-                    a = self.env.act_random()
-                else:
+                # Exploration by epsilon-greedy policy, the action is chosen
+                # inside the graph
+                a = self.QNetwork.choose_action(s, self.epsilon)
+
+                if plot_distrib:
                     Qdistrib = self.QNetwork.act(s)
                     Qvalue = np.sum(self.z * Qdistrib, axis=1)
-                    a = np.argmax(Qvalue, axis=0)
-
-                    if plot_distrib:
-                        self.displayer.disp_distrib(self.z, self.delta_z,
-                                                    Qdistrib, Qvalue)
+                    self.displayer.disp_distrib(self.z, self.delta_z,
+                                                Qdistrib, Qvalue)
 
                 s_, r, done, info = self.env.act(a)
                 episode_reward += r
@@ -135,36 +171,133 @@ class Agent:
                 self.buffer.add((s, a, r, s_, 1 if not done else 0))
 
                 if self.total_steps % Settings.TRAINING_FREQ == 0:
-                    batch = self.buffer.sample()
-                    self.QNetwork.train(np.asarray(batch))
-                    self.QNetwork.update_target()
+                    self.learn()
 
                 s = s_
                 episode_step += 1
                 self.total_steps += 1
 
-            # Decay epsilon
-            if self.epsilon > Settings.EPSILON_STOP:
-                self.epsilon -= Settings.EPSILON_DECAY
+            self.end_episode(episode_reward, episode_step, max_step)
 
-            self.QNetwork.decrease_lr()
+        self.env.close()
 
-            self.displayer.add_reward(episode_reward, plot=self.gui.plot.get(self.nb_ep))
-            # if episode_reward > self.best_run:
-            #     self.save_best(episode_reward)
-            
-            # Episode display
-            if self.gui.ep_reward.get(self.nb_ep):
-                print('Episode %2i, Reward: %7.3f, Steps: %i, Epsilon: %f, Max steps: %i, LR: %fe-4' % (
-                    self.nb_ep, episode_reward, episode_step, self.epsilon, max_step, self.QNetwork.learning_rate))
+    def run_vector(self):
+        """
+        Method to run the agent in Settings.NB_ENVS environments stepped in
+        lockstep : the actions of every environment are chosen with a single
+        forward pass of the network. The training frequency is still counted
+        in environment steps.
+        """
+        nb_envs = Settings.NB_ENVS
 
-            # Save the model
-            if self.gui.save.get(self.nb_ep):
-                self.saver.save(self.nb_ep)
+        s = self.vector_env.reset()
+        episode_rewards = np.zeros(nb_envs)
+        episode_steps = np.zeros(nb_envs, dtype=np.int64)
+        max_steps = np.full(nb_envs, self.max_episode_step())
 
-            self.nb_ep += 1
+        # Render settings (only the first environment is displayed)
+        self.vector_env.set_render(self.gui.render.get(self.nb_ep))
+        self.vector_env.set_gif(self.gui.gif.get(self.nb_ep))
+        plot_distrib = self.gui.plot_distrib.get(self.nb_ep)
 
-        self.env.close()
+        while self.nb_ep < Settings.TRAINING_EPS and not self.gui.STOP:
+
+            # Exploration by epsilon-greedy policy, the actions are chosen
+            # inside the graph
+            a = self.QNetwork.choose_actions(s, self.epsilon)
+
+            if plot_distrib:
+                Qdistrib = self.QNetwork.act(s[0])
+                Qvalue = np.sum(self.z * Qdistrib, axis=1)
+                self.displayer.disp_distrib(self.z, self.delta_z,
+                                            Qdistrib, Qvalue)
+
+            s_, r, done, info = self.vector_env.act(a)
+            episode_rewards += r
+            episode_steps += 1
+
+            # The finished environments are already reset : their experiences
+            # end on the terminal state given in info
+            for e in range(nb_envs):
+                next_state = info[e].get('terminal_state', s_[e])
+                self.buffer.add((s[e], a[e], r[e], next_state, 1 if not done[e] else 0))
+
+            # Train once every TRAINING_FREQ environment steps
+            nb_train = (self.total_steps + nb_envs) // Settings.TRAINING_FREQ - \
+                self.total_steps // Settings.TRAINING_FREQ
+            for _ in range(nb_train):
+                self.learn()
+            self.total_steps += nb_envs
+
+            # Cut the episodes that reached their maximum number of steps
+            cut = np.flatnonzero(~done & (episode_steps >= max_steps))
+            if len(cut) > 0:
+                s_ = self.vector_env.reset(cut)
+
+            for e in np.flatnonzero(done | (episode_steps >= max_steps)):
+                self.end_episode(episode_rewards[e], episode_steps[e], max_steps[e])
+
+                episode_rewards[e] = 0
+                episode_steps[e] = 0
+                max_steps[e] = self.max_episode_step()
+
+                if e == 0:
+                    self.vector_env.set_render(self.gui.render.get(self.nb_ep))
+                    self.vector_env.set_gif(self.gui.gif.get(self.nb_ep))
+                    plot_distrib = self.gui.plot_distrib.get(self.nb_ep)
+
+            s = s_
+
+        self.vector_env.close()
+
+    def max_episode_step(self):
+        """
+        Return the maximum number of steps of the next episode : the more
+        episodes the agent performs, the longer they are.
+        """
+        max_step = Settings.MAX_EPISODE_STEPS
+        if Settings.EP_ELONGATION > 0:
+            max_step += self.nb_ep // Settings.EP_ELONGATION
+        return max_step
+
+    def learn(self):
+        """
+        Train the network on a minibatch and update the target network.
+        """
+        batch = self.buffer.sample()
+        self.QNetwork.train(batch)
+        self.QNetwork.update_target()
+
+    def end_episode(self, episode_reward, episode_step, max_step):
+        """
+        Decay the exploration and the learning rate, display the episode and
+        save the model and the training state at the end of an episode.
+        """
+        # Decay epsilon
+        if self.epsilon > Settings.EPSILON_STOP:
+            self.epsilon -= Settings.EPSILON_DECAY
+
+        self.QNetwork.decrease_lr()
+
+        self.displayer.add_reward(episode_reward, plot=self.gui.plot.get(self.nb_ep))
+        # if episode_reward > self.best_run:
+        #     self.save_best(episode_reward)
+        
+        # Episode display
+        if self.gui.ep_reward.get(self.nb_ep):
+            print('Episode %2i, Reward: %7.3f, Steps: %i, Epsilon: %f, Max steps: %i, LR: %fe-4' % (
+                self.nb_ep, episode_reward, episode_step, self.epsilon, max_step, self.QNetwork.learning_rate))
+
+        # Save the model
+        save = self.gui.save.get(self.nb_ep)
+        if save:
+            self.saver.save(self.nb_ep)
+
+        self.nb_ep += 1
+
+        # Save the training state (to resume at the next episode)
+        if save:
+            self.saver.save_state(self.get_state(), self.nb_ep - 1)
 
     def play(self, number_run, name=None):
         """
@@ -186,9 +319,7 @@ class Agent:
                 self.env.set_gif(True, name)
 
                 while not done:
-                    Qdistrib = self.QNetwork.act(s)
-                    Qvalue = np.sum(self.z * Qdistrib, axis=1)
-                    a = np.argmax(Qvalue, axis=0)
+                    a = self.QNetwork.choose_action(s)
                     s, r, done, info = self.env.act(a)
 
                     episode_reward += r
@@ -206,3 +337,5 @@ class Agent:
 
     def stop(self):
         self.env.close()
+        if self.vector_env is not None:
+            self.vector_env.close()
@@ -21,6 +21,10 @@ def build_critic(states, trainable, scope):
     """
     with tf.variable_scope(scope):
 
+        # Pixels are fed in uint8 and normalized inside the graph
+        if hasattr(Settings, 'CONV_LAYERS') and Settings.CONV_LAYERS:
+            states = tf.cast(states, tf.float32) / 255
+
         layer = states
 
         # Convolution layers
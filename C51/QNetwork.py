@@ -3,7 +3,8 @@ import tensorflow as tf
 import numpy as np
 
 from Model import build_critic
-from network_utils import get_vars, copy_vars
+from network_utils import get_vars, copy_vars, ActRunner
+from FrozenPolicy import export_frozen_graph, STATE, ACTION, OUTPUT
 from settings import Settings
 
 
@@ -31,11 +32,14 @@ class QNetwork:
         self.learning_rate = Settings.LEARNING_RATE
         self.delta_lr = Settings.LEARNING_RATE / Settings.TRAINING_EPS
 
+        # Pixels are fed in uint8 (see Model)
+        state_dtype = tf.uint8 if hasattr(Settings, 'CONV_LAYERS') and Settings.CONV_LAYERS else tf.float32
+
         # Batch placeholders
-        self.state_ph = tf.placeholder(tf.float32, [None, *Settings.STATE_SIZE], name='state')
+        self.state_ph = tf.placeholder(state_dtype, [None, *Settings.STATE_SIZE], name='state')
         self.action_ph = tf.placeholder(tf.int32, [None], name='action')
         self.reward_ph = tf.placeholder(tf.float32, [None], name='reward')
-        self.next_state_ph = tf.placeholder(tf.float32, [None, *Settings.STATE_SIZE], name='next_state')
+        self.next_state_ph = tf.placeholder(state_dtype, [None, *Settings.STATE_SIZE], name='next_state')
         self.not_done_ph = tf.placeholder(tf.float32, [None], name='not_done')
         
         # Turn these in column vector to add them to the distribution
@@ -49,10 +53,16 @@ class QNetwork:
 
         # Build the networks
         self.build_main_network()
+        self.build_acting()
         self.build_target()
         self.build_train_operation()
         self.build_update()
 
+        # Acting fast paths bound once to the session
+        self.act_runner = ActRunner(self.sess, self.Q_distrib, self.state_ph)
+        self.choose_runner = ActRunner(self.sess, self.actions, self.state_ph,
+                                       self.epsilon_ph)
+
         print("QNetwork created !\n")
 
     def build_main_network(self):
@@ -74,6 +84,25 @@ class QNetwork:
         ind = tf.stack((tf.range(self.batch_size), self.action_ph), axis=1)
         self.Q_distrib_taken_action = tf.gather_nd(self.Q_distrib, ind)
 
+    def build_acting(self):
+        """
+        Build the operation choosing the actions of a batch of states inside
+        the graph : the expected Q-values over the support, their argmax and,
+        with probability epsilon, a random action instead, so that only the
+        action indices are fetched.
+        """
+        self.epsilon_ph = tf.placeholder_with_default(0.0, [], name='epsilon')
+        batch_size = tf.shape(self.state_ph)[0]
+
+        # Transform the distribution into the value to get the argmax
+        Qvalue = tf.reduce_sum(self.z * self.Q_distrib, axis=2)
+        greedy_actions = tf.argmax(Qvalue, 1, output_type=tf.int32)
+
+        random_actions = tf.random_uniform([batch_size], 0, Settings.ACTION_SIZE,
+                                           dtype=tf.int32)
+        explore = tf.random_uniform([batch_size]) < self.epsilon_ph
+        self.actions = tf.where(explore, random_actions, greedy_actions)
+
     def build_target(self):
         """
         Build the operation to compute max_a Q(s_{t+1}, a) for the gradient
@@ -180,7 +209,47 @@ class QNetwork:
         """
         Wrapper method to compute the Q-value distribution given a single state.
         """
-        return self.sess.run(self.Q_distrib, feed_dict={self.state_ph: [state]})[0]
+        return self.act_runner(state)
+
+    def act_batch(self, states):
+        """
+        Wrapper method to compute the outputs of act for a batch of states in
+        a single forward pass.
+        """
+        return self.act_runner.run_batch(states)
+
+    def choose_action(self, state, epsilon=0):
+        """
+        Wrapper method to get the action chosen in the graph for a single
+        state, random with probability epsilon.
+        """
+        return self.choose_runner(state, epsilon)
+
+    def choose_actions(self, states, epsilon=0):
+        """
+        Wrapper method to get the actions chosen in the graph for a batch of
+        states, each random with probability epsilon.
+        """
+        return self.choose_runner.run_batch(states, epsilon)
+
+    def export_inference_graph(self, path):
+        """
+        Write at path a frozen inference graph state -> action (argmax of the
+        expected Q-values) and state -> output (Q-value distributions)
+        computed by a copy of the main network, to be loaded with
+        FrozenPolicy.
+        """
+        if STATE not in [op.name for op in self.sess.graph.get_operations()]:
+            with tf.name_scope('inference'), \
+                    tf.variable_scope(tf.get_variable_scope(), reuse=True):
+                state_ph = tf.placeholder(self.state_ph.dtype, self.state_ph.shape,
+                                          name='state')
+                output = build_critic(state_ph, trainable=True, scope='main_network')
+                Qvalue = tf.reduce_sum(self.z * output, axis=2)
+                tf.argmax(Qvalue, 1, output_type=tf.int32, name='action')
+                tf.identity(output, name='output')
+
+        export_frozen_graph(self.sess, [ACTION, OUTPUT], path)
 
     def decrease_lr(self):
         """
@@ -193,9 +262,9 @@ class QNetwork:
         """
         Wrapper method to train the network given a minibatch of experiences.
         """
-        feed_dict = {self.state_ph: np.stack(batch[:, 0]),
-                     self.action_ph: batch[:, 1],
-                     self.reward_ph: batch[:, 2],
-                     self.next_state_ph: np.stack(batch[:, 3]),
-                     self.not_done_ph: batch[:, 4]}
+        feed_dict = {self.state_ph: batch[0],
+                     self.action_ph: batch[1],
+                     self.reward_ph: batch[2],
+                     self.next_state_ph: batch[3],
+                     self.not_done_ph: batch[4]}
         self.sess.run(self.train_op, feed_dict=feed_dict)
@@ -31,6 +31,10 @@ if __name__ == '__main__':
 
         if not saver.load():
             sess.run(tf.global_variables_initializer())
+        else:
+            state = saver.load_state()
+            if state is not None:
+                agent.set_state(state)
 
         gui_thread.start()
         try:
@@ -40,6 +44,9 @@ if __name__ == '__main__':
         print("End of the run")
         
         saver.save(agent.nb_ep)
+        saver.save_state(agent.get_state(), agent.nb_ep)
+        if Settings.EXPORT_INFERENCE:
+            agent.QNetwork.export_inference_graph(Settings.MODEL_PATH + 'inference.pb')
         displayer.disp()
 
         gui_thread.join()
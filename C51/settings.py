@@ -17,6 +17,14 @@ class Settings:
     FRAME_SKIP        = 4
     EP_ELONGATION     = 5
 
+    # Number of environments stepped together with one forward pass per step
+    NB_ENVS = 1
+    # Number of processes stepping them (0 to step them in the main process)
+    ENV_WORKERS = 0
+    # Number of post-reset snapshots the environments start their episodes
+    # from (0 to reset them normally)
+    RESET_POOL = 0
+
 
     ###########################################################################
     # Network settings
@@ -43,6 +51,14 @@ class Settings:
     BUFFER_SIZE = 100000
     BATCH_SIZE  = 64
 
+    # Number of minibatches assembled in advance by a background thread
+    # (0 to sample them in the training loop)
+    PREFETCH_BATCHES = 0
+
+    # Storage types of the replay fields overriding the defaults (uint8
+    # pixels, int8 discrete actions), e.g. {'vectors': 'float16'}
+    REPLAY_DTYPES = {}
+
     TRAINING_FREQ      = 1
     UPDATE_TARGET_RATE = 0.05
 
@@ -74,6 +90,9 @@ class Settings:
     GIF_PATH     = 'results/gif/'
     MAX_NB_GIF   = 50
 
+    # Write a frozen inference graph (see FrozenPolicy) at the end of the run
+    EXPORT_INFERENCE = False
+
 
     ###########################################################################
 
@@ -0,0 +1,38 @@
+
+import tensorflow as tf
+
+from Model import build_actor
+from network_utils import copy_vars, get_vars
+from InferenceServer import InferenceServer
+
+from settings import Settings
+
+
+class ActorServer(InferenceServer):
+    """
+    Inference server running a single copy of the learner's actor network for
+    every agent, instead of one copy per agent with one session call per step
+    each.
+    """
+
+    def __init__(self, sess):
+        print("Initializing actor server...")
+
+        # Pixels are fed in uint8 (see Model)
+        state_dtype = tf.uint8 if hasattr(Settings, 'CONV_LAYERS') and Settings.CONV_LAYERS else tf.float32
+        state_ph = tf.placeholder(dtype=state_dtype,
+                                  shape=[None, *Settings.STATE_SIZE],
+                                  name='server_state_ph')
+
+        policy = build_actor(state_ph, trainable=False, scope='worker_agent')
+
+        # Operation to copy the weights of the learner's actor network
+        with sess.as_default(), sess.graph.as_default():
+            self.update = copy_vars(get_vars('learner_actor', trainable=True),
+                                    get_vars('worker_agent', trainable=False),
+                                    1, 'update_agents')
+
+        super().__init__(sess, state_ph, policy, Settings.NB_ACTORS,
+                         Settings.INFERENCE_BATCH, Settings.INFERENCE_WAIT_US)
+
+        print("Actor server initialized !\n")
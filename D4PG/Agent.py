@@ -1,11 +1,13 @@
 
 import tensorflow as tf
 import numpy as np
-from collections import deque
 
-from Model import build_actor
-from network_utils import copy_vars, get_vars
+from Model import build_actor, numpy_actor
+from NumpyPolicy import NumpyPolicy
+from network_utils import copy_vars, get_vars, ActRunner
+from NStepWriter import NStepWriter
 from Environment import Environment
+from VectorEnvironment import build_vector_env
 
 from settings import Settings
 
@@ -16,7 +18,8 @@ class Agent:
     experiences and put them into a buffer.
     """
 
-    def __init__(self, sess, n_agent, gui, displayer, buffer):
+    def __init__(self, sess, n_agent, gui, displayer, buffer, server=None,
+                 exporter=None):
         print("Initializing agent %i..." % n_agent)
 
         self.n_agent = n_agent
@@ -24,11 +27,25 @@ class Agent:
         self.gui = gui
         self.displayer = displayer
         self.buffer = buffer
+        self.writer = NStepWriter(buffer, Settings.N_STEP_RETURN,
+                                  Settings.DISCOUNT)
 
         self.env = Environment()
-
-        self.build_actor()
-        self.build_update()
+        self.vector_env = None
+        if Settings.NB_ENVS > 1:
+            self.vector_env = build_vector_env(Settings.NB_ENVS, self.env)
+
+        # With an exporter of the learner's weights, the actions are computed
+        # by a NumPy copy of the actor network. With an ActorServer, they are
+        # inferred by the network it shares between every agent (whose weights
+        # are updated by the learner)
+        self.numpy_policy = None
+        self.server = server
+        if exporter is not None:
+            self.numpy_policy = NumpyPolicy(exporter, numpy_actor)
+        elif server is None:
+            self.build_actor()
+            self.build_update()
 
         print("Agent initialized !\n")
 
@@ -38,7 +55,9 @@ class Agent:
         interact with the environment on its own.
         """
         scope = 'worker_agent_' + str(self.n_agent)
-        self.state_ph = tf.placeholder(dtype=tf.float32,
+        # Pixels are fed in uint8 (see Model)
+        state_dtype = tf.uint8 if hasattr(Settings, 'CONV_LAYERS') and Settings.CONV_LAYERS else tf.float32
+        self.state_ph = tf.placeholder(dtype=state_dtype,
                                        shape=[None, *Settings.STATE_SIZE],
                                        name='state_ph')
 
@@ -46,6 +65,9 @@ class Agent:
         self.policy = build_actor(self.state_ph, trainable=False, scope=scope)
         self.vars = get_vars(scope, trainable=False)
 
+        # Acting fast path bound once to the session
+        self.act_runner = ActRunner(self.sess, self.policy, self.state_ph)
+
     def build_update(self):
         """
         Build the operation to copy the weights of the learner's actor network
@@ -57,11 +79,37 @@ class Agent:
             self.update = copy_vars(self.network_vars, self.vars,
                                     1, 'update_agent_'+str(self.n_agent))
 
+    def update_weights(self):
+        """
+        Copy the weights of the learner's actor network in the agent's network,
+        or load the last weights exported if they are newer for the NumPy
+        policy (nothing to do with an ActorServer).
+        """
+        if self.numpy_policy is not None:
+            self.numpy_policy.refresh()
+        elif self.server is None:
+            self.sess.run(self.update)
+
     def predict_action(self, s):
         """
         Wrapper method to get the action outputted by the actor network.
         """
-        return self.sess.run(self.policy, feed_dict={self.state_ph: s[None]})[0]
+        if self.numpy_policy is not None:
+            return self.numpy_policy(s[None])[0]
+        if self.server is not None:
+            return self.server.predict(s)
+        return self.act_runner(s)
+
+    def predict_actions(self, states):
+        """
+        Wrapper method to get the actions outputted by the actor network for a
+        batch of states in a single forward pass.
+        """
+        if self.numpy_policy is not None:
+            return self.numpy_policy(states)
+        if self.server is not None:
+            return self.server.predict_batch(states)
+        return self.act_runner.run_batch(states)
 
     def run(self):
         """
@@ -69,25 +117,26 @@ class Agent:
         """
         print("Beginning of the run agent {}...".format(self.n_agent))
 
-        self.sess.run(self.update)
+        self.update_weights()
 
         self.total_steps = 0
         self.nb_ep = 1
 
+        if self.vector_env is not None:
+            self.run_vector()
+            return
+
         while self.nb_ep < Settings.TRAINING_EPS and not self.gui.STOP:
 
             s = self.env.reset()
             episode_reward = 0
             done = False
 
-            memory = deque()
+            self.writer.clear()
             episode_step = 1
-            # The more episodes the agent performs, the longer they are
-            max_step = Settings.MAX_EPISODE_STEPS
-            if Settings.EP_ELONGATION > 0:
-                max_step += self.nb_ep // Settings.EP_ELONGATION
+            max_step = self.max_episode_step()
 
-            noise_scale = Settings.NOISE_SCALE * Settings.NOISE_DECAY**(self.nb_ep//20)
+            noise_scale = self.noise_scale()
 
             # Render Settings
             self.env.set_render(self.gui.render.get(self.nb_ep))
@@ -106,31 +155,133 @@ class Agent:
                 s_, r, done, _ = self.env.act(a)
                 episode_reward += r
 
-                memory.append((s, a, r))
-
-                # Keep the experience in memory until 'N_STEP_RETURN' steps has
-                # passed to get the delayed return r_1 + ... + gamma^n r_n
-                if len(memory) >= Settings.N_STEP_RETURN:
-                    s_mem, a_mem, discount_r = memory.popleft()
-                    for i, (si, ai, ri) in enumerate(memory):
-                        discount_r += ri * Settings.DISCOUNT ** (i + 1)
-                    self.buffer.add((s_mem, a_mem, discount_r, s_, 1 if not done else 0))
+                # The writer keeps the experience until 'N_STEP_RETURN' steps
+                # have passed to get the delayed return r_1 + ... + gamma^n r_n
+                self.writer.add(s, a, r, s_, done)
 
                 s = s_
                 episode_step += 1
                 self.total_steps += 1
 
-            # Periodically update agents on the network
-            if self.nb_ep % Settings.UPDATE_ACTORS_FREQ == 0:
-                self.sess.run(self.update)
-
             if not self.gui.STOP:
-                if self.n_agent == 1 and self.gui.ep_reward.get(self.nb_ep):
-                    print("Episode %i : reward %i, steps %i, noise scale %f" % (self.nb_ep, episode_reward, episode_step, noise_scale))
-
-                plot = (self.n_agent == 1 and self.gui.plot.get(self.nb_ep))
-                self.displayer.add_reward(episode_reward, self.n_agent, plot=plot)
-            
-                self.nb_ep += 1
+                self.end_episode(episode_reward, episode_step, noise_scale)
 
         self.env.close()
+
+    def run_vector(self):
+        """
+        Method to run the agent in Settings.NB_ENVS environments stepped in
+        lockstep, with a single forward pass of the actor network per step.
+
+        With ASYNC_ENVS, the environments are split in two groups : one group
+        is simulated in the background while the actor network infers the
+        actions of the other one.
+        """
+        nb_envs = Settings.NB_ENVS
+        writer = NStepWriter(self.buffer, Settings.N_STEP_RETURN,
+                             Settings.DISCOUNT, nb_envs)
+        groups = np.array_split(np.arange(nb_envs), 2 if Settings.ASYNC_ENVS else 1)
+
+        s = np.array(self.vector_env.reset())
+        actions = np.zeros((nb_envs, Settings.ACTION_SIZE))
+        episode_rewards = np.zeros(nb_envs)
+        episode_steps = np.zeros(nb_envs, dtype=np.int64)
+        max_steps = np.full(nb_envs, self.max_episode_step())
+        noise_scales = np.full((nb_envs, 1), self.noise_scale())
+
+        # Render settings (only the first environment is displayed)
+        self.vector_env.set_render(self.gui.render.get(self.nb_ep))
+        self.vector_env.set_gif(self.gui.gif.get(self.nb_ep))
+
+        # Start stepping every group but the last one
+        for g in groups[:-1]:
+            actions[g] = self.explore(s[g], noise_scales[g])
+            self.vector_env.step_async(actions[g], g)
+
+        n_group = len(groups) - 1
+        while self.nb_ep < Settings.TRAINING_EPS and not self.gui.STOP:
+
+            # Infer the actions of the next group while the others simulate
+            g = groups[n_group]
+            actions[g] = self.explore(s[g], noise_scales[g])
+            self.vector_env.step_async(actions[g], g)
+
+            # Collect the oldest group
+            n_group = (n_group + 1) % len(groups)
+            g = groups[n_group]
+            s_, r, done, info = self.vector_env.step_wait()
+            episode_rewards[g] += r
+            episode_steps[g] += 1
+
+            # The finished environments are already reset : their experiences
+            # end on the terminal state given in info
+            next_states = np.stack([i.get('terminal_state', state)
+                                    for i, state in zip(info, s_)])
+            writer.add_batch(s[g], actions[g], r, next_states, done, g)
+            s[g] = s_
+            self.total_steps += len(g)
+
+            # Cut the episodes that reached their maximum number of steps
+            cut = g[~done & (episode_steps[g] >= max_steps[g])]
+            for e in cut:
+                writer.clear(e)
+            if len(cut) > 0:
+                s[cut] = self.vector_env.reset(cut)[cut]
+
+            for e in g[done | (episode_steps[g] >= max_steps[g])]:
+                if self.gui.STOP:
+                    break
+                self.end_episode(episode_rewards[e], episode_steps[e], noise_scales[e, 0])
+
+                episode_rewards[e] = 0
+                episode_steps[e] = 0
+                max_steps[e] = self.max_episode_step()
+                noise_scales[e] = self.noise_scale()
+
+                if e == 0:
+                    self.vector_env.set_render(self.gui.render.get(self.nb_ep))
+                    self.vector_env.set_gif(self.gui.gif.get(self.nb_ep))
+
+        self.vector_env.close()
+
+    def explore(self, states, noise_scales):
+        """
+        Return the actions of the actor network for a batch of states with
+        gaussian exploration noise.
+        """
+        actions = np.clip(self.predict_actions(states),
+                          Settings.LOW_BOUND, Settings.HIGH_BOUND)
+        noise = np.random.normal(size=actions.shape)
+        return actions + noise_scales * noise
+
+    def max_episode_step(self):
+        """
+        Return the maximum number of steps of the next episode : the more
+        episodes the agent performs, the longer they are.
+        """
+        max_step = Settings.MAX_EPISODE_STEPS
+        if Settings.EP_ELONGATION > 0:
+            max_step += self.nb_ep // Settings.EP_ELONGATION
+        return max_step
+
+    def noise_scale(self):
+        """
+        Return the scale of the exploration noise of the next episode.
+        """
+        return Settings.NOISE_SCALE * Settings.NOISE_DECAY**(self.nb_ep//20)
+
+    def end_episode(self, episode_reward, episode_step, noise_scale):
+        """
+        Update the actor network periodically and display the episode.
+        """
+        # Periodically update agents on the network
+        if self.nb_ep % Settings.UPDATE_ACTORS_FREQ == 0:
+            self.update_weights()
+
+        if self.n_agent == 1 and self.gui.ep_reward.get(self.nb_ep):
+            print("Episode %i : reward %i, steps %i, noise scale %f" % (self.nb_ep, episode_reward, episode_step, noise_scale))
+
+        plot = (self.n_agent == 1 and self.gui.plot.get(self.nb_ep))
+        self.displayer.add_reward(episode_reward, self.n_agent, plot=plot)
+
+        self.nb_ep += 1
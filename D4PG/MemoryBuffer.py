@@ -1,81 +1,102 @@
-
+import threading
 import tensorflow as tf
-import numpy as np
-import random
-from collections import deque
 
 from settings import Settings
 
 
 class MemoryBuffer:
+    """
+    Experience buffer stored inside the tensorflow graph as variables.
 
-    def __init__(self, sess, coord):
-        print("Initializing MemoryBuffer...")
-
-        self.sess = sess
-        self.coord = coord
-
-        self.buffer_s = np.empty([Settings.BUFFER_SIZE, *Settings.STATE_SIZE], dtype=np.float32)
-        self.buffer_a = np.empty([Settings.BUFFER_SIZE, Settings.ACTION_SIZE], dtype=np.float32)
-        self.buffer_r = np.empty([Settings.BUFFER_SIZE], dtype=np.float32)
-        self.buffer_s_ = np.empty([Settings.BUFFER_SIZE, *Settings.STATE_SIZE], dtype=np.float32)
-        self.buffer_d = np.empty([Settings.BUFFER_SIZE], dtype=np.float32)
-
-        self.index = 0
+    The actors append their experiences with scatter operations and the learner
+    samples its batches with a gather operation plugged directly into the
+    inputs of the critic and actor networks, so the transitions never go back
+    through python on the learner side.
 
-        shapes = (Settings.STATE_SIZE, Settings.ACTION_SIZE, (), Settings.STATE_SIZE, ())
+    The variables are local variables : they are not saved with the network
+    weights and must be initialized with tf.local_variables_initializer().
+    """
 
-        with self.sess.as_default(), self.sess.graph.as_default():
-            queue = tf.FIFOQueue(capacity=3*Settings.BATCH_SIZE,
-                                 dtypes=[tf.float32, tf.float32, tf.float32, tf.float32, tf.float32],
-                                 shapes=shapes)
+    def __init__(self, sess):
+        print("Initializing MemoryBuffer...")
 
-            idx = tf.random_uniform(dtype=tf.int32, minval=0, maxval=1000, shape=[Settings.BATCH_SIZE])
+        self.sess = sess
 
-            print(tf.gather(self.buffer_s, idx))
-            print(tf.gather(self.buffer_d, idx))
-            print(tf.concat([tf.gather(self.buffer_s, idx), tf.gather(self.buffer_d, idx)], axis=1))
-            get_data = tf.concat([tf.gather(b, idx) for b in (self.buffer_s, self.buffer_a, self.buffer_r, self.buffer_s_, self.buffer_d)], axis=1)
+        self.lock = threading.Lock()
+        self.nb_added = 0
 
+        # Pixels are kept in uint8 (and normalized by the networks)
+        state_dtype = tf.uint8 if hasattr(Settings, 'CONV_LAYERS') and Settings.CONV_LAYERS else tf.float32
 
-            # get_data = tf.py_func(self.get_batch, inp=[], Tout=[tf.float32, tf.float32, tf.float32, tf.float32, tf.float32])
+        fields = (('states', Settings.STATE_SIZE, state_dtype),
+                  ('actions', [Settings.ACTION_SIZE], tf.float32),
+                  ('rewards', [], tf.float32),
+                  ('next_states', Settings.STATE_SIZE, state_dtype),
+                  ('not_dones', [], tf.float32))
 
+        with self.sess.as_default(), self.sess.graph.as_default(), \
+                tf.variable_scope('memory_buffer'):
 
-            enqueue_op = queue.enqueue_many(get_data)
+            self.buffers = [tf.get_variable(name, [Settings.BUFFER_SIZE, *shape],
+                                            dtype=dtype,
+                                            initializer=tf.zeros_initializer(),
+                                            trainable=False,
+                                            collections=[tf.GraphKeys.LOCAL_VARIABLES])
+                            for name, shape, dtype in fields]
 
-            qr = tf.train.QueueRunner(queue, [enqueue_op] * 2)
-            tf.train.add_queue_runner(qr)
+            # Total number of experiences added
+            self.counter = tf.get_variable('counter', [], dtype=tf.int64,
+                                           initializer=tf.zeros_initializer(),
+                                           trainable=False,
+                                           collections=[tf.GraphKeys.LOCAL_VARIABLES])
 
-            self.dequeue = queue.dequeue_many(Settings.BATCH_SIZE)
-            self.size = queue.size()
+            self.build_add(fields)
+            self.build_sample()
 
         print("MemoryBuffer initialized !\n")
 
-    # def get_batch(self):
-    #     idx = random.sample(range(len(self.buffer)), min(Settings.BATCH_SIZE, len(self.buffer)))
-    #     # batch = random.sample(self.buffer, min(Settings.BATCH_SIZE, len(self.buffer)))
-
-    #     for i in idx:
-    #         self.idx[i] += 1
-
-    #     qs = np.asarray([self.buffer[i][0] for i in idx], dtype=np.float32)
-    #     qa = np.asarray([self.buffer[i][1] for i in idx], dtype=np.float32)
-    #     qr = np.asarray([self.buffer[i][2] for i in idx], dtype=np.float32)
-    #     qs_ = np.asarray([self.buffer[i][3] for i in idx], dtype=np.float32)
-    #     qdone = np.asarray([self.buffer[i][4] for i in idx], dtype=np.float32)
-
-    #     return [qs, qa, qr, qs_, qdone]
-
-    def add(self, s, a, r, s_, d):
-    	self.buffer_s[self.index] = s
-    	self.buffer_a[self.index] = a
-    	self.buffer_r[self.index] = r
-    	self.buffer_s_[self.index] = s_
-    	self.buffer_d[self.index] = d
-    	self.index = (self.index + 1) % Settings.BUFFER_SIZE
-
-        # n = len(self.buffer)
-        # if n % 1000 == 0:
-            # print("Buffer size : ", n)
-            # print("% seen : ", sum(self.idx[:n]) / n)
-            # print()
+    def build_add(self, fields):
+        """
+        Build the operation to append a batch of experiences fed through
+        placeholders at the next positions of the ring.
+        """
+        self.placeholders = [tf.placeholder(dtype, [None, *shape], name=name)
+                             for name, shape, dtype in fields]
+
+        nb_experiences = tf.shape(self.placeholders[2], out_type=tf.int64)[0]
+        end = tf.identity(tf.assign_add(self.counter, nb_experiences))
+        idx = tf.mod(tf.range(end - nb_experiences, end), Settings.BUFFER_SIZE)
+
+        self.add_op = tf.group(*[tf.scatter_update(buffer, idx, ph)
+                                 for buffer, ph in zip(self.buffers, self.placeholders)])
+
+    def build_sample(self):
+        """
+        Build the tensors (states, actions, rewards, next_states, not_dones) of
+        a batch sampled uniformly among the stored experiences.
+        """
+        size = tf.minimum(self.counter, Settings.BUFFER_SIZE)
+        idx = tf.random_uniform([Settings.BATCH_SIZE], maxval=size, dtype=tf.int64)
+
+        self.sample_batch = tuple(tf.gather(buffer, idx) for buffer in self.buffers)
+
+    def __len__(self):
+        return min(self.nb_added, Settings.BUFFER_SIZE)
+
+    def shard(self, n):
+        """
+        Every actor writes in the same graph buffer.
+        """
+        return self
+
+    def add(self, experience):
+        feed_dict = {ph: [value] for ph, value in zip(self.placeholders, experience)}
+
+        # The actors append one at a time so that they never reserve the same
+        # positions of the ring
+        with self.lock:
+            self.sess.run(self.add_op, feed_dict=feed_dict)
+            self.nb_added += 1
+
+    def sample(self, beta=None):
+        return self.sess.run(self.sample_batch)
@@ -6,6 +6,8 @@ import time
 from Model import build_actor, build_critic
 from network_utils import copy_vars, get_vars, l2_regularization
 
+from NumpyPolicy import PolicyExporter
+from FrozenPolicy import export_frozen_graph, STATE, ACTION
 from settings import Settings
 
 
@@ -30,12 +32,20 @@ class QNetwork:
         self.saver = saver
         self.buffer = buffer
 
-        # Batch placeholders
-        self.state_ph = tf.placeholder(dtype=tf.float32, shape=[None, *Settings.STATE_SIZE], name='state')
-        self.action_ph = tf.placeholder(dtype=tf.float32, shape=[None, Settings.ACTION_SIZE], name='action')
-        self.reward_ph = tf.placeholder(dtype=tf.float32, shape=[None], name='reward')
-        self.next_state_ph = tf.placeholder(dtype=tf.float32, shape=[None, *Settings.STATE_SIZE], name='next_state')
-        self.not_done_ph = tf.placeholder(dtype=tf.float32, shape=[None], name='not_done')
+        if Settings.GRAPH_BUFFER:
+            # Batches sampled inside the graph from the buffer variables
+            (self.state_ph, self.action_ph, self.reward_ph,
+             self.next_state_ph, self.not_done_ph) = self.buffer.sample_batch
+        else:
+            # Pixels are fed in uint8 (see Model)
+            state_dtype = tf.uint8 if hasattr(Settings, 'CONV_LAYERS') and Settings.CONV_LAYERS else tf.float32
+
+            # Batch placeholders
+            self.state_ph = tf.placeholder(dtype=state_dtype, shape=[None, *Settings.STATE_SIZE], name='state')
+            self.action_ph = tf.placeholder(dtype=tf.float32, shape=[None, Settings.ACTION_SIZE], name='action')
+            self.reward_ph = tf.placeholder(dtype=tf.float32, shape=[None], name='reward')
+            self.next_state_ph = tf.placeholder(dtype=state_dtype, shape=[None, *Settings.STATE_SIZE], name='next_state')
+            self.not_done_ph = tf.placeholder(dtype=tf.float32, shape=[None], name='not_done')
         
         # Turn these in column vector
         self.reward = tf.expand_dims(self.reward_ph, 1)
@@ -52,6 +62,17 @@ class QNetwork:
         self.build_update()
         self.build_train_operation()
 
+        # ActorServer shared by the agents, whose weights the learner updates
+        self.server = None
+
+        # Exporter of the actor weights for the agents acting with NumPy
+        self.exporter = None
+        if Settings.NUMPY_POLICY:
+            if hasattr(Settings, 'CONV_LAYERS') and Settings.CONV_LAYERS:
+                raise ValueError("QNetwork : NUMPY_POLICY only supports networks "
+                                 "without CONV_LAYERS")
+            self.exporter = PolicyExporter(self.sess, 'learner_actor')
+
         print("QNetwork created !\n")
 
     def build_model(self):
@@ -183,6 +204,21 @@ class QNetwork:
         actor_trainer = tf.train.AdamOptimizer(Settings.ACTOR_LEARNING_RATE)
         self.actor_train_op = actor_trainer.apply_gradients(zip(self.actor_grad, self.actor_vars))
 
+    def export_inference_graph(self, path):
+        """
+        Write at path a frozen inference graph state -> action computed by a
+        copy of the learner's actor network, to be loaded with FrozenPolicy.
+        """
+        if STATE not in [op.name for op in self.sess.graph.get_operations()]:
+            with tf.name_scope('inference'), \
+                    tf.variable_scope(tf.get_variable_scope(), reuse=True):
+                state_ph = tf.placeholder(self.state_ph.dtype, self.state_ph.shape,
+                                          name='state')
+                actions = build_actor(state_ph, trainable=True, scope='learner_actor')
+                tf.identity(actions, name='action')
+
+        export_frozen_graph(self.sess, [ACTION], path)
+
     def run(self):
         """
         Compute continuously gradient descents by sampling batches from the
@@ -199,23 +235,33 @@ class QNetwork:
 
             while not self.gui.STOP:
                 
-                if not self.buffer.buffer:
+                if len(self.buffer) == 0:
                     continue
 
-                batch = np.asarray(self.buffer.sample())
+                if Settings.GRAPH_BUFFER:
+                    self.sess.run([self.critic_train_op, self.actor_train_op])
+
+                else:
+                    batch = self.buffer.sample()
 
-                feed_dict = {self.state_ph: np.stack(batch[:, 0]),
-                             self.action_ph: np.stack(batch[:, 1]),
-                             self.reward_ph: batch[:, 2],
-                             self.next_state_ph: np.stack(batch[:, 3]),
-                             self.not_done_ph: batch[:, 4]}
+                    feed_dict = {self.state_ph: batch[0],
+                                 self.action_ph: batch[1],
+                                 self.reward_ph: batch[2],
+                                 self.next_state_ph: batch[3],
+                                 self.not_done_ph: batch[4]}
 
-                self.sess.run([self.critic_train_op, self.actor_train_op],
-                               feed_dict=feed_dict)
+                    self.sess.run([self.critic_train_op, self.actor_train_op],
+                                   feed_dict=feed_dict)
 
                 if self.total_eps % Settings.UPDATE_TARGET_FREQ == 0:
                     self.sess.run(self.target_update)
 
+                if self.exporter is not None and self.total_eps % Settings.POLICY_EXPORT_FREQ == 0:
+                    self.exporter.export()
+
+                if self.server is not None and self.total_eps % Settings.POLICY_EXPORT_FREQ == 0:
+                    self.sess.run(self.server.update)
+
                 if self.gui.save.get(self.total_eps):
                     self.saver.save(self.total_eps)
 
@@ -10,8 +10,11 @@ import tensorflow as tf
 import time
 
 from Agent import Agent
+from ActorServer import ActorServer
 from QNetwork import QNetwork
-from ExperienceBuffer import ExperienceBuffer
+from ShardedExperienceBuffer import ShardedExperienceBuffer
+from Prefetcher import PrefetchBuffer
+from MemoryBuffer import MemoryBuffer
 
 import GUI
 import Saver
@@ -55,22 +58,40 @@ if __name__ == '__main__':
 
         saver = Saver.Saver(sess)
         displayer = Displayer.Displayer()
-        buffer = ExperienceBuffer()
+        if Settings.GRAPH_BUFFER:
+            buffer = MemoryBuffer(sess)
+        else:
+            # One shard per actor
+            buffer = ShardedExperienceBuffer(Settings.NB_ACTORS)
 
         gui = GUI.Interface(['ep_reward', 'plot', 'render', 'gif', 'save'])
         gui_thread = threading.Thread(target=gui.run)
 
+        # with tf.device('/device:GPU:0'):
+        learner_buffer = buffer
+        if Settings.PREFETCH_BATCHES > 0 and not Settings.GRAPH_BUFFER:
+            learner_buffer = PrefetchBuffer(buffer, Settings.PREFETCH_BATCHES)
+        learner = QNetwork(sess, gui, saver, learner_buffer)
+
+        # The learner's actor network is built first so that the agents can
+        # copy its variables
+        server = None
+        if Settings.INFERENCE_BATCH > 0 and not Settings.NUMPY_POLICY:
+            server = ActorServer(sess)
+            learner.server = server
+
         threads = []
         for i in range(Settings.NB_ACTORS):
-            agent = Agent(sess, i, gui, displayer, buffer)
+            agent = Agent(sess, i, gui, displayer, buffer.shard(i), server,
+                          learner.exporter)
             threads.append(threading.Thread(target=agent.run))
-
-        # with tf.device('/device:GPU:0'):
-        learner = QNetwork(sess, gui, saver, buffer)
         threads.append(threading.Thread(target=learner.run))
 
         if not saver.load():
             sess.run(tf.global_variables_initializer())
+        sess.run(tf.local_variables_initializer())
+        if server is not None:
+            sess.run(server.update)
 
         gui_thread.start()
         for t in threads:
@@ -87,6 +108,8 @@ if __name__ == '__main__':
 
         for t in threads:
             t.join()
+        if server is not None:
+            server.stop()
 
 ################################################################################
 #                                    DEBUG                                     #
@@ -98,6 +121,8 @@ if __name__ == '__main__':
 ################################################################################
 
         saver.save(learner.total_eps)
+        if Settings.EXPORT_INFERENCE:
+            learner.export_inference_graph(Settings.MODEL_PATH + 'inference.pb')
         displayer.disp()
 
         gui_thread.join()
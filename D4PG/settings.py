@@ -18,6 +18,18 @@ class Settings:
     FRAME_SKIP        = 0
     EP_ELONGATION     = 10
 
+    # Number of environments stepped together by each actor, with one forward
+    # pass per step
+    NB_ENVS = 1
+    # Number of processes stepping them (0 to step them in the actor thread)
+    ENV_WORKERS = 0
+    # Simulate half of the environments while the actions of the other half
+    # are inferred
+    ASYNC_ENVS = False
+    # Number of post-reset snapshots the environments start their episodes
+    # from (0 to reset them normally)
+    RESET_POOL = 0
+
 
     ###########################################################################
     # Network settings
@@ -52,11 +64,36 @@ class Settings:
     BUFFER_SIZE = 100000
     BATCH_SIZE  = 64
 
+    # Number of minibatches assembled in advance by a background thread
+    # (0 to sample them in the training loop)
+    PREFETCH_BATCHES = 0
+
+    # Storage types of the replay fields overriding the defaults (uint8
+    # pixels, int8 discrete actions), e.g. {'vectors': 'float16'}
+    REPLAY_DTYPES = {}
+
     UPDATE_TARGET_FREQ = 1
     UPDATE_TARGET_RATE = 0.05
 
     UPDATE_ACTORS_FREQ = 1
 
+    # Make the agents act with a NumPy copy of the actor network (without
+    # convolution layers), whose weights are exported by the learner every
+    # POLICY_EXPORT_FREQ training steps
+    NUMPY_POLICY       = False
+    POLICY_EXPORT_FREQ = 100
+
+    # Maximum number of states in the batched forward passes of the actor
+    # network shared by every agent (0 to give each agent its own copy), and
+    # maximum time a pass waits for the states of the other agents. The
+    # learner updates the weights of this network every POLICY_EXPORT_FREQ
+    # training steps
+    INFERENCE_BATCH   = 0
+    INFERENCE_WAIT_US = 200
+
+    # Keep the experience buffer inside the tensorflow graph
+    GRAPH_BUFFER = False
+
 
     ###########################################################################
     # Exploration settings
@@ -84,6 +121,9 @@ class Settings:
     GIF_PATH     = 'results/gif/'
     MAX_NB_GIF   = 5
 
+    # Write a frozen inference graph (see FrozenPolicy) at the end of the run
+    EXPORT_INFERENCE = False
+
 
     ###########################################################################
 
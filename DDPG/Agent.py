@@ -5,6 +5,7 @@ import numpy as np
 from QNetwork import Network
 from ExperienceBuffer import ExperienceBuffer
 from Environment import Environment
+from VectorEnvironment import build_vector_env
 
 from settings import Settings
 
@@ -33,6 +34,9 @@ class Agent:
         self.saver = saver
 
         self.env = Environment()
+        self.vector_env = None
+        if Settings.NB_ENVS > 1:
+            self.vector_env = build_vector_env(Settings.NB_ENVS, self.env)
         self.network = Network(sess)
         self.buffer = ExperienceBuffer()
 
@@ -92,6 +96,10 @@ class Agent:
         self.total_steps = 0
         self.nb_ep = 1
 
+        if self.vector_env is not None:
+            self.run_vector()
+            return
+
         while self.nb_ep < Settings.TRAINING_EPS and not self.gui.STOP:
 
             s = self.env.reset()
@@ -99,16 +107,11 @@ class Agent:
             done = False
 
             episode_step = 1
-            # The more episodes the agent performs, the longer they are
-            max_step = Settings.MAX_EPISODE_STEPS
-            if Settings.EP_ELONGATION > 0:
-                max_step += self.nb_ep // Settings.EP_ELONGATION
+            max_step = self.max_episode_step()
 
             # Initialize exploration noise process
             noise_process = np.zeros(Settings.ACTION_SIZE)
-            noise_scale = (Settings.NOISE_SCALE_INIT *
-                           Settings.NOISE_DECAY**self.nb_ep) * \
-                (Settings.HIGH_BOUND - Settings.LOW_BOUND)
+            noise_scale = self.noise_scale()
 
             # Render settings
             self.env.set_render(self.gui.render.get(self.nb_ep))
@@ -131,30 +134,131 @@ class Agent:
                 self.buffer.add((s, a, r, s_, 1 if not done else 0))
 
                 if self.total_steps % Settings.TRAINING_FREQ == 0:
-                    batch = self.buffer.sample()
-                    self.network.train(np.asarray(batch))
-                    self.network.update_target()
+                    self.learn()
 
                 s = s_
                 episode_step += 1
                 self.total_steps += 1
 
-            self.displayer.add_reward(episode_reward, plot=self.gui.plot.get(self.nb_ep))
-            # if episode_reward > self.best_run:
-            #     self.save_best(episode_reward)
+            self.end_episode(episode_reward, episode_step, noise_scale)
 
-            # Episode display
-            if self.gui.ep_reward.get(self.nb_ep):
-                print('Episode %2i, Reward: %7.3f, Steps: %i, Final noise scale: %7.3f' %
-                      (self.nb_ep, episode_reward, episode_step, noise_scale))
+        self.env.close()
 
-            # Save the model
-            if self.gui.save.get(self.nb_ep):
-                self.saver.save(self.nb_ep)
+    def run_vector(self):
+        """
+        Method to run the agent in Settings.NB_ENVS environments stepped in
+        lockstep : the actions of every environment are chosen with a single
+        forward pass of the network. The training frequency is still counted
+        in environment steps.
+        """
+        nb_envs = Settings.NB_ENVS
 
-            self.nb_ep += 1
+        s = self.vector_env.reset()
+        episode_rewards = np.zeros(nb_envs)
+        episode_steps = np.zeros(nb_envs, dtype=np.int64)
+        max_steps = np.full(nb_envs, self.max_episode_step())
 
-        self.env.close()
+        # One exploration noise process per environment
+        noise_process = np.zeros((nb_envs, Settings.ACTION_SIZE))
+        noise_scale = np.full((nb_envs, 1), self.noise_scale())
+
+        # Render settings (only the first environment is displayed)
+        self.vector_env.set_render(self.gui.render.get(self.nb_ep))
+        self.vector_env.set_gif(self.gui.gif.get(self.nb_ep))
+
+        while self.nb_ep < Settings.TRAINING_EPS and not self.gui.STOP:
+
+            # Choose actions based on deterministic policy
+            a = self.network.act_batch(s)
+
+            # Add temporally-correlated exploration noise to actions
+            noise_process = Settings.EXPLO_THETA * \
+                (Settings.EXPLO_MU - noise_process) + \
+                Settings.EXPLO_SIGMA * np.random.randn(nb_envs, Settings.ACTION_SIZE)
+
+            a += noise_scale * noise_process
+            s_, r, done, info = self.vector_env.act(a)
+            episode_rewards += r
+            episode_steps += 1
+
+            # The finished environments are already reset : their experiences
+            # end on the terminal state given in info
+            for e in range(nb_envs):
+                next_state = info[e].get('terminal_state', s_[e])
+                self.buffer.add((s[e], a[e], r[e], next_state, 1 if not done[e] else 0))
+
+            # Train once every TRAINING_FREQ environment steps
+            nb_train = (self.total_steps + nb_envs) // Settings.TRAINING_FREQ - \
+                self.total_steps // Settings.TRAINING_FREQ
+            for _ in range(nb_train):
+                self.learn()
+            self.total_steps += nb_envs
+
+            # Cut the episodes that reached their maximum number of steps
+            cut = np.flatnonzero(~done & (episode_steps >= max_steps))
+            if len(cut) > 0:
+                s_ = self.vector_env.reset(cut)
+
+            for e in np.flatnonzero(done | (episode_steps >= max_steps)):
+                self.end_episode(episode_rewards[e], episode_steps[e], noise_scale[e, 0])
+
+                episode_rewards[e] = 0
+                episode_steps[e] = 0
+                max_steps[e] = self.max_episode_step()
+                noise_process[e] = 0
+                noise_scale[e] = self.noise_scale()
+
+                if e == 0:
+                    self.vector_env.set_render(self.gui.render.get(self.nb_ep))
+                    self.vector_env.set_gif(self.gui.gif.get(self.nb_ep))
+
+            s = s_
+
+        self.vector_env.close()
+
+    def max_episode_step(self):
+        """
+        Return the maximum number of steps of the next episode : the more
+        episodes the agent performs, the longer they are.
+        """
+        max_step = Settings.MAX_EPISODE_STEPS
+        if Settings.EP_ELONGATION > 0:
+            max_step += self.nb_ep // Settings.EP_ELONGATION
+        return max_step
+
+    def noise_scale(self):
+        """
+        Return the scale of the exploration noise of the next episode.
+        """
+        return (Settings.NOISE_SCALE_INIT * Settings.NOISE_DECAY**self.nb_ep) * \
+            (Settings.HIGH_BOUND - Settings.LOW_BOUND)
+
+    def learn(self):
+        """
+        Train the network on a minibatch and update the target network.
+        """
+        batch = self.buffer.sample()
+        self.network.train(batch)
+        self.network.update_target()
+
+    def end_episode(self, episode_reward, episode_step, noise_scale):
+        """
+        Display the episode and save the model at the end of an episode.
+        """
+        self.displayer.add_reward(episode_reward, plot=self.gui.plot.get(self.nb_ep))
+        # if episode_reward > self.best_run:
+        #     self.save_best(episode_reward)
+
+        # Episode display
+        if self.gui.ep_reward.get(self.nb_ep):
+            print('Episode %2i, Reward: %7.3f, Steps: %i, Final noise scale: %7.3f' %
+                  (self.nb_ep, episode_reward, episode_step, noise_scale))
+
+        # Save the model
+        if self.gui.save.get(self.nb_ep):
+            self.saver.save(self.nb_ep)
+
+        self.nb_ep += 1
 
     def play(self, number_run, name=None):
         """
@@ -194,3 +298,5 @@ class Agent:
 
     def stop(self):
         self.env.close()
+        if self.vector_env is not None:
+            self.vector_env.close()
@@ -1,6 +1,7 @@
 
 import tensorflow as tf
 
+from NumpyPolicy import dense, relu, sigmoid
 from settings import Settings
 
 
@@ -17,6 +18,10 @@ def build_actor(states, trainable, scope):
     """
     with tf.variable_scope(scope):
 
+        # Pixels are fed in uint8 and normalized inside the graph
+        if hasattr(Settings, 'CONV_LAYERS') and Settings.CONV_LAYERS:
+            states = tf.cast(states, tf.float32) / 255
+
         layer = states
 
         # Convolution layers
@@ -46,6 +51,23 @@ def build_actor(states, trainable, scope):
     return actions
 
 
+def numpy_actor(weights, states):
+    """
+    NumPy counterpart of build_actor (without convolution layers) computing
+    the actions of a batch of states from the weights of a NumpyPolicy.
+    """
+    layer = states
+
+    # Fully connected layers
+    for i, nb_neurons in enumerate(Settings.HIDDEN_ACTOR_LAYERS):
+        layer = dense(weights, 'dense_'+str(i), layer, relu)
+
+    actions_unscaled = dense(weights, 'dense_last', layer)
+    # Bound the actions to the valid range
+    valid_range = Settings.HIGH_BOUND - Settings.LOW_BOUND
+    return Settings.LOW_BOUND + sigmoid(actions_unscaled) * valid_range
+
+
 def build_critic(states, actions, trainable, reuse, scope):
     """
     Define a critic network that predicts the Q-value of a given state and a
@@ -65,6 +87,10 @@ def build_critic(states, actions, trainable, reuse, scope):
     """
     with tf.variable_scope(scope):
 
+        # Pixels are fed in uint8 and normalized inside the graph
+        if hasattr(Settings, 'CONV_LAYERS') and Settings.CONV_LAYERS:
+            states = tf.cast(states, tf.float32) / 255
+
         layer = tf.concat([states, actions], axis=1)
 
         # Convolution layers
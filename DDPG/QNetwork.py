@@ -2,8 +2,10 @@
 import tensorflow as tf
 import numpy as np
 
-from Model import build_actor, build_critic
-from network_utils import copy_vars, get_vars, l2_regularization
+from Model import build_actor, build_critic, numpy_actor
+from network_utils import copy_vars, get_vars, l2_regularization, ActRunner
+from NumpyPolicy import PolicyExporter, NumpyPolicy
+from FrozenPolicy import export_frozen_graph, STATE, ACTION
 from settings import Settings
 
 
@@ -29,11 +31,14 @@ class Network:
 
         self.sess = sess
 
+        # Pixels are fed in uint8 (see Model)
+        state_dtype = tf.uint8 if hasattr(Settings, 'CONV_LAYERS') and Settings.CONV_LAYERS else tf.float32
+
         # Batch placeholders
-        self.state_ph = tf.placeholder(dtype=tf.float32, shape=[None, *Settings.STATE_SIZE], name='state')
+        self.state_ph = tf.placeholder(dtype=state_dtype, shape=[None, *Settings.STATE_SIZE], name='state')
         self.action_ph = tf.placeholder(dtype=tf.float32, shape=[None, Settings.ACTION_SIZE], name='action')
         self.reward_ph = tf.placeholder(dtype=tf.float32, shape=[None], name='reward')
-        self.next_state_ph = tf.placeholder(dtype=tf.float32, shape=[None, *Settings.STATE_SIZE], name='next_state')
+        self.next_state_ph = tf.placeholder(dtype=state_dtype, shape=[None, *Settings.STATE_SIZE], name='next_state')
         self.not_done_ph = tf.placeholder(dtype=tf.float32, shape=[None], name='not_done')
         
         # Turn these in column vector
@@ -46,6 +51,19 @@ class Network:
         self.build_update()
         self.build_train_operation()
 
+        # Acting fast path bound once to the session
+        self.act_runner = ActRunner(self.sess, self.actions, self.state_ph)
+
+        # NumPy copy of the actor network acting without any session call
+        self.numpy_policy = None
+        if Settings.NUMPY_POLICY:
+            if hasattr(Settings, 'CONV_LAYERS') and Settings.CONV_LAYERS:
+                raise ValueError("Network : NUMPY_POLICY only supports networks "
+                                "without CONV_LAYERS")
+            self.exporter = PolicyExporter(self.sess, 'actor')
+            self.numpy_policy = NumpyPolicy(self.exporter, numpy_actor)
+        self.train_steps = 0
+
         print("QNetwork created !")
 
     def build_model(self):
@@ -158,20 +176,52 @@ class Network:
         """
         Wrapper method to compute the Q-value distribution given a single state.
         """
-        return self.sess.run(self.actions, feed_dict={self.state_ph: [state]})[0]
+        if self.numpy_policy is not None:
+            return self.numpy_policy(np.asarray(state)[None])[0]
+        return self.act_runner(state)
+
+    def act_batch(self, states):
+        """
+        Wrapper method to compute the outputs of act for a batch of states in
+        a single forward pass.
+        """
+        if self.numpy_policy is not None:
+            return self.numpy_policy(states)
+        return self.act_runner.run_batch(states)
     
+    def export_inference_graph(self, path):
+        """
+        Write at path a frozen inference graph state -> action computed by a
+        copy of the actor network, to be loaded with FrozenPolicy.
+        """
+        if STATE not in [op.name for op in self.sess.graph.get_operations()]:
+            with tf.name_scope('inference'), \
+                    tf.variable_scope(tf.get_variable_scope(), reuse=True):
+                state_ph = tf.placeholder(self.state_ph.dtype, self.state_ph.shape,
+                                          name='state')
+                actions = build_actor(state_ph, trainable=True, scope='actor')
+                tf.identity(actions, name='action')
+
+        export_frozen_graph(self.sess, [ACTION], path)
+
     def train(self, batch):
         """
         Wrapper method to train the network given a minibatch of experiences.
         """
-        if len(batch) == 1:
+        if len(batch[0]) == 1:
             return
 
-        feed_dict = {self.state_ph: np.stack(batch[:, 0]),
-                     self.action_ph: np.stack(batch[:, 1]),
-                     self.reward_ph: batch[:, 2],
-                     self.next_state_ph: np.stack(batch[:, 3]),
-                     self.not_done_ph: batch[:, 4]}
+        feed_dict = {self.state_ph: batch[0],
+                     self.action_ph: batch[1],
+                     self.reward_ph: batch[2],
+                     self.next_state_ph: batch[3],
+                     self.not_done_ph: batch[4]}
 
         self.sess.run([self.critic_train, self.actor_train],
                        feed_dict=feed_dict)
+
+        # Periodically export the weights to the NumPy policy
+        self.train_steps += 1
+        if self.numpy_policy is not None and self.train_steps % Settings.POLICY_EXPORT_FREQ == 0:
+            self.exporter.export()
+            self.numpy_policy.refresh()
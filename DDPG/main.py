@@ -40,6 +40,8 @@ if __name__ == '__main__':
         print("End of the run")
 
         saver.save(agent.total_steps)
+        if Settings.EXPORT_INFERENCE:
+            agent.network.export_inference_graph(Settings.MODEL_PATH + 'inference.pb')
         displayer.disp()
 
         gui_thread.join()
@@ -17,6 +17,14 @@ class Settings:
     FRAME_SKIP        = 0
     EP_ELONGATION     = 10
 
+    # Number of environments stepped together with one forward pass per step
+    NB_ENVS = 1
+    # Number of processes stepping them (0 to step them in the main process)
+    ENV_WORKERS = 0
+    # Number of post-reset snapshots the environments start their episodes
+    # from (0 to reset them normally)
+    RESET_POOL = 0
+
 
     ###########################################################################
     # Network settings
@@ -42,9 +50,18 @@ class Settings:
     BUFFER_SIZE = 100000
     BATCH_SIZE  = 1024
 
+    # Storage types of the replay fields overriding the defaults (uint8
+    # pixels, int8 discrete actions), e.g. {'vectors': 'float16'}
+    REPLAY_DTYPES = {}
+
     TRAINING_FREQ      = 1
     UPDATE_TARGET_RATE = 0.05
 
+    # Act with a NumPy copy of the network (without convolution layers),
+    # whose weights are exported every POLICY_EXPORT_FREQ training steps
+    NUMPY_POLICY       = False
+    POLICY_EXPORT_FREQ = 100
+
 
     ###########################################################################
     # Exploration settings
@@ -75,6 +92,9 @@ class Settings:
     GIF_PATH     = 'results/gif/'
     MAX_NB_GIF   = 5
 
+    # Write a frozen inference graph (see FrozenPolicy) at the end of the run
+    EXPORT_INFERENCE = False
+
 
     ###########################################################################
 
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from ale_python_interface import ALEInterface
+import cv2
+from concurrent.futures import ThreadPoolExecutor
+
+from Environment import Environment
+from FrameStack import FrameStack
+from SnapshotPool import SnapshotPool
+
+from settings import *
+
+
+class BatchEnvironment:
+    """
+    Batch of nb_games emulator instances of the game driven together, so that
+    a single worker can play many games and feed a batched policy.
+
+    The grayscale screens of every game are captured in one preallocated
+    (nb_games, SCREEN_HEIGHT, 160) buffer, then resized and cropped into a
+    batched uint8 FrameStack. The games are split into nb_threads chunks
+    stepped by a thread pool : the emulator (through ctypes) and OpenCV
+    release the GIL, so the chunks really run in parallel.
+
+    The screen processing and the emulator settings are those of Environment.
+    The states are left in uint8 (the network has to normalize them).
+    """
+
+    def __init__(self, nb_games, nb_threads=4, render=False):
+        """
+        Args:
+            nb_games  : the number of emulator instances
+            nb_threads: the number of threads stepping them
+            render    : whether to display the first game
+        """
+        self.nb_games = nb_games
+
+        self.ales = []
+        for i in range(nb_games):
+            ale = ALEInterface()
+            ale.setInt(b'random_seed', i)
+            ale.setFloat(b'repeat_action_probability', 0.0)
+            ale.setBool(b'color_averaging', True)
+            ale.setInt(b'frame_skip', Environment.FRAME_SKIP)
+            ale.setBool(b'display_screen', render and i == 0)
+            ale.loadROM(ENV.encode('ascii'))
+            self.ales.append(ale)
+
+        self._no_op_max = 7
+
+        self.screens = np.empty((nb_games, Environment.SCREEN_HEIGHT, 160),
+                                dtype=np.uint8)
+        self.frames = np.empty((nb_games, 84, 84), dtype=np.uint8)
+        self.frame_stack = FrameStack((84, 84), batch_size=nb_games)
+
+        self.rewards = np.zeros(nb_games)
+        self.dones = np.zeros(nb_games, dtype=bool)
+
+        self.executor = ThreadPoolExecutor(max_workers=nb_threads)
+        self.chunks = np.array_split(np.arange(nb_games), min(nb_threads, nb_games))
+
+        # Snapshots of the first game after a reset, shared by every game to
+        # start their episodes from (the games run the same ROM and settings)
+        self.reset_pool = None
+        if RESET_POOL > 0:
+            self.reset_pool = SnapshotPool(RESET_POOL, self.new_snapshot)
+
+    def set_render(self, render):
+        if not render:
+            self.ales[0].setBool(b'display_screen', render)
+
+    def capture(self, i):
+        """
+        Grab the screen of the game i and write its processed frame.
+        """
+        self.ales[i].getScreenGrayscale(self.screens[i])
+        screen = cv2.resize(self.screens[i], (84, Environment.RESIZE_HEIGHT))
+        self.frames[i] = screen[Environment.CROP_TOP:Environment.CROP_TOP + 84, :]
+
+    def new_snapshot(self):
+        self.new_episode(0)
+        return {'ale': self.ales[0].cloneState(),
+                'frame': self.frames[0].copy()}
+
+    def reset_game(self, i):
+        """
+        Start a new episode in the game i, from a snapshot of the pool if
+        there is one.
+        """
+        if self.reset_pool is None:
+            self.new_episode(i)
+        else:
+            snapshot = self.reset_pool.sample()
+            self.ales[i].restoreState(snapshot['ale'])
+            self.frames[i] = snapshot['frame']
+
+    def new_episode(self, i):
+        self.ales[i].reset_game()
+
+        # randomize initial state
+        if self._no_op_max > 0:
+            no_op = np.random.randint(0, self._no_op_max + 1)
+            for _ in range(no_op):
+                self.ales[i].act(0)
+
+        self.capture(i)
+
+    def run(self, function, games):
+        """
+        Apply function to each of the games, one chunk of games per thread.
+        """
+        chunks = [chunk[np.isin(chunk, games)] for chunk in self.chunks]
+        list(self.executor.map(lambda chunk: [function(i) for i in chunk],
+                               [chunk for chunk in chunks if len(chunk) > 0]))
+
+    def reset(self, games=None):
+        """
+        Reset the given games (every one of them by default) and return the
+        stacked states of all the games as a (nb_games, 84, 84, 4) uint8 array.
+        """
+        games = np.arange(self.nb_games) if games is None else np.asarray(games)
+        self.run(self.reset_game, games)
+        self.frame_stack.reset(self.frames[games], envs=games)
+        return self.frame_stack.get()
+
+    def process(self, actions):
+        """
+        Apply one action in every game. The games that are over are reset
+        at once, so the states returned for them are the first states of
+        their next episodes.
+
+        Returns:
+            The stacked states, the rewards and the terminal flags of all the
+            games.
+        """
+        def step(i):
+            self.rewards[i] = self.ales[i].act(Environment.ACTION_OFFSET + actions[i])
+            self.dones[i] = self.ales[i].game_over()
+            self.capture(i)
+
+        self.run(step, np.arange(self.nb_games))
+        self.frame_stack.push(self.frames)
+
+        done = np.flatnonzero(self.dones)
+        if len(done) > 0:
+            self.run(self.reset_game, done)
+            self.frame_stack.reset(self.frames[done], envs=done)
+
+        return self.frame_stack.get(), self.rewards.copy(), self.dones.copy()
+
+    def close(self):
+        self.ales[0].setBool(b'display_screen', False)
+        self.executor.shutdown()
@@ -1,5 +1,4 @@
 
-import os
 import gym
 import cv2
 import numpy as np
@@ -9,8 +8,7 @@ import game.wrapped_flappy_bird as game
 
 from parameters import ENV, FRAME_SKIP, FRAME_BUFFER_SIZE
 
-from PIL import Image
-import imageio
+from GifRecorder import GifRecorder
 
 
 def onehot(action):
@@ -24,11 +22,12 @@ class Environment:
     def __init__(self, worker_index=0):
 
         self.frame_buffer = deque(maxlen=FRAME_BUFFER_SIZE)
-        self.reset()
 
         self.render = False
-        self.images = []
-        self.tmp_name = 'tmp_{}.png'.format(worker_index)
+        self.env = game.GameState(1, False)
+        self.reset()
+
+        self.recorder = GifRecorder()
 
     def get_state_size(self):
         return (84, 84, FRAME_BUFFER_SIZE)
@@ -39,25 +38,24 @@ class Environment:
     def set_render(self, render):
         self.render = render
 
-    def _convert_process_buffer(self):
-        # Convert RGB images into grayscale images
-        state = map(lambda x: cv2.resize(cv2.cvtColor(x, cv2.COLOR_RGB2GRAY),
-                                         (84, 90)),
-                    self.frame_buffer)
-
-        # Cut the images to get a 84x84 image
-        state = map(lambda x: x[1:85, :, np.newaxis], state)
+    def _process(self, frame):
+        # Convert the RGB image into a grayscale image, cut to get a 84x84
+        # image (the headless frames are overwritten at the next step, so they
+        # are converted as soon as they are given)
+        frame = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY), (84, 90))
+        return frame[1:85, :, np.newaxis]
 
+    def _convert_process_buffer(self):
         # Concatenate the frames to get a single state
-        return np.concatenate(list(state), axis=2)
+        return np.concatenate(list(self.frame_buffer), axis=2)
 
     def reset(self):
-        self.env = game.GameState(1, False)
+        self.env.reset()
 
         # Reset the frame buffer with FRAME_BUFFER_SIZE frames
         for _ in range(FRAME_BUFFER_SIZE):
-            frame, r, done = self.env.frame_step(onehot(0))
-            self.frame_buffer.append(frame)
+            frame, r, done = self.env.frame_step(onehot(0), render=self.render)
+            self.frame_buffer.append(self._process(frame))
 
         return self._convert_process_buffer()
 
@@ -69,8 +67,8 @@ class Environment:
 
     def _act(self, action):
 
-        s, r, done = self.env.frame_step(onehot(action))
-        self.frame_buffer.append(s)
+        s, r, done = self.env.frame_step(onehot(action), render=self.render)
+        self.frame_buffer.append(self._process(s))
         return self._convert_process_buffer(), r, done, ""
 
     def _act_gif(self, action):
@@ -79,23 +77,19 @@ class Environment:
         i, done = 0, False
         while i < (FRAME_SKIP + 1) and not done:
 
-            s_, r_tmp, done = self.env.frame_step(onehot(action))
+            s_, r_tmp, done = self.env.frame_step(onehot(action), render=self.render)
             r += r_tmp
             i += 1
 
             # Save image
-            img = Image.fromarray(s_)
-            img.save(self.tmp_name)
-            self.images.append(imageio.imread(self.tmp_name))
+            self.recorder.add(s_)
 
-        self.frame_buffer.append(s_)
+        self.frame_buffer.append(self._process(s_))
         return self._convert_process_buffer(), r, done, ""
 
     def save_gif(self, path, i):
         path = path + "_{}.gif".format(i)
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        imageio.mimsave(path, self.images, duration=1)
-        self.images = []
+        self.recorder.save(path)
 
     def close(self):
-        pass
+        self.recorder.close()
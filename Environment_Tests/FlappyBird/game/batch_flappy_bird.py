@@ -0,0 +1,322 @@
+import numpy as np
+import pygame
+
+from game.wrapped_flappy_bird import (FPS, FPSCLOCK, SCREENWIDTH, SCREENHEIGHT,
+                                      PIPEGAPSIZE, BASEY, PLAYER_WIDTH,
+                                      PLAYER_HEIGHT, PIPE_WIDTH, PIPE_HEIGHT,
+                                      BACKGROUND_WIDTH, PLAYER_INDICES, IMAGES,
+                                      HITMASKS, SPRITES, get_screen, blit)
+
+# Same physics as GameState
+PIPE_VEL_X = -4
+PLAYER_MAX_VEL_Y = 10
+PLAYER_ACC_Y = 1
+PLAYER_FLAP_ACC = -9
+
+GAP_YS = np.array([20, 30, 40, 50, 60, 70, 80, 90]) + int(BASEY * 0.2)
+
+# There are never more than 3 pipes on the screen
+MAX_PIPES = 3
+
+
+def grayscale(pixels):
+    """
+    Convert RGB pixels into grayscale like cv2.COLOR_RGB2GRAY.
+    """
+    gray = pixels @ np.array([0.299, 0.587, 0.114])
+    return np.round(gray).astype(np.uint8)
+
+
+class BatchGameState:
+    """
+    Batch of nb_games Flappy Bird games advanced together with numpy.
+
+    The positions and velocities of the players are arrays of nb_games values
+    and the pipes of each game are kept in a fixed queue of MAX_PIPES slots,
+    so that a step of every game (moves, score, pixel-perfect collisions with
+    the hitmasks) is a few array operations instead of one GameState each.
+
+    The games are not reset when they are over : frame_step returns the
+    terminal flags and the over games must be reset (with reset) before
+    being stepped again. The states can then be read as vectors (get_states,
+    like GameState.get_state) or as low-resolution grayscale frames drawn
+    directly at the given resolution (rasterize).
+
+    Unlike GameState, the pipes of every game are drawn from the generator of
+    the batch, so the games (and the episodes of a game) have different pipes.
+    """
+
+    def __init__(self, nb_games, rand_seed=1, resolution=(90, 84)):
+        """
+        Args:
+            nb_games  : the number of games simulated
+            rand_seed : the seed of the pipe generator
+            resolution: the size (width, height) of the frames drawn by
+                        rasterize, indexed by [x][y] like pygame.surfarray
+        """
+        self.nb_games = nb_games
+        self.random = np.random.RandomState(rand_seed)
+
+        self.score = np.zeros(nb_games, dtype=np.int64)
+        self.loopIter = np.zeros(nb_games, dtype=np.int64)
+        self.playerIndex = np.zeros(nb_games, dtype=np.int64)
+        self.playerIter = np.zeros(nb_games, dtype=np.int64)
+        self.playerx = int(SCREENWIDTH * 0.2)
+        self.playery = np.zeros(nb_games)
+        self.playerVelY = np.zeros(nb_games)
+        self.basex = np.zeros(nb_games, dtype=np.int64)
+        self.baseShift = IMAGES['base'].get_width() - BACKGROUND_WIDTH
+
+        # Queue of pipes of each game : the pipes are shifted to the left
+        # when the first one goes out of the screen
+        self.pipex = np.zeros((nb_games, MAX_PIPES), dtype=np.int64)
+        self.pipeGapY = np.zeros((nb_games, MAX_PIPES), dtype=np.int64)
+        self.pipeValid = np.zeros((nb_games, MAX_PIPES), dtype=bool)
+
+        self.hitmasks = {'player': np.stack(HITMASKS['player']),
+                         'pipe': HITMASKS['pipe']}
+
+        self.set_resolution(resolution)
+        self.reset()
+
+    def set_resolution(self, resolution):
+        """
+        Prepare the grayscale sprites and the pixel centers sampled by
+        rasterize (nearest neighbour) for frames of the given resolution.
+        """
+        width, height = resolution
+        self.xs = ((np.arange(width) + 0.5) * SCREENWIDTH / width).astype(np.int64)
+        self.ys = ((np.arange(height) + 0.5) * SCREENHEIGHT / height).astype(np.int64)
+
+        self.background = grayscale(SPRITES['background'])[np.ix_(self.xs, self.ys)]
+        self.sprites = {
+            'base': (grayscale(SPRITES['base'][0]), SPRITES['base'][1]),
+            'pipe': [(grayscale(pixels), mask) for pixels, mask in SPRITES['pipe']],
+            'player': (np.stack([grayscale(pixels) for pixels, _ in SPRITES['player']]),
+                       np.stack([mask for _, mask in SPRITES['player']]))}
+
+        self.frames = np.empty((self.nb_games, width, height), dtype=np.uint8)
+
+    def reset(self, games=None):
+        """
+        Start new games for the given games (every one of them by default).
+        """
+        games = np.arange(self.nb_games) if games is None else np.asarray(games)
+
+        self.score[games] = self.loopIter[games] = 0
+        self.playerIndex[games] = self.playerIter[games] = 0
+        self.playery[games] = int((SCREENHEIGHT - PLAYER_HEIGHT) / 2)
+        self.playerVelY[games] = 0
+        self.basex[games] = 0
+
+        self.pipex[games] = [SCREENWIDTH, SCREENWIDTH + SCREENWIDTH // 2, 0]
+        self.pipeValid[games] = [True, True, False]
+        self.pipeGapY[games] = GAP_YS[self.random.randint(len(GAP_YS),
+                                                          size=(len(games), MAX_PIPES))]
+
+    def frame_step(self, flaps, games=None):
+        """
+        Advance the given games (every one of them by default) of one frame.
+
+        Args:
+            flaps: whether the player of each of these games flaps
+            games: the indices of the games to advance
+
+        Returns:
+            The rewards and the terminal flags of these games.
+        """
+        games = np.arange(self.nb_games) if games is None else np.asarray(games)
+        flaps = np.asarray(flaps, dtype=bool)
+
+        y, velY = self.playery[games], self.playerVelY[games]
+        pipex, valid = self.pipex[games], self.pipeValid[games]
+        rewards = np.full(len(games), 0.1)
+
+        # check for score
+        playerMidPos = self.playerx + PLAYER_WIDTH / 2
+        pipeMidPos = pipex + PIPE_WIDTH / 2
+        scored = np.any(valid & (pipeMidPos <= playerMidPos) &
+                        (playerMidPos < pipeMidPos + 4), axis=1)
+        self.score[games] += scored
+        rewards[scored] = 1
+
+        # playerIndex basex change
+        loopIter = self.loopIter[games]
+        change = games[(loopIter + 1) % 3 == 0]
+        self.playerIndex[change] = np.take(PLAYER_INDICES, self.playerIter[change] % len(PLAYER_INDICES))
+        self.playerIter[change] += 1
+        self.loopIter[games] = (loopIter + 1) % 30
+        self.basex[games] = -((-self.basex[games] + 100) % self.baseShift)
+
+        # player's movement (a flap sets the velocity without acceleration)
+        velY = np.where(flaps, PLAYER_FLAP_ACC,
+                        np.where(velY < PLAYER_MAX_VEL_Y, velY + PLAYER_ACC_Y, velY))
+        y = np.maximum(y + np.minimum(velY, BASEY - y - PLAYER_HEIGHT), 0)
+        self.playery[games], self.playerVelY[games] = y, velY
+
+        # move pipes to left
+        pipex = np.where(valid, pipex + PIPE_VEL_X, pipex)
+
+        # add new pipe when first pipe is about to touch left of screen
+        new = (0 < pipex[:, 0]) & (pipex[:, 0] < 5)
+        if np.any(new):
+            rows = np.flatnonzero(new)
+            slots = valid[rows].sum(axis=1)
+            pipex[rows, slots] = SCREENWIDTH + 10
+            valid[rows, slots] = True
+            self.pipeGapY[games[rows], slots] = GAP_YS[self.random.randint(len(GAP_YS),
+                                                                           size=len(rows))]
+
+        # remove first pipe if its out of the screen
+        out = pipex[:, 0] < -PIPE_WIDTH
+        if np.any(out):
+            rows = np.flatnonzero(out)
+            pipex[rows] = np.roll(pipex[rows], -1, axis=1)
+            valid[rows] = np.roll(valid[rows], -1, axis=1)
+            valid[rows, -1] = False
+            self.pipeGapY[games[rows]] = np.roll(self.pipeGapY[games[rows]], -1, axis=1)
+
+        self.pipex[games], self.pipeValid[games] = pipex, valid
+
+        terminals = self.check_crash(games)
+        rewards[terminals] = -1
+        return rewards, terminals
+
+    def check_crash(self, games):
+        """
+        Return whether the players of the given games collide with the
+        ground, the top of the screen or a pipe (pixel-perfect).
+        """
+        y = self.playery[games].astype(np.int64)
+        crash = (self.playery[games] + PLAYER_HEIGHT >= BASEY - 1) | (y == 0)
+
+        # Only the pipes whose rects overlap the player rect are tested
+        # pixel by pixel
+        pipex = self.pipex[games]
+        gapY = self.pipeGapY[games]
+        for j in range(MAX_PIPES):
+            for pipey, hitmask in ((gapY[:, j] - PIPE_HEIGHT, self.hitmasks['pipe'][0]),
+                                   (gapY[:, j] + PIPEGAPSIZE, self.hitmasks['pipe'][1])):
+                overlap = (self.pipeValid[games, j] &
+                           (pipex[:, j] < self.playerx + PLAYER_WIDTH) &
+                           (self.playerx < pipex[:, j] + PIPE_WIDTH) &
+                           (pipey < y + PLAYER_HEIGHT) & (y < pipey + PIPE_HEIGHT))
+                rows = np.flatnonzero(overlap & ~crash)
+                if len(rows) == 0:
+                    continue
+
+                # Pixels of the player rect relative to the pipe
+                relx = self.playerx + np.arange(PLAYER_WIDTH) - pipex[rows, j, None]
+                rely = y[rows, None] + np.arange(PLAYER_HEIGHT) - pipey[rows, None]
+                inside = (((relx >= 0) & (relx < PIPE_WIDTH))[:, :, None] &
+                          ((rely >= 0) & (rely < PIPE_HEIGHT))[:, None, :])
+                pipe = hitmask[np.clip(relx, 0, PIPE_WIDTH - 1)[:, :, None],
+                               np.clip(rely, 0, PIPE_HEIGHT - 1)[:, None, :]]
+                player = self.hitmasks['player'][self.playerIndex[games[rows]]]
+                crash[rows] = np.any(inside & pipe & player, axis=(1, 2))
+
+        return crash
+
+    def get_states(self):
+        """
+        Return the vector states of every game (see GameState.get_state) as
+        a (nb_games, 5) array.
+        """
+        # First pipe not passed yet
+        ahead = self.pipeValid & (self.pipex + PIPE_WIDTH >= self.playerx)
+        rows = np.arange(self.nb_games)
+        first = np.argmax(ahead, axis=1)
+
+        return np.stack([self.playery, self.playerVelY,
+                         self.pipex[rows, first] - self.playerx,
+                         self.pipeGapY[rows, first],
+                         self.pipeGapY[rows, first] + PIPEGAPSIZE], axis=1).astype(np.float32)
+
+    def _draw(self, frames, sprite, x, y, index=None):
+        """
+        Draw a sprite at the positions (x, y) (one per frame) in the
+        low-resolution frames. Only the pixel centers of the frames that can
+        fall in the sprite (a window of columns and rows starting at the
+        first center after (x, y)) are sampled.
+        """
+        pixels, mask = sprite
+        width, height = frames.shape[1:]
+        w, h = mask.shape[-2:]
+
+        nb_cols = min(int(np.ceil(w * width / SCREENWIDTH)) + 1, width)
+        nb_rows = min(int(np.ceil(h * height / SCREENHEIGHT)) + 1, height)
+        cols = np.searchsorted(self.xs, x)[:, None] + np.arange(nb_cols)
+        rows = np.searchsorted(self.ys, y)[:, None] + np.arange(nb_rows)
+        relx = self.xs[np.minimum(cols, width - 1)] - x[:, None]
+        rely = self.ys[np.minimum(rows, height - 1)] - y[:, None]
+
+        inside = (((cols < width) & (relx < w))[:, :, None] &
+                  ((rows < height) & (rely < h))[:, None, :])
+        relx = np.clip(relx, 0, w - 1)[:, :, None]
+        rely = np.clip(rely, 0, h - 1)[:, None, :]
+        if index is not None:
+            index = index[:, None, None]
+            pixels, mask = pixels[index, relx, rely], mask[index, relx, rely]
+        else:
+            pixels, mask = pixels[relx, rely], mask[relx, rely]
+
+        # Flat indices of the drawn pixels in the frames
+        inside &= mask
+        games = np.arange(len(x))[:, None, None]
+        flat = (games * width + cols[:, :, None]) * height + rows[:, None, :]
+        frames.reshape(-1)[flat[inside]] = pixels[inside]
+
+    def rasterize(self, games=None):
+        """
+        Draw the given games (every one of them by default) in grayscale at
+        the resolution of the batch and return their (len(games), width,
+        height) frames (overwritten by the next call for the whole batch).
+        """
+        if games is None:
+            games, frames = np.arange(self.nb_games), self.frames
+        else:
+            games = np.asarray(games)
+            frames = np.empty((len(games), *self.frames.shape[1:]), dtype=np.uint8)
+        frames[:] = self.background
+
+        for j in range(MAX_PIPES):
+            # The invalid pipes are drawn out of the screen
+            x = np.where(self.pipeValid[games, j], self.pipex[games, j], -SCREENWIDTH)
+            gapY = self.pipeGapY[games, j]
+            self._draw(frames, self.sprites['pipe'][0], x, gapY - PIPE_HEIGHT)
+            self._draw(frames, self.sprites['pipe'][1], x, gapY + PIPEGAPSIZE)
+
+        self._draw(frames, self.sprites['base'], self.basex[games],
+                   np.full(len(games), int(BASEY)))
+        self._draw(frames, self.sprites['player'],
+                   np.full(len(games), self.playerx),
+                   self.playery[games].astype(np.int64), self.playerIndex[games])
+
+        return frames
+
+    def draw(self, i):
+        """
+        Draw the game i in full resolution and colors (like GameState.rasterize).
+        """
+        frame = SPRITES['background'].copy()
+
+        for j in np.flatnonzero(self.pipeValid[i]):
+            blit(frame, SPRITES['pipe'][0], self.pipex[i, j], self.pipeGapY[i, j] - PIPE_HEIGHT)
+            blit(frame, SPRITES['pipe'][1], self.pipex[i, j], self.pipeGapY[i, j] + PIPEGAPSIZE)
+
+        blit(frame, SPRITES['base'], self.basex[i], BASEY)
+        blit(frame, SPRITES['player'][self.playerIndex[i]], self.playerx, self.playery[i])
+
+        return frame
+
+    def render(self, i=0):
+        """
+        Display the game i in the game window and return its frame.
+        """
+        pygame.event.pump()
+        frame = self.draw(i)
+
+        pygame.surfarray.blit_array(get_screen(), frame)
+        pygame.display.update()
+        FPSCLOCK.tick(FPS)
+        return frame
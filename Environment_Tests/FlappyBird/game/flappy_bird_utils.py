@@ -1,8 +1,13 @@
+import numpy as np
 import pygame
 import sys
 import os
 
 def load():
+    """
+    Load the sprites and their hitmasks. The sprites are not converted to the
+    display format since no display may exist (see convert).
+    """
     # path of player with different states
     PLAYER_PATH = (
             os.path.join('game', 'assets', 'sprites', 'redbird-upflap.png'),
@@ -20,20 +25,20 @@ def load():
 
     # numbers sprites for score display
     IMAGES['numbers'] = (
-        pygame.image.load(os.path.join('game', 'assets', 'sprites', '0.png')).convert_alpha(),
-        pygame.image.load(os.path.join('game', 'assets', 'sprites', '1.png')).convert_alpha(),
-        pygame.image.load(os.path.join('game', 'assets', 'sprites', '2.png')).convert_alpha(),
-        pygame.image.load(os.path.join('game', 'assets', 'sprites', '3.png')).convert_alpha(),
-        pygame.image.load(os.path.join('game', 'assets', 'sprites', '4.png')).convert_alpha(),
-        pygame.image.load(os.path.join('game', 'assets', 'sprites', '5.png')).convert_alpha(),
-        pygame.image.load(os.path.join('game', 'assets', 'sprites', '6.png')).convert_alpha(),
-        pygame.image.load(os.path.join('game', 'assets', 'sprites', '7.png')).convert_alpha(),
-        pygame.image.load(os.path.join('game', 'assets', 'sprites', '8.png')).convert_alpha(),
-        pygame.image.load(os.path.join('game', 'assets', 'sprites', '9.png')).convert_alpha()
+        pygame.image.load(os.path.join('game', 'assets', 'sprites', '0.png')),
+        pygame.image.load(os.path.join('game', 'assets', 'sprites', '1.png')),
+        pygame.image.load(os.path.join('game', 'assets', 'sprites', '2.png')),
+        pygame.image.load(os.path.join('game', 'assets', 'sprites', '3.png')),
+        pygame.image.load(os.path.join('game', 'assets', 'sprites', '4.png')),
+        pygame.image.load(os.path.join('game', 'assets', 'sprites', '5.png')),
+        pygame.image.load(os.path.join('game', 'assets', 'sprites', '6.png')),
+        pygame.image.load(os.path.join('game', 'assets', 'sprites', '7.png')),
+        pygame.image.load(os.path.join('game', 'assets', 'sprites', '8.png')),
+        pygame.image.load(os.path.join('game', 'assets', 'sprites', '9.png'))
     )
 
     # base (ground) sprite
-    IMAGES['base'] = pygame.image.load(os.path.join('game', 'assets', 'sprites', 'base.png')).convert_alpha()
+    IMAGES['base'] = pygame.image.load(os.path.join('game', 'assets', 'sprites', 'base.png'))
 
     """
     # sounds
@@ -50,20 +55,20 @@ def load():
     """
 
     # select random background sprites
-    IMAGES['background'] = pygame.image.load(BACKGROUND_PATH).convert()
+    IMAGES['background'] = pygame.image.load(BACKGROUND_PATH)
 
     # select random player sprites
     IMAGES['player'] = (
-        pygame.image.load(PLAYER_PATH[0]).convert_alpha(),
-        pygame.image.load(PLAYER_PATH[1]).convert_alpha(),
-        pygame.image.load(PLAYER_PATH[2]).convert_alpha(),
+        pygame.image.load(PLAYER_PATH[0]),
+        pygame.image.load(PLAYER_PATH[1]),
+        pygame.image.load(PLAYER_PATH[2]),
     )
 
     # select random pipe sprites
     IMAGES['pipe'] = (
         pygame.transform.rotate(
-            pygame.image.load(PIPE_PATH).convert_alpha(), 180),
-        pygame.image.load(PIPE_PATH).convert_alpha(),
+            pygame.image.load(PIPE_PATH), 180),
+        pygame.image.load(PIPE_PATH),
     )
 
     # hismask for pipes
@@ -81,11 +86,26 @@ def load():
 
     return IMAGES, SOUNDS, HITMASKS
 
+def convert(IMAGES):
+    """
+    Convert the sprites to the format of the display once it exists, to make
+    their blitting faster.
+    """
+    for name, images in IMAGES.items():
+        if isinstance(images, tuple):
+            IMAGES[name] = tuple(image.convert_alpha() for image in images)
+        elif name == 'background':
+            IMAGES[name] = images.convert()
+        else:
+            IMAGES[name] = images.convert_alpha()
+
 def getHitmask(image):
-    """returns a hitmask using an image's alpha."""
-    mask = []
-    for x in range(image.get_width()):
-        mask.append([])
-        for y in range(image.get_height()):
-            mask[x].append(bool(image.get_at((x,y))[3]))
-    return mask
+    """returns a hitmask (indexed by [x][y]) using an image's alpha."""
+    return pygame.surfarray.array_alpha(image) > 0
+
+def getSprite(image):
+    """
+    Return the pixels (indexed by [x][y]) of a sprite and the mask of its
+    opaque pixels, to draw it in a numpy frame.
+    """
+    return pygame.surfarray.array3d(image), getHitmask(image)
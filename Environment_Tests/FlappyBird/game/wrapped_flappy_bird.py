@@ -4,7 +4,6 @@ import pygame
 import game.flappy_bird_utils as flappy_bird_utils
 import pygame.surfarray as surfarray
 from pygame.locals import *
-from itertools import cycle
 
 FPS = 30
 SCREENWIDTH  = 288
@@ -12,8 +11,10 @@ SCREENHEIGHT = 512
 
 pygame.init()
 FPSCLOCK = pygame.time.Clock()
-SCREEN = pygame.display.set_mode((SCREENWIDTH, SCREENHEIGHT))
-pygame.display.set_caption('Flappy Bird')
+
+# The window is only opened when a game is rendered (see get_screen), so that
+# the game can run on a headless server
+SCREEN = None
 
 IMAGES, SOUNDS, HITMASKS = flappy_bird_utils.load()
 PIPEGAPSIZE = 100 # gap between upper and lower part of pipe
@@ -25,22 +26,72 @@ PIPE_WIDTH = IMAGES['pipe'][0].get_width()
 PIPE_HEIGHT = IMAGES['pipe'][0].get_height()
 BACKGROUND_WIDTH = IMAGES['background'].get_width()
 
-PLAYER_INDEX_GEN = cycle([0, 1, 2, 1])
+# Sequence of the player sprites (wing animation)
+PLAYER_INDICES = [0, 1, 2, 1]
+
+# Attributes of a game that change during the game, besides the pipes and the
+# pipe generator (see GameState.snapshot)
+SNAPSHOT_FIELDS = ('playerIter', 'score', 'playerIndex', 'loopIter', 'playery',
+                   'basex', 'playerVelY', 'playerFlapped')
+
+# Pixels and opaque masks of the sprites to draw the frames with numpy
+SPRITES = {'background': pygame.surfarray.array3d(IMAGES['background']),
+           'base': flappy_bird_utils.getSprite(IMAGES['base']),
+           'player': [flappy_bird_utils.getSprite(image) for image in IMAGES['player']],
+           'pipe': [flappy_bird_utils.getSprite(image) for image in IMAGES['pipe']]}
+
+
+def get_screen():
+    """
+    Open the game window at the first call and return its surface.
+    """
+    global SCREEN
+    if SCREEN is None:
+        SCREEN = pygame.display.set_mode((SCREENWIDTH, SCREENHEIGHT))
+        pygame.display.set_caption('Flappy Bird')
+        flappy_bird_utils.convert(IMAGES)
+    return SCREEN
 
 
 class GameState:
+    """
+    State of a Flappy Bird game.
+
+    frame_step only draws what is needed : the game is blitted on the window
+    when it is rendered, rasterized with numpy in a preallocated frame when
+    pixels are requested without rendering, and not drawn at all otherwise.
+    Without pixels, a vector state is returned instead of the frame (see
+    get_state), whether the game is rendered or not.
+    """
+
     def __init__(self, rand_seed, show_score=False):
         self.rand_seed = rand_seed
-        random.seed(rand_seed)
         self.show_score = show_score
+
+        # Each game draws its pipes with its own generator instead of
+        # reseeding the global one at every reset
+        self.random = random.Random()
+
+        # Frame (indexed by [x][y] like pygame.surfarray) drawn by rasterize
+        self.frame = np.empty((SCREENWIDTH, SCREENHEIGHT, 3), dtype=np.uint8)
+
+        self.reset()
+
+    def reset(self, seed=None):
+        """
+        Start a new game (with the same pipes as every game of this seed, by
+        default the seed of the game).
+        """
+        self.random.seed(self.rand_seed if seed is None else seed)
+        self.playerIter = 0
         self.score = self.playerIndex = self.loopIter = 0
         self.playerx = int(SCREENWIDTH * 0.2)
         self.playery = int((SCREENHEIGHT - PLAYER_HEIGHT) / 2)
         self.basex = 0
         self.baseShift = IMAGES['base'].get_width() - BACKGROUND_WIDTH
 
-        newPipe1 = getRandomPipe()
-        newPipe2 = getRandomPipe()
+        newPipe1 = getRandomPipe(self.random)
+        newPipe2 = getRandomPipe(self.random)
         self.upperPipes = [
             {'x': SCREENWIDTH, 'y': newPipe1[0]['y']},
             {'x': SCREENWIDTH + (SCREENWIDTH / 2), 'y': newPipe2[0]['y']},
@@ -59,8 +110,69 @@ class GameState:
         self.playerFlapAcc =  -9   # players speed on flapping
         self.playerFlapped = False # True when player flaps
 
-    def frame_step(self, input_actions):
-        pygame.event.pump()
+    def snapshot(self):
+        """
+        Return a copy of the state of the game, to be restored with restore.
+        Only the attributes that change during a game are copied (the others
+        are the same constants in every game).
+        """
+        return ({name: getattr(self, name) for name in SNAPSHOT_FIELDS},
+                [dict(pipe) for pipe in self.upperPipes],
+                [dict(pipe) for pipe in self.lowerPipes],
+                self.random.getstate())
+
+    def restore(self, snapshot):
+        fields, upperPipes, lowerPipes, random_state = snapshot
+        self.__dict__.update(fields)
+        self.upperPipes = [dict(pipe) for pipe in upperPipes]
+        self.lowerPipes = [dict(pipe) for pipe in lowerPipes]
+        self.random.setstate(random_state)
+
+    def get_state(self):
+        """
+        Return a vector state : the height and the vertical velocity of the
+        player, and the horizontal distance to the next pipe with the heights
+        of the bottom of its upper part and of the top of its lower part.
+        """
+        for uPipe, lPipe in zip(self.upperPipes, self.lowerPipes):
+            if uPipe['x'] + PIPE_WIDTH >= self.playerx:
+                break
+        return np.array([self.playery, self.playerVelY,
+                         uPipe['x'] - self.playerx,
+                         uPipe['y'] + PIPE_HEIGHT, lPipe['y']], dtype=np.float32)
+
+    def rasterize(self):
+        """
+        Draw the game in self.frame with numpy (without any pygame surface)
+        and return it. The same buffer is returned (and overwritten) at every
+        call, so it must be copied to be kept.
+        """
+        self.frame[:] = SPRITES['background']
+
+        for uPipe, lPipe in zip(self.upperPipes, self.lowerPipes):
+            blit(self.frame, SPRITES['pipe'][0], uPipe['x'], uPipe['y'])
+            blit(self.frame, SPRITES['pipe'][1], lPipe['x'], lPipe['y'])
+
+        blit(self.frame, SPRITES['base'], self.basex, BASEY)
+        blit(self.frame, SPRITES['player'][self.playerIndex],
+             self.playerx, self.playery)
+
+        return self.frame
+
+    def frame_step(self, input_actions, render=True, pixels=True):
+        """
+        Apply an action and return the next frame (or the vector state if
+        pixels is False, even when the game is rendered), the reward and
+        whether the game is over (the game is then reset). Without render,
+        the frame is the buffer of rasterize, overwritten at the next step.
+
+        Args:
+            input_actions: [1, 0] to do nothing, [0, 1] to flap
+            render       : whether to display the game in a window
+            pixels       : whether the frame is needed
+        """
+        if render:
+            pygame.event.pump()
 
         reward = 0.1
         terminal = False
@@ -87,7 +199,8 @@ class GameState:
 
         # playerIndex basex change
         if (self.loopIter + 1) % 3 == 0:
-            self.playerIndex = next(PLAYER_INDEX_GEN)
+            self.playerIndex = PLAYER_INDICES[self.playerIter % len(PLAYER_INDICES)]
+            self.playerIter += 1
         self.loopIter = (self.loopIter + 1) % 30
         self.basex = -((-self.basex + 100) % self.baseShift)
 
@@ -107,7 +220,7 @@ class GameState:
 
         # add new pipe when first pipe is about to touch left of screen
         if 0 < self.upperPipes[0]['x'] < 5:
-            newPipe = getRandomPipe()
+            newPipe = getRandomPipe(self.random)
             self.upperPipes.append(newPipe[0])
             self.lowerPipes.append(newPipe[1])
 
@@ -124,10 +237,16 @@ class GameState:
             #SOUNDS['hit'].play()
             #SOUNDS['die'].play()
             terminal = True
-            self.__init__(self.rand_seed)
+            self.reset()
             reward = -1
 
+        if not render:
+            if pixels:
+                return self.rasterize(), reward, terminal
+            return self.get_state(), reward, terminal
+
         # draw sprites
+        SCREEN = get_screen()
         SCREEN.blit(IMAGES['background'], (0,0))
 
         for uPipe, lPipe in zip(self.upperPipes, self.lowerPipes):
@@ -139,7 +258,9 @@ class GameState:
         SCREEN.blit(IMAGES['player'][self.playerIndex],
                     (self.playerx, self.playery))
 
-        image_data = pygame.surfarray.array3d(pygame.display.get_surface())
+        image_data = None
+        if pixels:
+            image_data = pygame.surfarray.array3d(pygame.display.get_surface())
 
         if self.show_score:
             showScore(self.score)
@@ -151,13 +272,15 @@ class GameState:
 
         FPSCLOCK.tick(FPS)
         #print self.upperPipes[0]['y'] + PIPE_HEIGHT - int(BASEY * 0.2)
+        if not pixels:
+            return self.get_state(), reward, terminal
         return image_data, reward, terminal
 
-def getRandomPipe():
+def getRandomPipe(generator=random):
     """returns a randomly generated pipe"""
     # y of gap between upper and lower pipe
     gapYs = [20, 30, 40, 50, 60, 70, 80, 90]
-    index = random.randint(0, len(gapYs)-1)
+    index = generator.randint(0, len(gapYs)-1)
     gapY = gapYs[index]
 
     gapY += int(BASEY * 0.2)
@@ -169,6 +292,23 @@ def getRandomPipe():
     ]
 
 
+def blit(frame, sprite, x, y):
+    """
+    Draw the opaque pixels of a sprite at (x, y) in a numpy frame, clipped to
+    the frame like a pygame blit.
+    """
+    pixels, mask = sprite
+    x, y = int(x), int(y)
+    x0, y0 = max(x, 0), max(y, 0)
+    x1 = min(x + mask.shape[0], frame.shape[0])
+    y1 = min(y + mask.shape[1], frame.shape[1])
+    if x0 >= x1 or y0 >= y1:
+        return
+
+    np.copyto(frame[x0:x1, y0:y1], pixels[x0-x:x1-x, y0-y:y1-y],
+              where=mask[x0-x:x1-x, y0-y:y1-y, None])
+
+
 def showScore(score):
     """displays score in center of screen"""
     scoreDigits = [int(x) for x in list(str(score))]
@@ -180,7 +320,7 @@ def showScore(score):
     Xoffset = (SCREENWIDTH - totalWidth) / 2
 
     for digit in scoreDigits:
-        SCREEN.blit(IMAGES['numbers'][digit], (Xoffset, SCREENHEIGHT * 0.1))
+        get_screen().blit(IMAGES['numbers'][digit], (Xoffset, SCREENHEIGHT * 0.1))
         Xoffset += IMAGES['numbers'][digit].get_width()
 
 
@@ -228,8 +368,6 @@ def pixelCollision(rect1, rect2, hitmask1, hitmask2):
     x1, y1 = rect.x - rect1.x, rect.y - rect1.y
     x2, y2 = rect.x - rect2.x, rect.y - rect2.y
 
-    for x in range(rect.width):
-        for y in range(rect.height):
-            if hitmask1[x1+x][y1+y] and hitmask2[x2+x][y2+y]:
-                return True
-    return False
+    # Compare the overlapping parts of the hitmasks at once
+    return np.any(hitmask1[x1:x1+rect.width, y1:y1+rect.height] &
+                  hitmask2[x2:x2+rect.width, y2:y2+rect.height])
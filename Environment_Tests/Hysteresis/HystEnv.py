@@ -1,94 +1,179 @@
 
-import tkinter
-import random
+import numpy as np
 import graph
 
 
 # RANDOM_STALL = 1/2500
 
-window = tkinter.Tk()
-canvas = tkinter.Canvas(window, width=300, height=100, bg='white')
-
-background = [canvas.create_rectangle(0, 0, 200, 100, fill='green'),
-              canvas.create_rectangle(200, 0, 300, 100, fill='red')]
-
-pos = random.randint(50, 150)
-cursor = canvas.create_rectangle(pos - 2, 0, pos + 2, 100, fill='black')
-
-manual_stalling = False
-
 SIGMA = 20
 
-canvas.grid()
+# The tkinter window is only created when an environment is rendered (see
+# get_renderer), so that the environments can run without display
+RENDERER = None
 
 
-class HystEnv:
-    """Class that simulate a very simple environment with an hysteresis"""
+class Renderer:
+    """Tkinter window displaying the cursor and the stall limit of an environment"""
 
     def __init__(self):
-        self.nb_step = 0
+        import tkinter
+
+        self.window = tkinter.Tk()
+        self.canvas = tkinter.Canvas(self.window, width=300, height=100, bg='white')
+
+        self.background = [self.canvas.create_rectangle(0, 0, 200, 100, fill='green'),
+                           self.canvas.create_rectangle(200, 0, 300, 100, fill='red')]
+        self.cursor = self.canvas.create_rectangle(98, 0, 102, 100, fill='black')
+
+        self.canvas.grid()
+
+        # Set with Ctrl-J to stall the displayed environment
+        self.manual_stalling = False
+        self.window.bind('<Control-j>', self.manual_stall)
+
+    def manual_stall(self, event):
+        self.manual_stalling = True
+
+    def draw(self, pos, stall_limit, change):
+        self.canvas.coords(self.cursor, (pos - 2, 0, pos + 2, 100))
+        if change:
+            self.canvas.coords(self.background[0], (0, 0, stall_limit, 100))
+            self.canvas.coords(self.background[1], (stall_limit, 0, 300, 100))
+
+        self.window.update()
+
+
+def get_renderer():
+    global RENDERER
+    if RENDERER is None:
+        RENDERER = Renderer()
+    return RENDERER
+
+
+class BatchHystEnv:
+    """
+    Batch of nb_envs environments with an hysteresis simulated together with
+    numpy : the positions, speeds and stall states are arrays of nb_envs
+    values, so that large parameter studies can run on a server.
+
+    Nothing is displayed unless render is called (one environment at a time)
+    and the steps are only recorded if a recorder (see graph.Recorder) is
+    given.
+    """
+
+    def __init__(self, nb_envs=1, recorder=None, seed=None):
+        """
+        Args:
+            nb_envs : the number of environments
+            recorder: the graph.Recorder in which the steps are written
+            seed    : the seed of the random stall limits and initial
+                        positions
+        """
+        self.nb_envs = nb_envs
+        self.recorder = recorder
+        self.random = np.random.RandomState(seed)
+
+        self.nb_step = np.zeros(nb_envs, dtype=np.int64)
+        self.pos = np.zeros(nb_envs, dtype=np.int64)
+        self.speed = np.zeros(nb_envs, dtype=np.int64)
+        self.stalled = np.zeros(nb_envs, dtype=bool)
+        self.stall_limit = np.zeros(nb_envs)
+
+        # Environment displayed by render and whether its stall limit changed
+        self.rendered = 0
+        self.render_change = True
 
-    def reset(self):
-        global pos
+    def new_stall_limit(self, n):
+        return 200 + self.random.normal(0, SIGMA, n) // 2
 
-        self.speed = 0
-        self.stalled = False
-        self.render_change = True
-        self.stall_limit = 200 + random.normalvariate(0, SIGMA) // 2
+    def get_states(self):
+        return np.stack([self.pos, self.speed], axis=1)
 
-        pos = random.randint(50, 150)
-        return [pos, self.speed]
+    def reset(self, envs=None):
+        """
+        Reset the given environments (every one of them by default) and
+        return the states of all of them.
+        """
+        envs = np.arange(self.nb_envs) if envs is None else np.asarray(envs)
 
-    def step(self, action):
-        global pos, manual_stalling
+        self.speed[envs] = 0
+        self.stalled[envs] = False
+        self.stall_limit[envs] = self.new_stall_limit(len(envs))
+        self.render_change = True
 
-        if action == 0:
-            pos = max(pos - 1, 0)
-        elif action == 2:
-            pos = min(pos + 1, 300)
+        self.pos[envs] = self.random.randint(50, 151, size=len(envs))
+        return self.get_states()
 
-        canvas.coords(cursor, (pos - 2, 0, pos + 2, 100))
+    def step(self, actions):
+        """
+        Apply one action (0: left, 1: stay, 2: right) in each environment.
 
-        if self.stalled and pos < 100:
-            self.stalled = False
-            self.stall_limit = 200 + random.normalvariate(0, SIGMA) // 2
-            self.render_change = True
+        Returns:
+            The states, rewards and dones of all the environments.
+        """
+        actions = np.asarray(actions)
+        self.pos = np.where(actions == 0, np.maximum(self.pos - 1, 0), self.pos)
+        self.pos = np.where(actions == 2, np.minimum(self.pos + 1, 300), self.pos)
 
-        if (not self.stalled and pos > self.stall_limit) or manual_stalling:
-            manual_stalling = False
-            self.stalled = True
-            self.stall_limit = 100
-            self.render_change = True
+        unstall = self.stalled & (self.pos < 100)
+        self.stalled[unstall] = False
+        self.stall_limit[unstall] = self.new_stall_limit(np.count_nonzero(unstall))
+
+        stall = ~self.stalled & (self.pos > self.stall_limit)
+        if RENDERER is not None and RENDERER.manual_stalling:
+            RENDERER.manual_stalling = False
+            stall[self.rendered] = True
+        self.stalled[stall] = True
+        self.stall_limit[stall] = 100
 
         self.nb_step += 1
 
-        if not self.stalled and self.nb_step % 20 == 0:
-            self.stall_limit = 200 + random.normalvariate(0, SIGMA) // 2
+        change = ~self.stalled & (self.nb_step % 20 == 0)
+        self.stall_limit[change] = self.new_stall_limit(np.count_nonzero(change))
+
+        if (unstall | stall | change)[self.rendered]:
             self.render_change = True
 
-        if not self.stalled:
-            max_speed = max(50, 2 * pos)
-            self.speed = min(max_speed, (self.speed + max_speed) // 2)
+        max_speed = np.maximum(50, 2 * self.pos)
+        self.speed = np.where(self.stalled, (3 * self.speed + 50) // 4,
+                              np.minimum(max_speed, (self.speed + max_speed) // 2))
 
-        else:
-            self.speed = (3 * self.speed + 50) // 4
+        if self.recorder is not None:
+            self.recorder.add(self.pos, self.speed / 2, self.stall_limit)
 
-        graph.add(pos, self.speed / 2, self.stall_limit)
-        return [pos, self.speed], self.speed / 400, False, None
+        return self.get_states(), self.speed / 400, np.zeros(self.nb_envs, dtype=bool)
 
-    def render(self):
-        if self.render_change:
-            canvas.coords(background[0], (0, 0, self.stall_limit, 100))
-            canvas.coords(background[1], (self.stall_limit, 0, 300, 100))
-            self.render_change = False
+    def render(self, env=0):
+        """
+        Display the environment env (the window is created at the first call).
+        """
+        if env != self.rendered:
+            self.rendered = env
+            self.render_change = True
 
-        window.update()
+        get_renderer().draw(self.pos[env], self.stall_limit[env], self.render_change)
+        self.render_change = False
 
     def close(self):
         pass
 
-def manual_stall(event):
-    global manual_stalling
-    manual_stalling = True
 
-window.bind('<Control-j>', manual_stall)
+class HystEnv:
+    """Class that simulate a very simple environment with an hysteresis"""
+
+    def __init__(self):
+        # The steps are recorded in the graph module to be plotted
+        self.env = BatchHystEnv(1, recorder=graph.RECORDER)
+
+    def reset(self):
+        return self.env.reset()[0].tolist()
+
+    def step(self, action):
+        s, r, d = self.env.step([action])
+        return s[0].tolist(), r[0], False, None
+
+    def render(self):
+        self.env.render()
+
+    def close(self):
+        self.env.close()
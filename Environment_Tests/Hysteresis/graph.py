@@ -1,17 +1,67 @@
 # -*- coding: utf-8 -*-
-import matplotlib.pyplot as plt
+import numpy as np
 
-hdg = []
-speed = []
-stall_limit = []
+from parameters import TELEMETRY_SIZE
+
+
+class Recorder:
+    """
+    Ring buffer keeping the position, the speed and the stall limit of
+    nb_envs environments during their last `capacity` steps, so that the
+    memory used does not grow with the length of the run.
+    """
+
+    FIELDS = ('position', 'speed', 'stall limit')
+
+    def __init__(self, capacity=TELEMETRY_SIZE, nb_envs=1):
+        self.capacity = capacity
+        self.data = np.zeros((capacity, nb_envs, len(self.FIELDS)), dtype=np.float32)
+
+        self.write = 0
+        self.n_entries = 0
+
+    def add(self, pos, speed, stall_limit):
+        """
+        Record a step of every environment (scalars or arrays of nb_envs
+        values), overwriting the oldest step when the buffer is full.
+        """
+        self.data[self.write, :, 0] = pos
+        self.data[self.write, :, 1] = speed
+        self.data[self.write, :, 2] = stall_limit
+
+        self.write = (self.write + 1) % self.capacity
+        self.n_entries = min(self.n_entries + 1, self.capacity)
+
+    def get(self):
+        """
+        Return the recorded steps from the oldest to the newest as a
+        (n_entries, nb_envs, 3) array.
+        """
+        if self.n_entries < self.capacity:
+            return self.data[:self.n_entries]
+        return np.concatenate([self.data[self.write:], self.data[:self.write]])
+
+    def clear(self):
+        self.write = 0
+        self.n_entries = 0
+
+    def disp(self, env=0):
+        """
+        Plot the recorded steps of the environment env.
+        """
+        import matplotlib.pyplot as plt
+
+        data = self.get()[:, env]
+        for i, field in enumerate(self.FIELDS):
+            plt.plot(data[:, i], label=field)
+        plt.legend()
+        plt.show()
+
+
+RECORDER = Recorder()
 
 def add(i, v, s_v):
-	hdg.append(i)
-	speed.append(v)
-	stall_limit.append(s_v)
+	RECORDER.add(i, v, s_v)
 
 def disp():
-	plt.plot(hdg)
-	plt.plot(speed)
-	plt.plot(stall_limit)
-	plt.show()
+	RECORDER.disp()
@@ -47,3 +47,6 @@ RENDER_FREQ = 2
 
 SAVE_FREQ = 200
 EP_ELONGATION = 50
+
+# Number of steps kept by the telemetry recorder (graph.py)
+TELEMETRY_SIZE = 100000
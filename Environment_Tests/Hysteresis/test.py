@@ -1,7 +1,7 @@
 
 import random
 from time import sleep
-from HystEnv import HystEnv, window
+from HystEnv import HystEnv, get_renderer
 import tkinter
 
 env = HystEnv()
@@ -26,6 +26,7 @@ env.reset()
 # 		sleep(0.03)
 
 env.render()
+window = get_renderer().window
 
 def move(event):
     if event.keycode == 113:
@@ -5,22 +5,37 @@ from ale_python_interface import ALEInterface
 import cv2
 import imageio
 
+from FrameStack import FrameStack
+from SnapshotPool import SnapshotPool
+
 from settings import *
 
 
 class Environment:
 
+    # Emulator settings and screen processing of the game
+    FRAME_SKIP = 4
+    SCREEN_HEIGHT = 210
+    RESIZE_HEIGHT = 110
+    CROP_TOP = 18
+    ACTION_OFFSET = 4
+
     def __init__(self, render=False):
         self.ale = ALEInterface()
         self.ale.setInt(b'random_seed', 0)
         self.ale.setFloat(b'repeat_action_probability', 0.0)
         self.ale.setBool(b'color_averaging', True)
-        self.ale.setInt(b'frame_skip', 4)
+        self.ale.setInt(b'frame_skip', self.FRAME_SKIP)
         self.ale.setBool(b'display_screen', render)
         self.ale.loadROM(ENV.encode('ascii'))
-        self._screen = np.empty((210, 160, 1), dtype=np.uint8)
+        self._screen = np.empty((self.SCREEN_HEIGHT, 160, 1), dtype=np.uint8)
         self._no_op_max = 7
 
+        self.frame_stack = FrameStack((84, 84), dtype=np.float32)
+
+        # Snapshots of the game after a reset to start the episodes from
+        self.reset_pool = None
+
         self.img_buffer = []
 
     def set_render(self, render):
@@ -28,6 +43,31 @@ class Environment:
             self.ale.setBool(b'display_screen', render)
 
     def reset(self):
+        if RESET_POOL > 0:
+            if self.reset_pool is None:
+                self.reset_pool = SnapshotPool(RESET_POOL, self.new_snapshot)
+
+            snapshot = self.reset_pool.sample()
+            self.ale.restoreState(snapshot['ale'])
+            self.img_buffer = [snapshot['rgb']]
+            screen = snapshot['screen']
+        else:
+            screen = self.new_episode()
+
+        self.frame_stack.reset(screen)
+        return self.frame_stack.get()
+
+    def new_snapshot(self):
+        screen = self.new_episode()
+        return {'ale': self.ale.cloneState(),
+                'rgb': self.img_buffer[0],
+                'screen': screen}
+
+    def new_episode(self):
+        """
+        Reset the game, play a random number of no-ops and return the first
+        processed screen.
+        """
         self.ale.reset_game()
 
         # randomize initial state
@@ -40,34 +80,31 @@ class Environment:
         self.img_buffer.append(self.ale.getScreenRGB())
 
         self.ale.getScreenGrayscale(self._screen)
-        screen = np.reshape(self._screen, (210, 160))
-        screen = cv2.resize(screen, (84, 110))
-        screen = screen[18:102, :]
+        screen = np.reshape(self._screen, (self.SCREEN_HEIGHT, 160))
+        screen = cv2.resize(screen, (84, self.RESIZE_HEIGHT))
+        screen = screen[self.CROP_TOP:self.CROP_TOP + 84, :]
         screen = screen.astype(np.float32)
         screen /= 255.0
-
-        self.frame_buffer = np.stack((screen, screen, screen, screen), axis=2)
-        return self.frame_buffer
+        return screen
 
     def process(self, action, gif=False):
 
-        reward = self.ale.act(4+action)
+        reward = self.ale.act(self.ACTION_OFFSET + action)
         done = self.ale.game_over()
 
         if gif:
             self.img_buffer.append(self.ale.getScreenRGB())
 
         self.ale.getScreenGrayscale(self._screen)
-        screen = np.reshape(self._screen, (210, 160))
-        screen = cv2.resize(screen, (84, 110))
-        screen = np.reshape(screen[18:102, :], (84, 84, 1))
+        screen = np.reshape(self._screen, (self.SCREEN_HEIGHT, 160))
+        screen = cv2.resize(screen, (84, self.RESIZE_HEIGHT))
+        screen = screen[self.CROP_TOP:self.CROP_TOP + 84, :]
         screen = screen.astype(np.float32)
         screen *= (1/255.0)
 
-        self.frame_buffer = np.append(self.frame_buffer[:, :, 1:],
-                                      screen, axis=2)
+        self.frame_stack.push(screen)
 
-        return self.frame_buffer, reward, done, ""
+        return self.frame_stack.get(), reward, done, ""
 
     def save_gif(self, path):
         os.makedirs(os.path.dirname(path), exist_ok=True)
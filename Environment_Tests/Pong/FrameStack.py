@@ -0,0 +1,68 @@
+import numpy as np
+
+
+class FrameStack:
+    """
+    Stack of the last frames of an environment (or of a batch of environments)
+    in channel-last order, kept in a preallocated block.
+
+    The block holds 2 * stack channels and each frame is written twice, at
+    positions p and p + stack of the ring : the last `stack` frames are then
+    always the contiguous channels [p + 1, p + stack], so the stack is read
+    as a strided view of the block (or with a single copy of this view)
+    instead of rebuilding a new array at every step.
+    """
+
+    def __init__(self, frame_shape, stack=4, batch_size=None, dtype=np.uint8):
+        """
+        Args:
+            frame_shape: the shape (height, width) of a frame
+            stack      : the number of frames in a stack
+            batch_size : the number of environments stacked together (None for
+                          a single environment)
+            dtype      : the type of the frames
+        """
+        self.stack = stack
+        self.batch_size = batch_size
+
+        shape = (*frame_shape, 2 * stack)
+        if batch_size is not None:
+            shape = (batch_size, *shape)
+        self.block = np.zeros(shape, dtype=dtype)
+
+        # Position of the last frame written
+        self.head = stack - 1
+
+    def reset(self, frame, envs=None):
+        """
+        Fill the stack with a single frame (e.g. the first frame of an
+        episode). With a batch, the stacks of the environments envs are reset
+        (all of them by default) with their frames.
+        """
+        frame = np.asarray(frame)[..., None]
+        if self.batch_size is None or envs is None:
+            self.block[:] = frame
+        else:
+            self.block[envs] = frame
+
+    def push(self, frame):
+        """
+        Add a frame (or a batch of frames, one for each environment) at the end
+        of the stack, the oldest frame is dropped.
+        """
+        self.head = (self.head + 1) % self.stack
+        self.block[..., self.head] = frame
+        self.block[..., self.head + self.stack] = frame
+
+    def get(self, copy=True):
+        """
+        Return the stack of the last frames, from the oldest to the newest, as
+        a (height, width, stack) array or a (batch_size, height, width, stack)
+        array.
+
+        If copy is False, the stack is a view of the block : it is overwritten
+        by the next call to push.
+        """
+        start = self.head + 1
+        view = self.block[..., start:start + self.stack]
+        return view.copy() if copy else view
@@ -0,0 +1,32 @@
+import numpy as np
+
+
+class SnapshotPool:
+    """
+    Pool of snapshots of an environment taken right after a reset, each with
+    what the reset returns (e.g. the initial frame stack), so that the
+    environment can be reset by restoring one of them in O(1) instead of
+    replaying the random steps or no-ops of its reset.
+
+    The snapshots are generated once, each with its own random starting
+    conditions, and each reset restores one of them drawn at random.
+    """
+
+    def __init__(self, size, generate):
+        """
+        Args:
+            size    : the number of snapshots in the pool
+            generate: function that resets the environment and returns a
+                        snapshot of it
+        """
+        print("Generating {} reset snapshots...".format(size))
+        self.snapshots = [generate() for _ in range(size)]
+
+    def __len__(self):
+        return len(self.snapshots)
+
+    def sample(self):
+        """
+        Return a snapshot drawn at random.
+        """
+        return self.snapshots[np.random.randint(len(self.snapshots))]
@@ -6,6 +6,7 @@ DISPLAY = True
 LOAD = True
 
 NB_THREADS = 8 # parallel thread size
+RESET_POOL = 0 # number of post-reset snapshots to start the episodes from (0 to reset normally)
 
 GAMMA = 0.99
 UPDATE_FREQ = 20
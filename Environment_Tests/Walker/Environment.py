@@ -1,10 +1,8 @@
 
-import os
 import gym
 from parameters import ENV, FRAME_SKIP
 
-from PIL import Image
-import imageio
+from GifRecorder import GifRecorder
 
 
 class Environment:
@@ -14,7 +12,7 @@ class Environment:
         self.env_no_frame_skip = gym.make(ENV)
         self.env = gym.wrappers.SkipWrapper(FRAME_SKIP)(self.env_no_frame_skip)
         self.render = False
-        self.images = []
+        self.recorder = GifRecorder()
 
     def get_state_size(self):
         try:
@@ -59,9 +57,7 @@ class Environment:
                 self.env_no_frame_skip.render()
 
             # Save image
-            img = Image.fromarray(self.env.render(mode='rgb_array'))
-            img.save('tmp.png')
-            self.images.append(imageio.imread('tmp.png'))
+            self.recorder.add(self.env.render(mode='rgb_array'))
 
             s_, r_tmp, done, info = self.env_no_frame_skip.step(action)
             r += r_tmp
@@ -70,9 +66,8 @@ class Environment:
 
     def save_gif(self, path, i):
         path = path + "Gif_save_{}.gif".format(i)
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        imageio.mimsave(path, self.images, duration=1)
-        self.images = []
+        self.recorder.save(path)
 
     def close(self):
+        self.recorder.close()
         self.env.close()
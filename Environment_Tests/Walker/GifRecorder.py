@@ -0,0 +1,217 @@
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+import imageio
+
+
+def encoder(commands, free, name, shape, nb_slots, extension, mode, options):
+    """
+    Loop of the encoding process : append each frame written in the shared
+    ring to the current video (opened in a temporary file at its first
+    frame) and release its slot, and move the video to its path (with the
+    permissions mode) when it is saved or delete it when it is discarded,
+    until 'close'.
+    """
+    block = shared_memory.SharedMemory(name=name)
+    slots = np.ndarray((nb_slots, *shape), dtype=np.uint8, buffer=block.buf)
+    writer, tmp_path = None, None
+
+    try:
+        while True:
+            command, *args = commands.get()
+
+            if command == 'frame':
+                slot, = args
+                if writer is None:
+                    fd, tmp_path = tempfile.mkstemp(suffix=extension)
+                    os.close(fd)
+                    writer = imageio.get_writer(tmp_path, **options)
+                writer.append_data(slots[slot])
+                free.release()
+
+            elif command == 'save':
+                path, = args
+                if writer is not None:
+                    writer.close()
+                    os.chmod(tmp_path, mode)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    shutil.move(tmp_path, path)
+                    writer, tmp_path = None, None
+
+            elif command == 'discard':
+                if writer is not None:
+                    writer.close()
+                    os.remove(tmp_path)
+                    writer, tmp_path = None, None
+
+            elif command == 'close':
+                break
+    finally:
+        if writer is not None:
+            writer.close()
+            os.remove(tmp_path)
+        del slots
+        block.close()
+
+
+class GifRecorder:
+    """
+    Recorder that encodes the frames of an environment into gifs (or mp4
+    videos) in a background process, so that recording an episode costs a
+    copy of each frame in the agent loop.
+
+    The raw RGB frames are copied in a backlog, from which a feeder thread
+    writes them in a shared-memory ring of nb_slots frames as soon as slots
+    are free, and the encoding process appends them to the current video as
+    they come. If the encoder falls behind and the backlog holds too many
+    frames, the rest of the video is dropped instead of blocking the agent,
+    and the video is discarded at its save (rather than saved with missing
+    frames). The save and close commands go through the same queue (to stay
+    ordered with the frames) but are never dropped nor blocked.
+
+    The process is started at the first frame (the ring is allocated with
+    the shape of this frame) with 'spawn' since the parent process runs the
+    tensorflow threads. In a daemonic process (e.g. a worker of
+    SubprocessEnvironment), which cannot start processes, the encoder runs in
+    a thread instead.
+    """
+
+    def __init__(self, extension='.gif', nb_slots=64, backlog=256, **options):
+        """
+        Args:
+            extension: the format of the videos ('.gif' or '.mp4')
+            nb_slots : the number of frames in the shared ring
+            backlog  : the number of frames waiting for a slot beyond which
+                        the current video is dropped
+            options  : the options of the imageio writer (default to a
+                        duration of 1 for gifs)
+        """
+        self.extension = extension
+        self.nb_slots = nb_slots
+        self.backlog = backlog
+        self.options = options or ({'duration': 1} if extension == '.gif' else {})
+
+        self.encoder = None
+        self.nb_frames = 0
+        self.dropped = 0
+
+    def start(self, shape):
+        """
+        Allocate the shared ring for frames of the given shape and start the
+        encoder.
+        """
+        self.shape = shape
+        self.block = shared_memory.SharedMemory(create=True,
+                                                size=self.nb_slots * int(np.prod(shape)))
+        self.slots = np.ndarray((self.nb_slots, *shape), dtype=np.uint8,
+                                buffer=self.block.buf)
+
+        if mp.current_process().daemon:
+            self.commands = queue.Queue()
+            self.free = threading.Semaphore(self.nb_slots)
+            runner = threading.Thread
+        else:
+            context = mp.get_context('spawn')
+            self.commands = context.Queue()
+            self.free = context.Semaphore(self.nb_slots)
+            runner = context.Process
+
+        # The videos are saved with the usual permissions of a new file
+        # instead of those of a temporary file (0600)
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0o666 & ~umask
+
+        self.encoder = runner(target=encoder,
+                              args=(self.commands, self.free, self.block.name,
+                                    shape, self.nb_slots, self.extension, mode,
+                                    self.options),
+                              daemon=True)
+        self.encoder.start()
+
+        # Frames and commands for the feeder, with at most backlog frames
+        self.frames = queue.Queue()
+        self.backlog_free = threading.Semaphore(self.backlog)
+        self.feeder = threading.Thread(target=self.feed, daemon=True)
+        self.feeder.start()
+
+    def feed(self):
+        """
+        Loop of the feeder thread : write the frames of the backlog in the
+        ring as soon as their slot is free and pass them to the encoder with
+        the other commands, in order.
+        """
+        slot = 0
+        while True:
+            item = self.frames.get()
+
+            if isinstance(item, tuple):
+                self.commands.put(item)
+                if item[0] == 'close':
+                    break
+                continue
+
+            self.backlog_free.release()
+            self.free.acquire()
+            self.slots[slot] = item
+            self.commands.put(('frame', slot))
+            slot = (slot + 1) % self.nb_slots
+
+    def add(self, frame):
+        """
+        Add a (height, width, 3) uint8 frame to the current video without
+        waiting for it to be encoded. If the backlog is full, this frame and
+        the next ones until the save are dropped.
+        """
+        frame = np.asarray(frame)
+        if self.encoder is None:
+            self.start(frame.shape)
+        elif frame.shape != self.shape:
+            raise ValueError("GifRecorder : every frame must have the shape {}"
+                             .format(self.shape))
+
+        if self.dropped > 0 or not self.backlog_free.acquire(blocking=False):
+            self.dropped += 1
+            return
+        self.frames.put(frame.copy())
+        self.nb_frames += 1
+
+    def save(self, path):
+        """
+        Save the frames added since the last save in a video at path (once
+        they are encoded), or discard them if frames were dropped, and start
+        a new video.
+        """
+        if self.encoder is None:
+            return
+
+        if self.dropped > 0:
+            print("GifRecorder : the encoder fell behind, {} discarded "
+                  "({} frames dropped)".format(path, self.dropped))
+            self.frames.put(('discard',))
+        else:
+            self.frames.put(('save', path))
+        self.nb_frames = 0
+        self.dropped = 0
+
+    def close(self):
+        """
+        Wait for the encoder to finish the videos saved and stop it (the
+        frames added since the last save are discarded).
+        """
+        if self.encoder is None:
+            return
+
+        self.frames.put(('close',))
+        self.feeder.join()
+        self.encoder.join()
+        self.encoder = None
+
+        del self.slots
+        self.block.close()
+        self.block.unlink()
@@ -2,12 +2,13 @@
 import tensorflow as tf
 import numpy as np
 import random
-from collections import deque
 
 from QNetwork import QNetwork
 # from baselines.deepq.replay_buffer import PrioritizedReplayBuffer
 from ExperienceBuffer import ExperienceBuffer
+from NStepWriter import NStepWriter
 from Environment import Environment
+from VectorEnvironment import build_vector_env
 
 from settings import Settings
 
@@ -36,8 +37,13 @@ class Agent:
         self.saver = saver
 
         self.env = Environment()
+        self.vector_env = None
+        if Settings.NB_ENVS > 1:
+            self.vector_env = build_vector_env(Settings.NB_ENVS, self.env)
         self.QNetwork = QNetwork(sess)
         self.buffer = ExperienceBuffer(prioritized=Settings.PRIORITIZED_ER)
+        self.writer = NStepWriter(self.buffer, Settings.N_STEP_RETURN,
+                                  Settings.DISCOUNT)
         self.epsilon = Settings.EPSILON_START
         self.beta = Settings.BETA_START
 
@@ -47,6 +53,10 @@ class Agent:
         self.best_run = -1e10
         self.n_gif = 0
 
+        self.total_steps = 0
+        self.nb_ep = 1
+        self.restored = False
+
         print("Agent initialized !\n")
 
     def pre_train(self):
@@ -62,12 +72,13 @@ class Agent:
             done = False
             episode_reward = 0
             episode_step = 0
+            self.writer.clear()
 
             while episode_step < Settings.MAX_EPISODE_STEPS and not done:
 
                 a = self.env.act_random()
                 s_, r, done, info = self.env.act(a)
-                self.buffer.add((s, a, r, s_, 1 if not done else 0))
+                self.writer.add(s, a, r, s_, done)
 
                 s = s_
                 episode_reward += r
@@ -81,6 +92,40 @@ class Agent:
 
         print("End of the pre training !")
 
+    def get_state(self):
+        """
+        Return everything needed to resume the training besides the network
+        weights.
+        """
+        return {'epsilon': self.epsilon,
+                'beta': self.beta,
+                'best_run': self.best_run,
+                'total_steps': self.total_steps,
+                'nb_ep': self.nb_ep,
+                'learning_rate': self.QNetwork.learning_rate,
+                'learning_steps': self.QNetwork.steps,
+                'buffer': self.buffer.get_state(),
+                'random_state': random.getstate(),
+                'np_random_state': np.random.get_state()}
+
+    def set_state(self, state):
+        """
+        Restore a training state built by get_state. The pre-training is then
+        skipped since the buffer is already filled.
+        """
+        self.epsilon = state['epsilon']
+        self.beta = state['beta']
+        self.best_run = state['best_run']
+        self.total_steps = state['total_steps']
+        self.nb_ep = state['nb_ep']
+        self.QNetwork.learning_rate = state['learning_rate']
+        self.QNetwork.steps = state['learning_steps']
+        self.buffer.set_state(state['buffer'])
+        random.setstate(state['random_state'])
+        np.random.set_state(state['np_random_state'])
+
+        self.restored = True
+
     def save_best(self, episode_reward):
         self.best_run = episode_reward
         print("Save best", episode_reward)
@@ -94,24 +139,24 @@ class Agent:
         """
         print("Beginning of the run...")
 
-        self.pre_train()
-        self.QNetwork.init_target()
+        # A restored agent already has a filled buffer and a target network
+        if not self.restored:
+            self.pre_train()
+            self.QNetwork.init_target()
 
-        self.total_steps = 0
-        self.nb_ep = 1
+        if self.vector_env is not None:
+            self.run_vector()
+            return
 
         while self.nb_ep < Settings.TRAINING_EPS and not self.gui.STOP:
 
             s = self.env.reset()
             episode_reward = 0
             done = False
-            memory = deque()
+            self.writer.clear()
 
             episode_step = 1
-            # The more episodes the agent performs, the longer they are
-            max_step = Settings.MAX_EPISODE_STEPS
-            if Settings.EP_ELONGATION > 0:
-                max_step += self.nb_ep // Settings.EP_ELONGATION
+            max_step = self.max_episode_step()
 
             # Render settings
             self.env.set_render(self.gui.render.get(self.nb_ep))
@@ -120,71 +165,196 @@ class Agent:
 
             while episode_step <= max_step and not done:
 
-                # Exploration by NoisyNets or epsilon-greedy policy
-                if not Settings.NOISY and random.random() < self.epsilon:
-                    a = self.env.act_random()
-                else:
-                    if Settings.DISTRIBUTIONAL:
-                        Qdistrib = self.QNetwork.act(s)
-                        Qvalue = np.sum(self.z * Qdistrib, axis=1)
-                    else:
-                        Qvalue = self.QNetwork.act(s)
-                    
-                    a = np.argmax(Qvalue, axis=0)
-
-                    if plot_distrib:
-                        self.displayer.disp_distrib(self.z, self.delta_z,
-                                                    Qdistrib, Qvalue)
+                # Exploration by NoisyNets or epsilon-greedy policy, the
+                # action is chosen inside the graph
+                a = self.QNetwork.choose_action(s, self.exploration_rate())
+
+                if plot_distrib and Settings.DISTRIBUTIONAL:
+                    Qdistrib = self.QNetwork.act(s)
+                    Qvalue = np.sum(self.z * Qdistrib, axis=1)
+                    self.displayer.disp_distrib(self.z, self.delta_z,
+                                                Qdistrib, Qvalue)
 
                 s_, r, done, info = self.env.act(a)
                 episode_reward += r
 
-                memory.append((s, a, r))
-
-                # Keep the experience in memory until 'N_STEP_RETURN' steps has
-                # passed to get the delayed return r_1 + ... + gamma^n r_n
-                if len(memory) > Settings.N_STEP_RETURN:
-                    s_mem, a_mem, discount_R = memory.popleft()
-                    for i, (si, ai, ri) in enumerate(memory):
-                        discount_R += ri * Settings.DISCOUNT ** (i + 1)
-                    self.buffer.add((s_mem, a_mem, discount_R, s_, 1 if not done else 0))
+                # The writer keeps the experience until 'N_STEP_RETURN' steps
+                # have passed to get the delayed return r_1 + ... + gamma^n r_n
+                self.writer.add(s, a, r, s_, done)
 
                 if episode_step % Settings.TRAINING_FREQ == 0:
-                    if Settings.PRIORITIZED_ER:
-                        batch, idx, weights = self.buffer.sample(self.beta)
-                    else:
-                        batch = self.buffer.sample(self.beta)
-                        idx = weights = None
-                    loss = self.QNetwork.train(np.asarray(batch), weights)
-                    self.buffer.update(idx, loss)
-                    self.QNetwork.update_target()
+                    self.learn()
 
                 s = s_
                 episode_step += 1
                 self.total_steps += 1
 
-            # Decay epsilon
-            if self.epsilon > Settings.EPSILON_STOP:
-                self.epsilon -= Settings.EPSILON_DECAY
+            self.end_episode(episode_reward, episode_step, max_step)
 
-            self.displayer.add_reward(episode_reward, plot=self.gui.plot.get(self.nb_ep))
-            # if episode_reward > self.best_run:
-            #     self.save_best(episode_reward)
-            
-            # Episode display
-            if self.gui.ep_reward.get(self.nb_ep):
-                print('Episode %2i, Reward: %7.3f, Steps: %i, Epsilon: %f'
-                      ', Max steps: %i, Learning rate: %fe-4' % (self.nb_ep,
-                        episode_reward, episode_step, self.epsilon, max_step,
-                        self.QNetwork.learning_rate*10e4))
+        self.env.close()
 
-            # Save the model
-            if self.gui.save.get(self.nb_ep):
-                self.saver.save(self.nb_ep)
+    def run_vector(self):
+        """
+        Method to run the agent in Settings.NB_ENVS environments stepped in
+        lockstep : the actions of every environment are chosen with a single
+        forward pass of the network. The training frequency is still counted
+        in environment steps.
+
+        With ASYNC_ENVS, the environments are split in two groups : one group
+        is simulated in the background while the network infers the actions
+        of the other one and trains.
+        """
+        nb_envs = Settings.NB_ENVS
+        writer = NStepWriter(self.buffer, Settings.N_STEP_RETURN,
+                             Settings.DISCOUNT, nb_envs)
+        groups = np.array_split(np.arange(nb_envs), 2 if Settings.ASYNC_ENVS else 1)
+
+        s = np.array(self.vector_env.reset())
+        actions = np.zeros(nb_envs, dtype=np.int64)
+        episode_rewards = np.zeros(nb_envs)
+        episode_steps = np.zeros(nb_envs, dtype=np.int64)
+        max_steps = np.full(nb_envs, self.max_episode_step())
+
+        # Render settings (only the first environment is displayed)
+        self.vector_env.set_render(self.gui.render.get(self.nb_ep))
+        self.vector_env.set_gif(self.gui.gif.get(self.nb_ep))
+        plot_distrib = self.gui.plot_distrib.get(self.nb_ep)
+
+        # Start stepping every group but the last one
+        for g in groups[:-1]:
+            actions[g] = self.choose_actions(s[g], plot_distrib and g[0] == 0)
+            self.vector_env.step_async(actions[g], g)
+
+        n_group = len(groups) - 1
+        while self.nb_ep < Settings.TRAINING_EPS and not self.gui.STOP:
 
-            self.nb_ep += 1
+            # Infer the actions of the next group while the others simulate
+            g = groups[n_group]
+            actions[g] = self.choose_actions(s[g], plot_distrib and g[0] == 0)
+            self.vector_env.step_async(actions[g], g)
+
+            # Collect the oldest group
+            n_group = (n_group + 1) % len(groups)
+            g = groups[n_group]
+            s_, r, done, info = self.vector_env.step_wait()
+            episode_rewards[g] += r
+            episode_steps[g] += 1
+
+            # The finished environments are already reset : their experiences
+            # end on the terminal state given in info
+            next_states = np.stack([i.get('terminal_state', state)
+                                    for i, state in zip(info, s_)])
+            writer.add_batch(s[g], actions[g], r, next_states, done, g)
+            s[g] = s_
+
+            # Train once every TRAINING_FREQ environment steps
+            nb_train = (self.total_steps + len(g)) // Settings.TRAINING_FREQ - \
+                self.total_steps // Settings.TRAINING_FREQ
+            for _ in range(nb_train):
+                self.learn()
+            self.total_steps += len(g)
+
+            # Cut the episodes that reached their maximum number of steps
+            cut = g[~done & (episode_steps[g] >= max_steps[g])]
+            for e in cut:
+                writer.clear(e)
+            if len(cut) > 0:
+                s[cut] = self.vector_env.reset(cut)[cut]
+
+            for e in g[done | (episode_steps[g] >= max_steps[g])]:
+                self.end_episode(episode_rewards[e], episode_steps[e], max_steps[e])
+
+                episode_rewards[e] = 0
+                episode_steps[e] = 0
+                max_steps[e] = self.max_episode_step()
+
+                if e == 0:
+                    self.vector_env.set_render(self.gui.render.get(self.nb_ep))
+                    self.vector_env.set_gif(self.gui.gif.get(self.nb_ep))
+                    plot_distrib = self.gui.plot_distrib.get(self.nb_ep)
+
+        self.vector_env.close()
+
+    def choose_actions(self, states, plot_distrib=False):
+        """
+        Return the actions of a batch of states chosen inside the graph with a
+        single forward pass, with exploration by NoisyNets or epsilon-greedy
+        policy. The distribution of the first state is displayed if
+        plot_distrib.
+        """
+        actions = self.QNetwork.choose_actions(states, self.exploration_rate())
 
-        self.env.close()
+        if plot_distrib and Settings.DISTRIBUTIONAL:
+            Qdistrib = self.QNetwork.act(states[0])
+            Qvalue = np.sum(self.z * Qdistrib, axis=1)
+            self.displayer.disp_distrib(self.z, self.delta_z, Qdistrib, Qvalue)
+
+        return actions
+
+    def exploration_rate(self):
+        """
+        Return the probability of a random action : epsilon, or 0 with
+        NoisyNets which explore through the noise of the network (except with
+        the NumPy policy, which uses the mean weights of the noisy layers).
+        """
+        if Settings.NOISY and not Settings.NUMPY_POLICY:
+            return 0
+        return self.epsilon
+
+    def max_episode_step(self):
+        """
+        Return the maximum number of steps of the next episode : the more
+        episodes the agent performs, the longer they are.
+        """
+        max_step = Settings.MAX_EPISODE_STEPS
+        if Settings.EP_ELONGATION > 0:
+            max_step += self.nb_ep // Settings.EP_ELONGATION
+        return max_step
+
+    def learn(self):
+        """
+        Train the network on a minibatch and update the priorities and the
+        target network.
+        """
+        if Settings.PRIORITIZED_ER:
+            batch, idx, weights = self.buffer.sample(self.beta)
+        else:
+            batch = self.buffer.sample(self.beta)
+            idx = weights = None
+        loss = self.QNetwork.train(batch, weights)
+        self.buffer.update(idx, loss)
+        self.QNetwork.update_target()
+
+    def end_episode(self, episode_reward, episode_step, max_step):
+        """
+        Decay the exploration, display the episode and save the model and the
+        training state at the end of an episode.
+        """
+        # Decay epsilon
+        if self.epsilon > Settings.EPSILON_STOP:
+            self.epsilon -= Settings.EPSILON_DECAY
+
+        self.displayer.add_reward(episode_reward, plot=self.gui.plot.get(self.nb_ep))
+        # if episode_reward > self.best_run:
+        #     self.save_best(episode_reward)
+        
+        # Episode display
+        if self.gui.ep_reward.get(self.nb_ep):
+            print('Episode %2i, Reward: %7.3f, Steps: %i, Epsilon: %f'
+                  ', Max steps: %i, Learning rate: %fe-4' % (self.nb_ep,
+                    episode_reward, episode_step, self.epsilon, max_step,
+                    self.QNetwork.learning_rate*10e4))
+
+        # Save the model
+        save = self.gui.save.get(self.nb_ep)
+        if save:
+            self.saver.save(self.nb_ep)
+
+        self.nb_ep += 1
+
+        # Save the training state (to resume at the next episode)
+        if save:
+            self.saver.save_state(self.get_state(), self.nb_ep - 1)
 
     def play(self, number_run, name=None):
         """
@@ -205,9 +375,7 @@ class Agent:
                 self.env.set_gif(True, name)
 
                 while not done:
-                    Qdistrib = self.QNetwork.act(s)
-                    Qvalue = np.sum(self.z * Qdistrib, axis=1)
-                    a = np.argmax(Qvalue, axis=0)
+                    a = self.QNetwork.choose_action(s)
                     s, r, done, info = self.env.act(a)
 
                     episode_reward += r
@@ -226,3 +394,5 @@ class Agent:
 
     def stop(self):
         self.env.close()
+        if self.vector_env is not None:
+            self.vector_env.close()
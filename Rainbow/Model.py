@@ -2,6 +2,7 @@
 import tensorflow as tf
 import numpy as np
 
+from NumpyPolicy import dense, relu, softmax
 from settings import Settings
 
 
@@ -14,10 +15,14 @@ def fully_connected(*args, **kwargs):
     else:
         return tf.layers.dense(*args, **kwargs)
 
-def noisy_layer(inputs, units, activation=tf.identity, trainable=True, name=None, reuse=None):
+def noisy_layer(inputs, units, activation=tf.identity, trainable=True, name=None, reuse=None,
+                noise=True):
     """
     Implementation of NoisyNets : layer with gaussian noise on its weights and
     biases. We use the Factorised Gaussian noise here (cf. paper)
+
+    If noise is False, the layer uses the mean of its weights and biases
+    (e.g. in an inference graph).
     """
 
     with tf.variable_scope('noisy_layer', reuse=reuse):
@@ -47,24 +52,30 @@ def noisy_layer(inputs, units, activation=tf.identity, trainable=True, name=None
                                trainable=trainable)
         sigma_w = tf.get_variable(name +'/sigma_w', [p, q], initializer=sigma_init,
                                   trainable=trainable)
-        w = mu_w + sigma_w * epsilon_w
+        w = mu_w + sigma_w * epsilon_w if noise else mu_w
 
         # Bias noise
         mu_b = tf.get_variable(name + '/mu_b', [q], initializer=mu_init,
                                 trainable=trainable)
         sigma_b = tf.get_variable(name +'/sigma_b', [q], initializer=sigma_init,
                                   trainable=trainable)
-        b = mu_b + sigma_b * epsilon_b
+        b = mu_b + sigma_b * epsilon_b if noise else mu_b
 
         return activation(tf.matmul(inputs, w) + b)
 
 
-def build_critic(states, trainable, reuse, scope):
+def build_critic(states, trainable, reuse, scope, noise=True):
 
     params = {'trainable': trainable, 'reuse': reuse}
+    if Settings.NOISY:
+        params['noise'] = noise
 
     with tf.variable_scope(scope):
 
+        # Pixels are fed in uint8 and normalized inside the graph
+        if hasattr(Settings, 'CONV_LAYERS') and Settings.CONV_LAYERS:
+            states = tf.cast(states, tf.float32) / 255
+
         layer = states
         
         # Convolution layers
@@ -141,3 +152,63 @@ def build_critic(states, trainable, reuse, scope):
                 # Qvalues
                 return fully_connected(layer, Settings.ACTION_SIZE,
                                        name='output_layer', **params)
+
+
+def numpy_fully_connected(weights, name, inputs, activation=None):
+    """
+    NumPy counterpart of fully_connected : the noisy layers use the mean of
+    their weights and biases, without noise.
+    """
+    if Settings.NOISY:
+        output = (inputs @ weights['noisy_layer/' + name + '/mu_w'] +
+                  weights['noisy_layer/' + name + '/mu_b'])
+        return output if activation is None else activation(output)
+    else:
+        return dense(weights, name, inputs, activation)
+
+
+def numpy_critic(weights, states):
+    """
+    NumPy counterpart of build_critic (without convolution layers) computing
+    the Q-values or Q-distributions of a batch of states from the weights of
+    a NumpyPolicy.
+    """
+    layer = states
+
+    # Fully connected layers
+    for i, nb_neurons in enumerate(Settings.HIDDEN_LAYERS[:-1]):
+        layer = numpy_fully_connected(weights, 'dense_'+str(i), layer, relu)
+
+    if Settings.DUELING_DQN:
+
+        adv_stream = numpy_fully_connected(weights, 'adv_stream', layer, relu)
+        value_stream = numpy_fully_connected(weights, 'value_stream', layer, relu)
+
+        advantage = numpy_fully_connected(weights, 'adv', adv_stream)
+        value = numpy_fully_connected(weights, 'value', value_stream)
+
+        if Settings.DISTRIBUTIONAL:
+            advantage = advantage.reshape(-1, Settings.ACTION_SIZE, Settings.NB_ATOMS)
+            value = value.reshape(-1, 1, Settings.NB_ATOMS)
+            advantage_mean = np.mean(advantage, axis=1, keepdims=True)
+
+            # Qdistrib
+            return softmax(value + advantage - advantage_mean, axis=2)
+
+        else:
+            advantage_mean = np.mean(advantage, axis=1, keepdims=True)
+            # Qvalues
+            return value + advantage - advantage_mean
+
+    else:
+        layer = numpy_fully_connected(weights, 'last_dense', layer, relu)
+
+        if Settings.DISTRIBUTIONAL:
+            # Qdistrib
+            return np.stack([numpy_fully_connected(weights, 'output_' + str(i),
+                                                   layer, softmax)
+                             for i in range(Settings.ACTION_SIZE)], axis=1)
+
+        else:
+            # Qvalues
+            return numpy_fully_connected(weights, 'output_layer', layer)
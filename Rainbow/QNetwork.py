@@ -2,8 +2,10 @@
 import numpy as np
 import tensorflow as tf
 
-from Model import build_critic
-from network_utils import copy_vars, get_vars
+from Model import build_critic, numpy_critic
+from network_utils import copy_vars, get_vars, ActRunner
+from NumpyPolicy import PolicyExporter, NumpyPolicy
+from FrozenPolicy import export_frozen_graph, STATE, ACTION, OUTPUT
 from settings import Settings
 
 
@@ -24,11 +26,14 @@ class QNetwork:
         self.learning_rate = Settings.LEARNING_RATE
         self.steps = 0
 
+        # Pixels are fed in uint8 (see Model)
+        state_dtype = tf.uint8 if hasattr(Settings, 'CONV_LAYERS') and Settings.CONV_LAYERS else tf.float32
+
         # Batch placeholders
-        self.state_ph = tf.placeholder(tf.float32, [None, *Settings.STATE_SIZE], name='state')
+        self.state_ph = tf.placeholder(state_dtype, [None, *Settings.STATE_SIZE], name='state')
         self.action_ph = tf.placeholder(tf.int32, [None], name='action')
         self.reward_ph = tf.placeholder(tf.float32, [None], name='reward')
-        self.next_state_ph = tf.placeholder(tf.float32, [None, *Settings.STATE_SIZE], name='next_state')
+        self.next_state_ph = tf.placeholder(state_dtype, [None, *Settings.STATE_SIZE], name='next_state')
         self.not_done_ph = tf.placeholder(tf.float32, [None], name='not_done')
         
         # Turn these in column vector to add them to the distribution
@@ -42,9 +47,25 @@ class QNetwork:
 
         # Build the networks
         self.build_networks()
+        self.build_acting()
         self.build_train_operation()
         self.build_update()
 
+        # Acting fast paths bound once to the session
+        self.act_runner = ActRunner(self.sess, self.Q_st, self.state_ph)
+        self.choose_runner = ActRunner(self.sess, self.actions, self.state_ph,
+                                       self.epsilon_ph)
+
+        # NumPy copy of the main network acting without any session call
+        self.numpy_policy = None
+        if Settings.NUMPY_POLICY:
+            if hasattr(Settings, 'CONV_LAYERS') and Settings.CONV_LAYERS:
+                raise ValueError("QNetwork : NUMPY_POLICY only supports networks "
+                                 "without CONV_LAYERS")
+            self.exporter = PolicyExporter(self.sess, 'main_network')
+            self.numpy_policy = NumpyPolicy(self.exporter, numpy_critic)
+            self.z_values = np.linspace(Settings.MIN_Q, Settings.MAX_Q, Settings.NB_ATOMS)
+
         print("QNetwork created !\n")
 
     def build_networks(self):
@@ -95,6 +116,27 @@ class QNetwork:
         ind = tf.stack((tf.range(Settings.BATCH_SIZE), best_at_n), axis=1)
         self.Q_target_st_n_at_n = tf.gather_nd(Q_target_st_n, ind)
 
+    def build_acting(self):
+        """
+        Build the operation choosing the actions of a batch of states inside
+        the graph : the expected Q-values over the support (with
+        DISTRIBUTIONAL), their argmax and, with probability epsilon, a random
+        action instead, so that only the action indices are fetched.
+        """
+        self.epsilon_ph = tf.placeholder_with_default(0.0, [], name='epsilon')
+        batch_size = tf.shape(self.state_ph)[0]
+
+        # Transform the distribution into the value to get the argmax
+        Qvalue = self.Q_st
+        if Settings.DISTRIBUTIONAL:
+            Qvalue = tf.reduce_sum(self.z * Qvalue, axis=2)
+        greedy_actions = tf.argmax(Qvalue, 1, output_type=tf.int32)
+
+        random_actions = tf.random_uniform([batch_size], 0, Settings.ACTION_SIZE,
+                                           dtype=tf.int32)
+        explore = tf.random_uniform([batch_size]) < self.epsilon_ph
+        self.actions = tf.where(explore, random_actions, greedy_actions)
+
     def build_classical_loss(self):
         """
         Build the classical DQN loss :
@@ -203,7 +245,66 @@ class QNetwork:
         """
         Wrapper method to compute the Q-value distribution given a single state.
         """
-        return self.sess.run(self.Q_st, feed_dict={self.state_ph: [state]})[0]
+        if self.numpy_policy is not None:
+            return self.numpy_policy(np.asarray(state)[None])[0]
+        return self.act_runner(state)
+
+    def act_batch(self, states):
+        """
+        Wrapper method to compute the outputs of act for a batch of states in
+        a single forward pass.
+        """
+        if self.numpy_policy is not None:
+            return self.numpy_policy(states)
+        return self.act_runner.run_batch(states)
+
+    def choose_action(self, state, epsilon=0):
+        """
+        Wrapper method to get the action chosen in the graph for a single
+        state, random with probability epsilon.
+        """
+        if self.numpy_policy is not None:
+            return self.choose_actions(np.asarray(state)[None], epsilon)[0]
+        return self.choose_runner(state, epsilon)
+
+    def choose_actions(self, states, epsilon=0):
+        """
+        Wrapper method to get the actions chosen in the graph for a batch of
+        states, each random with probability epsilon.
+        """
+        if self.numpy_policy is not None:
+            # Same choice as the acting operation with the NumPy policy
+            Qvalue = self.numpy_policy(states)
+            if Settings.DISTRIBUTIONAL:
+                Qvalue = np.sum(self.z_values * Qvalue, axis=2)
+            actions = np.argmax(Qvalue, axis=1)
+
+            explore = np.random.random(len(actions)) < epsilon
+            random_actions = np.random.randint(Settings.ACTION_SIZE, size=len(actions))
+            return np.where(explore, random_actions, actions)
+
+        return self.choose_runner.run_batch(states, epsilon)
+
+    def export_inference_graph(self, path):
+        """
+        Write at path a frozen inference graph state -> action (argmax of the
+        expected Q-values) and state -> output (Q-values or distributions)
+        computed by a copy of the main network without noise, to be loaded
+        with FrozenPolicy.
+        """
+        if STATE not in [op.name for op in self.sess.graph.get_operations()]:
+            with tf.name_scope('inference'):
+                state_ph = tf.placeholder(self.state_ph.dtype, self.state_ph.shape,
+                                          name='state')
+                output = build_critic(state_ph, trainable=True, reuse=True,
+                                      scope='main_network', noise=False)
+                Qvalue = output
+                if Settings.DISTRIBUTIONAL:
+                    Qvalue = tf.reduce_sum(self.z * output, axis=2)
+                tf.argmax(Qvalue, 1, output_type=tf.int32, name='action')
+                tf.identity(output, name='output')
+
+        export_frozen_graph(self.sess, [ACTION, OUTPUT], path)
 
     def decrease_lr(self):
         """
@@ -216,18 +317,25 @@ class QNetwork:
         """
         Wrapper method to train the network given a minibatch of experiences.
         """
-        feed_dict = {self.state_ph: np.stack(batch[:, 0]),
-                     self.action_ph: batch[:, 1],
-                     self.reward_ph: batch[:, 2],
-                     self.next_state_ph: np.stack(batch[:, 3]),
-                     self.not_done_ph: batch[:, 4]}
+        feed_dict = {self.state_ph: batch[0],
+                     self.action_ph: batch[1],
+                     self.reward_ph: batch[2],
+                     self.next_state_ph: batch[3],
+                     self.not_done_ph: batch[4]}
 
         self.decrease_lr()
 
+        loss = None
         if Settings.PRIORITIZED_ER:
             feed_dict[self.weights] = weights
             loss, _ = self.sess.run([self.loss, self.train_op], feed_dict=feed_dict)
-            return loss
 
         else:
             self.sess.run(self.train_op, feed_dict=feed_dict)
+
+        # Periodically export the weights to the NumPy policy
+        if self.numpy_policy is not None and self.steps % Settings.POLICY_EXPORT_FREQ == 0:
+            self.exporter.export()
+            self.numpy_policy.refresh()
+
+        return loss
@@ -17,6 +17,17 @@ class Settings:
     FRAME_SKIP        = 0
     EP_ELONGATION     = 10
 
+    # Number of environments stepped together with one forward pass per step
+    NB_ENVS = 1
+    # Number of processes stepping them (0 to step them in the main process)
+    ENV_WORKERS = 0
+    # Simulate half of the environments while the actions of the other half
+    # are inferred
+    ASYNC_ENVS = False
+    # Number of post-reset snapshots the environments start their episodes
+    # from (0 to reset them normally)
+    RESET_POOL = 0
+
 
     ###########################################################################
     # Switches
@@ -57,9 +68,22 @@ class Settings:
     BUFFER_SIZE = 100000
     BATCH_SIZE  = 64
 
+    # Number of minibatches assembled in advance by a background thread
+    # (0 to sample them in the training loop)
+    PREFETCH_BATCHES = 0
+
+    # Storage types of the replay fields overriding the defaults (uint8
+    # pixels, int8 discrete actions), e.g. {'vectors': 'float16'}
+    REPLAY_DTYPES = {}
+
     TRAINING_FREQ      = 4
     UPDATE_TARGET_RATE = 0.001
 
+    # Act with a NumPy copy of the network (without convolution layers),
+    # whose weights are exported every POLICY_EXPORT_FREQ training steps
+    NUMPY_POLICY       = False
+    POLICY_EXPORT_FREQ = 100
+
 
     ###########################################################################
     # Exploration settings
@@ -97,6 +121,9 @@ class Settings:
     GIF_PATH = 'results/gif/'
     MAX_NB_GIF = 5
 
+    # Write a frozen inference graph (see FrozenPolicy) at the end of the run
+    EXPORT_INFERENCE = False
+
 
     ###########################################################################
 
@@ -1,10 +1,8 @@
 
-import os
 import gym
 from settings import ENV, DISPLAY, MAX_NB_GIF, GIF_PATH
 
-from PIL import Image
-import imageio
+from GifRecorder import GifRecorder
 
 class Environment:
 
@@ -15,7 +13,7 @@ class Environment:
         self.gif = False
         self.name_gif = 'save_'
         self.n_gif = {}
-        self.images = []
+        self.recorder = GifRecorder()
 
     def get_state_size(self):
         return list(self.env.observation_space.shape)
@@ -47,17 +45,14 @@ class Environment:
     def act(self, action):
         if self.gif:
             #Save image
-            img = Image.fromarray(self.env.render(mode='rgb_array'))
-            img.save('tmp.png')
-            self.images.append(imageio.imread('tmp.png'))
-
+            self.recorder.add(self.env.render(mode='rgb_array'))
 
         if self.render:
             self.env.render()
         return self.env.step(action)
 
     def save_gif(self):
-        if not self.images:
+        if self.recorder.nb_frames == 0:
             return
 
         print("Saving gif in ", GIF_PATH, "...", sep='')
@@ -65,9 +60,7 @@ class Environment:
         number = self.n_gif.get(self.name_gif, 0)
         path = GIF_PATH + self.name_gif + str(number) + ".gif"
 
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        imageio.mimsave(path, self.images, duration=1)
-        self.images = []
+        self.recorder.save(path)
 
         self.n_gif[self.name_gif] = (number + 1) % MAX_NB_GIF
         self.name_gif = 'save_'
@@ -76,4 +69,5 @@ class Environment:
         if self.gif:
             self.name_gif = 'last_gif_'
             self.save_gif()
+        self.recorder.close()
         self.env.close()
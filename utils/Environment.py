@@ -1,14 +1,14 @@
 
-import os
 import gym
 import cv2
 import numpy as np
-from collections import deque
+
+from FrameStack import FrameStack
+from SnapshotPool import SnapshotPool
 
 from settings import Settings
 
-from PIL import Image
-import imageio
+from GifRecorder import GifRecorder
 
 
 class Environment:
@@ -16,8 +16,9 @@ class Environment:
     Gym-environment wrapper to add the possibility to save GIFs.
 
     If the boolean gif if True, then every time the action methods is called,
-    the environment keeps a picture of the environment in a list until the
-    method save_gif is called.
+    the environment gives a picture of the environment to its GifRecorder,
+    which encodes it in a background process, until the method save_gif is
+    called.
     """
 
     def __init__(self):
@@ -25,13 +26,16 @@ class Environment:
         self.env = gym.make(Settings.ENV)
         self.pixel_input = hasattr(Settings, 'CONV_LAYERS')
 
-        self.frame_buffer = deque(maxlen=4)
+        self.frame_stack = FrameStack((84, 84))
+
+        # Snapshots used to reset the environment (see reset)
+        self.reset_pool = None
 
         self.render = False
         self.gif = False
         self.name_gif = 'save_'
         self.n_gif = {}
-        self.images = []
+        self.recorder = GifRecorder()
 
     def process(self, image):
         """
@@ -57,16 +61,77 @@ class Environment:
             self.name_gif = name
 
     def reset(self):
+        """
+        Start a new episode and return its first state.
+
+        With Settings.RESET_POOL > 0 and an environment whose emulator state
+        can be saved (the Atari environments), a pool of RESET_POOL snapshots
+        taken after a reset is generated at the first call and the next
+        episodes start from one of them.
+        """
         if self.gif:
             self.save_gif()
 
+        if self.reset_pool is None and getattr(Settings, 'RESET_POOL', 0) > 0:
+            if self.snapshot_methods() is not None:
+                self.reset_pool = SnapshotPool(Settings.RESET_POOL, self.new_snapshot)
+
+        if self.reset_pool is not None:
+            return self.restore(self.reset_pool.sample())
+        return self.new_episode()
+
+    def snapshot_methods(self):
+        """
+        Return the methods saving and restoring the emulator state of the
+        environment, or None if it has none.
+        """
+        env = self.env.unwrapped
+        for clone, restore in (('clone_full_state', 'restore_full_state'),
+                               ('clone_state', 'restore_state')):
+            if hasattr(env, clone) and hasattr(env, restore):
+                return getattr(env, clone), getattr(env, restore)
+        return None
+
+    def new_snapshot(self):
+        """
+        Reset the environment and return a snapshot of it with the first
+        state of the episode.
+        """
+        state = self.new_episode()
+        clone, _ = self.snapshot_methods()
+        return {'env': clone(),
+                'frame_stack': self.frame_stack.get_state() if self.pixel_input else None,
+                'state': state}
+
+    def restore(self, snapshot):
+        """
+        Restore a snapshot taken by new_snapshot and return its first state.
+        """
+        _, restore = self.snapshot_methods()
+        restore(snapshot['env'])
+
+        # Restart the step counters of the wrappers (TimeLimit)
+        env = self.env
+        while hasattr(env, 'env'):
+            if hasattr(env, '_elapsed_steps'):
+                env._elapsed_steps = 0
+            env = env.env
+
+        if self.pixel_input:
+            self.frame_stack.set_state(snapshot['frame_stack'])
+        return np.copy(snapshot['state'])
+
+    def new_episode(self):
+        """
+        Reset the environment and return the first state of the episode.
+        """
         # If pixex input, we reset the image buffer with random states
         if self.pixel_input:
             self.env.reset()
             for i in range(4):
                 s, r, d, i = self.env.step(self.act_random())
-                self.frame_buffer.append(self.process(s))
-            return np.transpose(self.frame_buffer, (1, 2, 0))
+                self.frame_stack.push(self.process(s))
+            return self.frame_stack.get()
         else:
             return self.env.reset()
 
@@ -86,27 +151,24 @@ class Environment:
                 self.env.render()
 
             if self.gif:
-                # Add image to the memory list
-                img = Image.fromarray(self.env.render(mode='rgb_array'))
-                img.save('tmp.png')
-                self.images.append(imageio.imread('tmp.png'))
+                self.recorder.add(self.env.render(mode='rgb_array'))
 
             s_, r_tmp, done, info = self.env.step(action)
             r += r_tmp
             i += 1
 
         if self.pixel_input:
-            self.frame_buffer.append(self.process(s_))
-            return np.transpose(self.frame_buffer, (1, 2, 0)), r, done, info
+            self.frame_stack.push(self.process(s_))
+            return self.frame_stack.get(), r, done, info
         else:
             return s_, r, done, info
 
     def save_gif(self):
         """
-        If images have been saved in the memory list, save these images in a
-        gif. The gif will have the name given in the set_gif method (default to
-        'save_') plus a number corresponding to the number of gifs saved with
-        that name plus one.
+        If images have been given to the recorder, save these images in a
+        gif (encoded in the background). The gif will have the name given in
+        the set_gif method (default to 'save_') plus a number corresponding to
+        the number of gifs saved with that name plus one.
 
         For instance, if set_gif is called twice with name='example_gif' and
         once with name='other_example_gif', then three gifs will be saved with
@@ -115,7 +177,7 @@ class Environment:
         The gif number wraps to 0 after Settings.MAX_NB_GIF (which will
         overwrite the first gif saved).
         """
-        if not self.images:
+        if self.recorder.nb_frames == 0:
             return
 
         print("Saving gif in ", Settings.GIF_PATH, "...", sep='')
@@ -123,14 +185,10 @@ class Environment:
         number = self.n_gif.get(self.name_gif, 0)
         path = Settings.GIF_PATH + self.name_gif + str(number) + ".gif"
 
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        imageio.mimsave(path, self.images, duration=1)
-        self.images = []
+        self.recorder.save(path)
 
         self.n_gif[self.name_gif] = (number + 1) % Settings.MAX_NB_GIF
         self.name_gif = 'save_'
-        
-        print("Gif saved!\n")
 
     def close(self):
         """
@@ -139,4 +197,5 @@ class Environment:
         if self.gif:
             self.name_gif = 'last_gif_'
             self.save_gif()
+        self.recorder.close()
         self.env.close()
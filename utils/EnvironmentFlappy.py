@@ -1,16 +1,18 @@
 
-import os
 import gym
 import cv2
 import numpy as np
 from collections import deque
 
+from FrameStack import FrameStack
+from SnapshotPool import SnapshotPool
+
 import game.wrapped_flappy_bird as game
+import game.batch_flappy_bird as batch_game
 
 from settings import Settings
 
-from PIL import Image
-import imageio
+from GifRecorder import GifRecorder
 
 
 class Environment:
@@ -18,8 +20,14 @@ class Environment:
     Gym-environment wrapper to add the possibility to save GIFs.
 
     If the boolean gif if True, then every time the action methods is called,
-    the environment keeps a picture of the environment in a list until the
-    method save_gif is called.
+    the environment gives a picture of the environment to its GifRecorder,
+    which encodes it in a background process, until the method save_gif is
+    called.
+
+    With pixel input (Settings.CONV_LAYERS), the states are stacks of the 4
+    last processed frames. Otherwise they are not frames but the 5 values of
+    GameState.get_state : the height and vertical velocity of the bird, and
+    the distance to the next pipe with the heights of its gap.
     """
 
     def __init__(self):
@@ -27,13 +35,16 @@ class Environment:
         self.env = game.GameState(1, False)
         self.pixel_input = hasattr(Settings, 'CONV_LAYERS')
 
-        self.frame_buffer = deque(maxlen=4)
+        self.frame_stack = FrameStack((84, 84))
+
+        # Snapshots used to reset the game (see reset)
+        self.reset_pool = None
 
         self.render = False
         self.gif = False
         self.name_gif = 'save_'
         self.n_gif = {}
-        self.images = []
+        self.recorder = GifRecorder()
 
     def process(self, image):
         """
@@ -50,27 +61,78 @@ class Environment:
 
     def set_gif(self, gif, name=None):
         """
-        Set the gif value and the name under which to save it.
+        Set the gif value and the name under which to save it. The frames are
+        drawn without any window, so gifs are also saved without display.
         """
-        self.gif = gif and Settings.DISPLAY
+        self.gif = gif
         if name is not None:
             self.name_gif = name
 
     def reset(self):
+        """
+        Start a new game and return its first state.
+
+        With pixel input and Settings.RESET_POOL > 0, a pool of RESET_POOL
+        snapshots of the game (and of the frame stack) taken after a reset
+        with a random seed is generated at the first call and the next games
+        start from one of them. With vector states, the reset is cheaper than
+        a restore, so the pool is not used.
+        """
         if self.gif:
             self.save_gif()
 
+        if (self.reset_pool is None and self.pixel_input and
+                getattr(Settings, 'RESET_POOL', 0) > 0):
+            self.reset_pool = SnapshotPool(Settings.RESET_POOL, self.new_snapshot)
+
+        if self.reset_pool is not None:
+            return self.restore(self.reset_pool.sample())
+        return self.new_episode()
+
+    def new_snapshot(self):
+        """
+        Reset the game with a random seed and return a snapshot of it with
+        its first state.
+        """
+        state = self.new_episode(np.random.randint(2**31))
+        return {'game': self.env.snapshot(),
+                'frame_stack': self.frame_stack.get_state(),
+                'state': state}
+
+    def restore(self, snapshot):
+        """
+        Restore a snapshot taken by new_snapshot and return its first state.
+        """
+        self.env.restore(snapshot['game'])
+        self.frame_stack.set_state(snapshot['frame_stack'])
+        return np.copy(snapshot['state'])
+
+    def new_episode(self, seed=None):
+        """
+        Reset the game (with the given seed, by default the seed of the game)
+        and return its first state.
+        """
+        # The game is reset in place instead of being rebuilt
+        self.env.reset(seed)
+
         # If pixex input, we reset the image buffer with random states
         if self.pixel_input:
-            self.env = game.GameState(1, False)
             for i in range(4):
-                frame, r, d = self.env.frame_step([1, 0], render=self.render)
-                self.frame_buffer.append(self.process(frame))
-            return np.transpose(self.frame_buffer, (1, 2, 0))
+                frame, r, d = self.step([1, 0])
+                self.frame_stack.push(self.process(frame))
+            return self.frame_stack.get()
         else:
-            self.env = game.GameState(1, False)
-            s, r, d = self.env.frame_step([1, 0], render=self.render)
-            return s
+            self.step([1, 0])
+            return self.env.get_state()
+
+    def step(self, action):
+        """
+        Apply an action in the game. The frame is only drawn when it is
+        needed (pixel input or gif), without any window if the game is not
+        rendered.
+        """
+        return self.env.frame_step(action, render=self.render,
+                                   pixels=self.pixel_input or self.gif)
 
     def act_random(self):
         """
@@ -85,28 +147,25 @@ class Environment:
         r, i, done, info = 0, 0, False, ""
         while i < (Settings.FRAME_SKIP + 1) and not done:
 
-            s_, r_tmp, done = self.env.frame_step([0, 1] if action else [1, 0], render=self.render)
+            s_, r_tmp, done = self.step([0, 1] if action else [1, 0])
             r += r_tmp
             i += 1
 
             if self.gif:
-                # Add image to the memory list
-                img = Image.fromarray(s_)
-                img.save('tmp.png')
-                self.images.append(imageio.imread('tmp.png'))
+                self.recorder.add(s_)
 
         if self.pixel_input:
-            self.frame_buffer.append(self.process(s_))
-            return np.transpose(self.frame_buffer, (1, 2, 0)), r, done, info
+            self.frame_stack.push(self.process(s_))
+            return self.frame_stack.get(), r, done, info
         else:
-            return s_, r, done, info
+            return self.env.get_state(), r, done, info
 
     def save_gif(self):
         """
-        If images have been saved in the memory list, save these images in a
-        gif. The gif will have the name given in the set_gif method (default to
-        'save_') plus a number corresponding to the number of gifs saved with
-        that name plus one.
+        If images have been given to the recorder, save these images in a
+        gif (encoded in the background). The gif will have the name given in
+        the set_gif method (default to 'save_') plus a number corresponding to
+        the number of gifs saved with that name plus one.
 
         For instance, if set_gif is called twice with name='example_gif' and
         once with name='other_example_gif', then three gifs will be saved with
@@ -115,7 +174,7 @@ class Environment:
         The gif number wraps to 0 after Settings.MAX_NB_GIF (which will
         overwrite the first gif saved).
         """
-        if not self.images:
+        if self.recorder.nb_frames == 0:
             return
 
         print("Saving gif in ", Settings.GIF_PATH, "...", sep='')
@@ -123,14 +182,10 @@ class Environment:
         number = self.n_gif.get(self.name_gif, 0)
         path = Settings.GIF_PATH + self.name_gif + str(number) + ".gif"
 
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        imageio.mimsave(path, self.images, duration=1)
-        self.images = []
+        self.recorder.save(path)
 
         self.n_gif[self.name_gif] = (number + 1) % Settings.MAX_NB_GIF
         self.name_gif = 'save_'
-        
-        print("Gif saved!\n")
 
     def close(self):
         """
@@ -139,3 +194,143 @@ class Environment:
         if self.gif:
             self.name_gif = 'last_gif_'
             self.save_gif()
+        self.recorder.close()
+
+
+class BatchEnvironment(Environment):
+    """
+    Vectorized environment (with the same surface as VectorEnvironment)
+    simulating its nb_envs games with a single BatchGameState : a step of
+    every game is a few numpy operations, so no thread nor process is needed
+    and step_async steps the group at once.
+
+    The pixel states are drawn directly in low resolution by the batch
+    (nearest pixel instead of the resize of process). The games over are
+    reset at once and their terminal states are given in
+    info['terminal_state']. Only the first game is rendered and saved in gifs.
+    """
+
+    def __init__(self, nb_envs):
+
+        self.nb_envs = nb_envs
+        self.game = batch_game.BatchGameState(nb_envs)
+        self.pixel_input = hasattr(Settings, 'CONV_LAYERS')
+
+        # Stacks of the last frames of each game (the groups given to
+        # step_async are stepped separately, so the stacks are shifted game
+        # by game instead of sharing the head of a FrameStack)
+        if self.pixel_input:
+            self.stacks = np.zeros((nb_envs, 84, 84, 4), dtype=np.uint8)
+
+        self.pending = deque()
+
+        self.render = False
+        self.gif = False
+        self.name_gif = 'save_'
+        self.n_gif = {}
+        self.recorder = GifRecorder()
+
+    def process(self, frames):
+        """
+        Cut the low-resolution frames of the batch to get 84x84 images.
+        """
+        return frames[:, 1:85, :]
+
+    def push_frames(self, envs, reset=False):
+        """
+        Draw the games envs and add their frames to their stacks (or fill
+        their stacks with them if reset).
+        """
+        frames = self.process(self.game.rasterize(envs))[..., np.newaxis]
+        if reset:
+            self.stacks[envs] = frames
+        else:
+            self.stacks[envs] = np.concatenate([self.stacks[envs, ..., 1:], frames], axis=-1)
+
+    def get_states(self, envs):
+        """
+        Return a new array with the current states of the games envs.
+        """
+        if self.pixel_input:
+            return self.stacks[envs]
+        return self.game.get_states()[envs]
+
+    def reset(self, envs=None):
+        """
+        Reset the given games (every one of them by default) and return the
+        current states of all of them.
+        """
+        envs = np.arange(self.nb_envs) if envs is None else np.asarray(envs)
+        if self.gif and 0 in envs:
+            self.save_gif()
+
+        self.game.reset(envs)
+        if self.pixel_input:
+            self.push_frames(envs, reset=True)
+        return self.get_states(np.arange(self.nb_envs))
+
+    def act_random(self):
+        """
+        Return a batch of random actions.
+        """
+        return np.random.random(self.nb_envs) < 0.5
+
+    def act(self, actions):
+        """
+        Apply one action in each game (with frame skip) and reset those which
+        are over.
+
+        Returns:
+            The batches of next states, rewards and dones and the list of infos.
+        """
+        return self.step(actions, np.arange(self.nb_envs))
+
+    def step(self, actions, envs):
+        """
+        Apply the actions in the games envs and return the batches of their
+        next states, rewards and dones and the list of their infos.
+        """
+        envs = np.asarray(envs)
+        flaps = np.asarray(actions, dtype=bool)
+        rewards = np.zeros(len(envs))
+        dones = np.zeros(len(envs), dtype=bool)
+
+        # Frame skip : the games over are not stepped anymore
+        for _ in range(Settings.FRAME_SKIP + 1):
+            alive = np.flatnonzero(~dones)
+            if len(alive) == 0:
+                break
+
+            r, dones[alive] = self.game.frame_step(flaps[alive], envs[alive])
+            rewards[alive] += r
+
+            if (self.render or self.gif) and 0 in envs[alive]:
+                frame = self.game.render(0) if self.render else self.game.draw(0)
+                if self.gif:
+                    self.recorder.add(frame)
+
+        if self.pixel_input:
+            self.push_frames(envs)
+
+        infos = [{} for _ in envs]
+        over = np.flatnonzero(dones)
+        if len(over) > 0:
+            for i, state in zip(over, self.get_states(envs[over])):
+                infos[i]['terminal_state'] = state
+            self.reset(envs[over])
+
+        return self.get_states(envs), rewards, dones, infos
+
+    def step_async(self, actions, envs=None):
+        """
+        Step the games envs (every one of them by default). The results are
+        given by step_wait, in the order of the calls to step_async.
+        """
+        envs = np.arange(self.nb_envs) if envs is None else envs
+        self.pending.append(self.step(actions, envs))
+
+    def step_wait(self):
+        """
+        Return the results of the oldest group given to step_async.
+        """
+        return self.pending.popleft()
@@ -1,54 +1,165 @@
-
-import random
-from collections import deque
 import numpy as np
 
 from SumTree import SumTree
+from ReplayStorage import TransitionStorage, FrameStorage, TieredStorage
+from Prefetcher import PrefetchBuffer
 from settings import Settings
 
 
 def ExperienceBuffer(*, prioritized=False):
 	if prioritized:
-		return PrioritizedExperienceBuffer()
+		buffer = PrioritizedExperienceBuffer()
 	else:
-		return RegularExperienceBuffer()
+		buffer = RegularExperienceBuffer()
+
+	# Assemble the next minibatches in a background thread
+	if getattr(Settings, 'PREFETCH_BATCHES', 0) > 0:
+		return PrefetchBuffer(buffer, Settings.PREFETCH_BATCHES)
+	return buffer
+
+def build_storage(capacity):
+	"""
+	With pixel input, store each frame once instead of whole stacks (unless the
+	setting FRAME_REPLAY is set to False).
+	Otherwise, if RAM_BUFFER_SIZE is set and smaller than the capacity, only
+	keep the RAM_BUFFER_SIZE last experiences in RAM and the older ones in
+	memory-mapped files under REPLAY_PATH.
+	The fields are stored in the compact types given by build_dtypes.
+	"""
+	dtypes = build_dtypes()
+	if hasattr(Settings, 'CONV_LAYERS') and getattr(Settings, 'FRAME_REPLAY', True):
+		return FrameStorage(capacity, dtypes=dtypes)
+
+	ram_capacity = getattr(Settings, 'RAM_BUFFER_SIZE', None)
+	if ram_capacity and ram_capacity < capacity:
+		return TieredStorage(capacity, ram_capacity,
+							 getattr(Settings, 'REPLAY_PATH', 'replay/'),
+							 dtypes=dtypes)
+
+	return TransitionStorage(capacity, dtypes=dtypes)
+
+def build_dtypes():
+	"""
+	Storage types of the replay fields : pixels in uint8, discrete actions in
+	the smallest integer type that holds ACTION_SIZE and not_done flags in
+	uint8. The setting REPLAY_DTYPES overrides them, for instance with
+	{'vectors': np.float16} to halve the size of vector observations.
+	"""
+	dtypes = {'discrete_actions': np.int8 if Settings.ACTION_SIZE <= 127 else np.int16}
+	dtypes.update(getattr(Settings, 'REPLAY_DTYPES', {}))
+	return dtypes
 
 class RegularExperienceBuffer:
 
-	def __init__(self):
-		self.buffer = deque(maxlen=Settings.BUFFER_SIZE)
+	prioritized = False
+
+	def __init__(self, capacity=None):
+		self.storage = build_storage(capacity or Settings.BUFFER_SIZE)
 
 	def __len__(self):
-		return len(self.buffer)
+		return len(self.storage)
 
 	def add(self, experience):
-		self.buffer.append(experience)
+		self.storage.add(experience)
+
+	def sample_batch(self, batch_size=None):
+		idx = self.storage.sample_idx(batch_size or Settings.BATCH_SIZE)
+		return self.storage.get(idx), idx
 
 	def sample(self, beta=None):
-		batch_size = min(Settings.BATCH_SIZE, len(self.buffer))
-		return random.sample(self.buffer, batch_size)
+		return self.sample_batch()[0]
 
 	def update(self, idx, errors):
 		pass
 
+	def get_state(self):
+		return {'storage': self.storage.get_state()}
+
+	def set_state(self, state):
+		self.storage.set_state(state['storage'])
+
 
 class PrioritizedExperienceBuffer:
 
-	def __init__(self):
-		self.buffer = SumTree(capacity=Settings.BUFFER_SIZE)
+	prioritized = True
 
-	def add(self, experience):
-		self.buffer.add(self.buffer.max(), experience)
+	def __init__(self, capacity=None):
+		capacity = capacity or Settings.BUFFER_SIZE
+		self.buffer = SumTree(capacity=capacity)
+		self.storage = build_storage(capacity)
 
-	def sample(self, beta):
-		data, idx, priorities = self.buffer.sample(Settings.BATCH_SIZE)
-		probs = priorities / self.buffer.total()
-		weights = (self.buffer.n_entries * probs) ** -beta
+		# Number of times each experience was overwritten or evicted, to
+		# detect the priority updates of a batch that came too late
+		self.versions = np.zeros(capacity, dtype=np.int64)
+
+	def __len__(self):
+		return len(self.storage)
+
+	def add(self, experience):
+		# The tree and the storage are two rings of the same capacity filled
+		# together, so the leaf i of the tree holds the priority of the
+		# experience i of the storage
+		self.versions[self.buffer.write] += 1
+		self.storage.add(experience)
+		self.buffer.add(self.buffer.max(), None)
+
+		# Experiences evicted by the storage must not be sampled anymore
+		if self.storage.evicted:
+			self.versions[self.storage.evicted] += 1
+			self.buffer.update(np.asarray(self.storage.evicted) + self.buffer.tree_capacity - 1, 0)
+
+	def sample_batch(self, batch_size=None):
+		idx, priorities = self.buffer.sample_idx(batch_size or Settings.BATCH_SIZE)
+		return self.storage.get(idx - self.buffer.tree_capacity + 1), idx
+
+	def probabilities(self, idx):
+		"""
+		Return the current sampling probabilities of the leaves idx and the
+		number of experiences in the buffer.
+		"""
+		priorities = np.maximum(self.buffer.sum_tree[idx], 1e-6 ** Settings.ALPHA)
+		return priorities / self.buffer.total(), self.buffer.n_entries
+
+	def weights(self, idx, beta, probabilities=None):
+		"""
+		Compute the importance-sampling weights of the leaves idx from their
+		current priorities, or from the probabilities (as returned by the
+		method probabilities) with which they were drawn.
+		"""
+		probs, n_entries = probabilities or self.probabilities(idx)
+		weights = (n_entries * probs) ** -beta
 		weights /= np.max(weights)
 
-		return data, idx, weights
+		return weights
+
+	def sample(self, beta):
+		data, idx = self.sample_batch()
+		return data, idx, self.weights(idx, beta)
+
+	def get_versions(self, idx):
+		"""
+		Return the versions of the leaves idx, to be given back to the method
+		update with their errors.
+		"""
+		return self.versions[idx - self.buffer.tree_capacity + 1]
+
+	def update(self, idx, errors, versions=None):
+		"""
+		Update the priorities of the leaves idx. With the versions of the
+		leaves when they were sampled, the leaves overwritten or evicted since
+		then are skipped (an evicted leaf must keep a priority of 0).
+		"""
+		if versions is not None:
+			fresh = self.get_versions(idx) == versions
+			idx, errors = np.asarray(idx)[fresh], np.asarray(errors)[fresh]
 
-	def update(self, idx, errors):
 		priorities = (np.abs(errors) + 1e-6) ** Settings.ALPHA
-		for i in range(len(idx)):
-			self.buffer.update(idx[i], priorities[i])
+		self.buffer.update(idx, priorities)
+
+	def get_state(self):
+		return {'tree': self.buffer.get_state(),
+				'storage': self.storage.get_state()}
+
+	def set_state(self, state):
+		self.buffer.set_state(state['tree'])
+		self.storage.set_state(state['storage'])
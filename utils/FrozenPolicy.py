@@ -0,0 +1,113 @@
+
+import os
+import sys
+import numpy as np
+import tensorflow as tf
+
+
+# Names of the nodes of a frozen inference graph (see the method
+# export_inference_graph of the networks)
+STATE = 'inference/state'
+ACTION = 'inference/action'
+OUTPUT = 'inference/output'
+
+
+def export_frozen_graph(sess, output_names, path):
+    """
+    Write at path the subgraph of the session's graph computing the nodes
+    output_names, with the variables folded as constants : every node they do
+    not depend on (target networks, losses, optimizers and their slots) is
+    pruned.
+    """
+    graph_def = tf.graph_util.convert_variables_to_constants(
+        sess, sess.graph.as_graph_def(), output_names)
+    graph_def = tf.graph_util.remove_training_nodes(graph_def,
+                                                    protected_nodes=output_names)
+
+    # Fold the constant subexpressions (e.g. the support of the distribution)
+    try:
+        from tensorflow.tools.graph_transforms import TransformGraph
+        graph_def = TransformGraph(graph_def, [STATE], output_names,
+                                   ['fold_constants(ignore_errors=true)',
+                                    'strip_unused_nodes'])
+    except ImportError:
+        pass
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(graph_def.SerializeToString())
+    print("Inference graph exported in", path)
+
+
+class FrozenPolicy:
+    """
+    Policy loaded from a frozen inference graph written by
+    export_frozen_graph, which runs in its own graph and session without the
+    training code (QNetwork, Settings...) or any variable to restore.
+    """
+
+    def __init__(self, path):
+        graph_def = tf.GraphDef()
+        with open(path, 'rb') as f:
+            graph_def.ParseFromString(f.read())
+
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            tf.import_graph_def(graph_def, name='')
+        self.sess = tf.Session(graph=self.graph)
+
+        self.state_ph = self.graph.get_tensor_by_name(STATE + ':0')
+        self.action = self.graph.get_tensor_by_name(ACTION + ':0')
+        self.output = None
+        if OUTPUT in [node.name for node in graph_def.node]:
+            self.output = self.graph.get_tensor_by_name(OUTPUT + ':0')
+
+        self.run_actions = self.sess.make_callable(self.action, [self.state_ph])
+
+    def act(self, state):
+        """
+        Return the action chosen for a single state.
+        """
+        return self.run_actions(np.asarray(state)[None])[0]
+
+    def act_batch(self, states):
+        """
+        Return the actions chosen for a batch of states.
+        """
+        return self.run_actions(states)
+
+    def outputs(self, states):
+        """
+        Return the Q-values (or Q-value distributions) of a batch of states.
+        """
+        return self.sess.run(self.output, feed_dict={self.state_ph: states})
+
+    def close(self):
+        self.sess.close()
+
+
+if __name__ == '__main__':
+
+    # Evaluate a frozen policy on a gym environment with vector states :
+    #   python FrozenPolicy.py model/inference.pb CartPole-v0 [number_run]
+    import gym
+
+    path, env_name = sys.argv[1:3]
+    number_run = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+
+    policy = FrozenPolicy(path)
+    env = gym.make(env_name)
+
+    for i in range(number_run):
+        s = env.reset()
+        episode_reward = 0
+        done = False
+
+        while not done:
+            s, r, done, info = env.step(policy.act(s))
+            episode_reward += r
+
+        print("Episode reward :", episode_reward)
+
+    env.close()
+    policy.close()
@@ -0,0 +1,135 @@
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class InferenceServer:
+    """
+    Background thread running the forward passes of a network for several
+    actor threads : the states submitted by the actors are gathered and run in
+    a single batched session call per tick, and each actor gets its outputs
+    back through a future.
+
+    A tick starts with the first pending request and gathers the next ones
+    until max_batch states are collected, every actor has submitted or
+    max_wait_us microseconds have passed, so that the actors share one call
+    instead of serializing one small call each.
+    """
+
+    def __init__(self, sess, inputs, outputs, nb_clients, max_batch=64,
+                 max_wait_us=200):
+        """
+        Args:
+            sess       : the tensorflow session in which to run the network
+            inputs     : the placeholder of the batch of states
+            outputs    : the tensor computed for each batch of states
+            nb_clients : the number of actor threads submitting states
+            max_batch  : the number of states beyond which a tick stops
+                          gathering requests
+            max_wait_us: the maximum time (in microseconds) a tick waits for
+                          the requests of the other actors
+        """
+        # Forward pass bound once to the session
+        self.forward = sess.make_callable(outputs, [inputs])
+        self.nb_clients = nb_clients
+        self.max_batch = max_batch
+        self.max_wait = max_wait_us * 1e-6
+
+        self.requests = queue.Queue()
+
+        # The actors start the server at their first request
+        self.thread = None
+        self.running = False
+        self.start_lock = threading.Lock()
+
+    def serve(self):
+        """
+        Method run by the background thread to answer the requests tick by
+        tick.
+        """
+        while self.running:
+            try:
+                request = self.requests.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            batch = [request]
+            nb_states = len(request[0])
+            deadline = time.perf_counter() + self.max_wait
+
+            while nb_states < self.max_batch and len(batch) < self.nb_clients:
+                timeout = deadline - time.perf_counter()
+                try:
+                    if timeout > 0:
+                        request = self.requests.get(timeout=timeout)
+                    else:
+                        request = self.requests.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(request)
+                nb_states += len(request[0])
+
+            self.run(batch)
+
+    def run(self, batch):
+        """
+        Run a single forward pass for a list of requests and give each one its
+        part of the outputs.
+        """
+        if len(batch) == 1:
+            states = batch[0][0]
+        else:
+            states = np.concatenate([states for states, _ in batch])
+
+        try:
+            outputs = self.forward(states)
+        except Exception as error:
+            for _, future in batch:
+                future.set_exception(error)
+            return
+
+        start = 0
+        for states, future in batch:
+            future.set_result(outputs[start:start + len(states)])
+            start += len(states)
+
+    def start(self):
+        with self.start_lock:
+            if self.thread is not None:
+                return
+            self.running = True
+            self.thread = threading.Thread(target=self.serve, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        with self.start_lock:
+            self.running = False
+            if self.thread is not None:
+                self.thread.join()
+                self.thread = None
+
+    def submit(self, states):
+        """
+        Submit a batch of states and return a future of their outputs.
+        """
+        if self.thread is None:
+            self.start()
+
+        future = Future()
+        self.requests.put((np.asarray(states), future))
+        return future
+
+    def predict(self, state):
+        """
+        Return the output of the network for a single state.
+        """
+        return self.submit(np.asarray(state)[None]).result()[0]
+
+    def predict_batch(self, states):
+        """
+        Return the outputs of the network for a batch of states.
+        """
+        return self.submit(states).result()
@@ -0,0 +1,82 @@
+
+import time
+import numpy as np
+
+
+class LatencyHistogram:
+    """
+    Histogram of the latencies of a function call, with logarithmic bins from
+    1µs to 1s, used to compare the per-call overhead of several ways of
+    running a network.
+    """
+
+    BINS = np.logspace(0, 6, 49)
+
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+
+    def time(self, function, *args, nb_calls=1000):
+        """
+        Call function(*args) nb_calls times and record the latency of each
+        call.
+        """
+        for _ in range(nb_calls):
+            start = time.perf_counter()
+            function(*args)
+            self.latencies.append(time.perf_counter() - start)
+
+    def disp(self, width=50):
+        """
+        Print the percentiles of the latencies (in µs) and their histogram.
+        """
+        latencies = np.array(self.latencies) * 1e6
+        p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+        print("{} : {} calls, p50 {:.1f}µs, p90 {:.1f}µs, p99 {:.1f}µs"
+              .format(self.name, len(latencies), p50, p90, p99))
+
+        counts, bins = np.histogram(latencies, bins=self.BINS)
+        nonzero = np.nonzero(counts)[0]
+        for i in range(nonzero[0], nonzero[-1] + 1):
+            bar = '#' * int(np.ceil(width * counts[i] / counts.max()))
+            print("{:>9.1f}µs |{:<{}} {}".format(bins[i], bar, width, counts[i]))
+        print()
+
+
+if __name__ == '__main__':
+
+    # Compare the per-call latency of sess.run with a fresh feed_dict and of
+    # the ActRunner fast path on small networks (HIDDEN_LAYERS = [16, 16])
+    import gym
+    import tensorflow as tf
+    from network_utils import ActRunner
+
+    for env_name in ("CartPole-v0", "Pendulum-v0"):
+        env = gym.make(env_name)
+        state = env.reset()
+        state_size = list(env.observation_space.shape)
+        try:
+            output_size = env.action_space.n
+        except AttributeError:
+            output_size = env.action_space.shape[0]
+        env.close()
+
+        tf.reset_default_graph()
+        state_ph = tf.placeholder(tf.float32, [None, *state_size], name='state')
+        layer = state_ph
+        for size in [16, 16]:
+            layer = tf.layers.dense(layer, size, activation=tf.nn.relu)
+        output = tf.layers.dense(layer, output_size)
+
+        with tf.Session() as sess:
+            sess.run(tf.global_variables_initializer())
+            runner = ActRunner(sess, output, state_ph)
+
+            def run(state):
+                return sess.run(output, feed_dict={state_ph: [state]})[0]
+
+            for name, function in (("sess.run", run), ("ActRunner", runner)):
+                histogram = LatencyHistogram(env_name + " " + name)
+                function(state)     # Warm-up
+                histogram.time(function, state, nb_calls=5000)
+                histogram.disp()
@@ -0,0 +1,115 @@
+import numpy as np
+
+
+class NStepWriter:
+    """
+    This class turns the steps of one or several environments into n-step
+    experiences (s_t, a_t, r_t + ... + gamma^(n-1) r_{t+n-1}, s_{t+n}, not_done)
+    and writes them into an experience buffer.
+
+    Each environment keeps a ring of the n last (state, action) pairs with the
+    discounted return accumulated so far for each of them : every step adds its
+    reward once to every pending return instead of summing the whole window
+    again. When an episode ends, the pending experiences are written with their
+    truncated returns (their next state is terminal, so they need no
+    bootstrap).
+    """
+
+    def __init__(self, buffer, n, discount, nb_envs=1):
+        """
+        Args:
+            buffer  : the experience buffer in which to write the experiences
+            n       : the number of rewards summed in each return
+            discount: the discount factor gamma
+            nb_envs : the number of environments stepped together
+        """
+        self.buffer = buffer
+        self.n = n
+        self.nb_envs = nb_envs
+
+        self.powers = discount ** np.arange(n)
+
+        # Discounted returns and ages (-1 for an empty slot) of the pending
+        # experiences of each environment
+        self.returns = np.zeros((nb_envs, n))
+        self.ages = np.full((nb_envs, n), -1)
+        self.states = [[None] * n for _ in range(nb_envs)]
+        self.actions = [[None] * n for _ in range(nb_envs)]
+
+        # Slot where the next experience of each environment starts
+        self.heads = np.zeros(nb_envs, dtype=np.int64)
+
+    def clear(self, env=None):
+        """
+        Drop the pending experiences of an environment (or of every one of them)
+        when its episode is cut before reaching a terminal state.
+        """
+        envs = range(self.nb_envs) if env is None else [env]
+        for e in envs:
+            self.ages[e] = -1
+            self.states[e] = [None] * self.n
+            self.actions[e] = [None] * self.n
+
+    def add(self, s, a, r, s_, done):
+        """
+        Add a step of a single environment.
+        """
+        self.add_batch([s], [a], [r], [s_], [done])
+
+    def add_batch(self, states, actions, rewards, next_states, dones, envs=None):
+        """
+        Add one step of the environments envs (every one of them by default)
+        and write the experiences that are complete in the buffer.
+        """
+        envs = np.arange(self.nb_envs) if envs is None else np.asarray(envs)
+        rewards = np.asarray(rewards, dtype=np.float64)
+        dones = np.asarray(dones, dtype=bool)
+
+        heads = self.heads[envs]
+
+        # The states are copied since they may be views of a batch that the
+        # environment reuses at its next steps
+        for e, slot, state, action in zip(envs, heads, states, actions):
+            self.states[e][slot] = np.array(state)
+            self.actions[e][slot] = action
+        self.returns[envs, heads] = 0
+        self.ages[envs, heads] = 0
+
+        # Add the reward to every pending return with the discount of its age
+        ages = self.ages[envs]
+        pending = ages >= 0
+        self.returns[envs] += pending * self.powers[np.maximum(ages, 0)] * rewards[:, None]
+
+        # Write the experiences with n rewards and those of finished episodes,
+        # oldest first in each environment to keep the buffer in time order
+        ready = pending & ((ages == self.n - 1) | dones[:, None])
+        rows, slots = np.nonzero(ready)
+        order = np.lexsort((-ages[rows, slots], rows))
+        for i, slot in zip(rows[order], slots[order]):
+            e = envs[i]
+            self.buffer.add((self.states[e][slot], self.actions[e][slot],
+                             self.returns[e, slot], next_states[i],
+                             0 if dones[i] else 1))
+            self.states[e][slot] = self.actions[e][slot] = None
+        ages[ready] = -1
+
+        ages[ages >= 0] += 1
+        self.ages[envs] = ages
+        self.heads[envs] = (heads + 1) % self.n
+
+
+if __name__ == '__main__':
+
+    # Check that the pending experiences are written in time order when an
+    # episode ends, whatever the slot of the ring they are in
+    class ListBuffer(list):
+        add = list.append
+
+    buffer = ListBuffer()
+    writer = NStepWriter(buffer, n=3, discount=0.9)
+    for t in range(5):
+        writer.add(t, t, 1, t + 1, t == 4)
+
+    written = [int(s) for s, a, r, s_, not_done in buffer]
+    assert written == [0, 1, 2, 3, 4], written
+    print("Experiences written in order :", written)
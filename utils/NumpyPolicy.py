@@ -0,0 +1,119 @@
+import threading
+import numpy as np
+
+from network_utils import get_vars
+
+
+def relu(x):
+    return np.maximum(x, 0)
+
+
+def sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+
+def softmax(x, axis=-1):
+    e = np.exp(x - np.max(x, axis=axis, keepdims=True))
+    return e / np.sum(e, axis=axis, keepdims=True)
+
+
+def dense(weights, name, inputs, activation=None):
+    """
+    NumPy counterpart of tf.layers.dense with the weights of the layer name.
+    """
+    output = inputs @ weights[name + '/kernel'] + weights[name + '/bias']
+    return output if activation is None else activation(output)
+
+
+class PolicyExporter:
+    """
+    Exporter writing the weights of the network in a tensorflow scope in a
+    flat float32 blob, with a version number incremented at each export, from
+    which NumpyPolicy instances refresh their weights.
+
+    Each export builds a new blob, so a policy reading the previous one is
+    never given half-written weights.
+    """
+
+    def __init__(self, sess, scope):
+        """
+        Args:
+            sess : the tensorflow session in which the network is trained
+            scope: the scope of the network (only its trainable variables are
+                    exported, without the optimizer slots)
+        """
+        self.sess = sess
+        self.vars = get_vars(scope + '/', trainable=True)
+
+        # Position and shape of each variable in the blob, named relatively
+        # to the scope
+        self.layout = {}
+        offset = 0
+        for var in self.vars:
+            name = var.name[len(scope) + 1:].split(':')[0]
+            shape = var.shape.as_list()
+            self.layout[name] = (offset, shape)
+            offset += int(np.prod(shape))
+
+        self.lock = threading.Lock()
+        self.version = 0
+        self.blob = np.zeros(offset, dtype=np.float32)
+
+    def export(self):
+        """
+        Write the current weights of the network in a new blob.
+        """
+        values = self.sess.run(self.vars)
+        blob = np.concatenate([value.ravel() for value in values]).astype(np.float32)
+        with self.lock:
+            self.blob = blob
+            self.version += 1
+
+    def get(self):
+        """
+        Return the version and the blob of the last export (the weights are
+        exported at the first call if they have never been).
+        """
+        with self.lock:
+            if self.version > 0:
+                return self.version, self.blob
+        self.export()
+        return self.get()
+
+
+class NumpyPolicy:
+    """
+    NumPy forward pass of a small network from the weights exported by a
+    PolicyExporter, to act without any tensorflow session call.
+
+    The forward function takes the dictionary of the weights (views of the
+    blob, named like in the layout of the exporter) and a batch of states.
+    """
+
+    def __init__(self, exporter, forward):
+        self.exporter = exporter
+        self.forward = forward
+
+        self.version = 0
+        self.weights = None
+
+    def refresh(self):
+        """
+        Load the last weights exported if they are newer than the current
+        ones.
+        """
+        version, blob = self.exporter.get()
+        if version == self.version:
+            return
+
+        self.weights = {name: blob[offset:offset + int(np.prod(shape))].reshape(shape)
+                        for name, (offset, shape) in self.exporter.layout.items()}
+        self.version = version
+
+    def __call__(self, states):
+        """
+        Return the outputs of the network for a batch of states.
+        """
+        if self.weights is None:
+            self.refresh()
+        return self.forward(self.weights, np.asarray(states, dtype=np.float32))
@@ -0,0 +1,119 @@
+import queue
+import threading
+
+
+class PrefetchBuffer:
+    """
+    Wrapper around an experience buffer that assembles the next minibatches in
+    a background thread, so that the sampling and the gathering of the columns
+    overlap with the environment steps and the training operations (which
+    release the GIL) instead of running before each of them.
+
+    It has the same interface as the buffer it wraps. Every access to the
+    wrapped buffer goes through a lock, so experiences can be added while the
+    next batches are being sampled.
+
+    With a prioritized buffer, a single batch is in flight : the next batch is
+    only sampled once the priorities of the previous one have been updated, so
+    it is drawn from up-to-date priorities. The sampling probabilities are kept
+    with the batch, so its importance-sampling weights come from the
+    distribution it was actually drawn from. The prefetching then only
+    overlaps the sampling with the rest of the step that follows the update.
+    The versions of the sampled experiences are kept too, so that the update
+    skips those overwritten or evicted by the experiences added meanwhile.
+    """
+
+    def __init__(self, buffer, nb_batches=1):
+        """
+        Args:
+            buffer    : the experience buffer to sample from
+            nb_batches: the maximum number of batches ready in advance
+        """
+        self.buffer = buffer
+        self.prioritized = buffer.prioritized
+
+        self.lock = threading.Lock()
+        self.batches = queue.Queue(maxsize=nb_batches)
+
+        # Number of sampled batches whose priorities have not been updated
+        self.pending_updates = 0
+        self.updated = threading.Condition(self.lock)
+
+        # Versions of the experiences of the batch in flight
+        self.versions = None
+
+        self.thread = None
+        self.running = False
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def add(self, experience):
+        with self.lock:
+            self.buffer.add(experience)
+
+    def prefetch(self):
+        """
+        Method run by the background thread to keep the queue of batches full.
+        """
+        while self.running:
+            with self.updated:
+                while self.running and (len(self.buffer) == 0 or
+                                        self.pending_updates > 0):
+                    self.updated.wait(0.01)
+                if not self.running:
+                    return
+                data, idx = self.buffer.sample_batch()
+                probabilities, versions = None, None
+                if self.prioritized:
+                    probabilities = self.buffer.probabilities(idx)
+                    versions = self.buffer.get_versions(idx)
+                    self.pending_updates += 1
+                batch = (data, idx, probabilities, versions)
+
+            while self.running:
+                try:
+                    self.batches.put(batch, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.prefetch, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def sample(self, beta=None):
+        if self.thread is None:
+            self.start()
+
+        data, idx, probabilities, versions = self.batches.get()
+        if not self.prioritized:
+            return data
+
+        self.versions = versions
+        weights = self.buffer.weights(idx, beta, probabilities)
+        return data, idx, weights
+
+    def update(self, idx, errors):
+        if not self.prioritized:
+            return
+
+        with self.updated:
+            self.buffer.update(idx, errors, self.versions)
+            self.pending_updates = max(0, self.pending_updates - 1)
+            self.updated.notify()
+
+    def get_state(self):
+        with self.lock:
+            return self.buffer.get_state()
+
+    def set_state(self, state):
+        with self.lock:
+            self.buffer.set_state(state)
@@ -0,0 +1,393 @@
+import os
+import tempfile
+import numpy as np
+from collections import deque
+
+
+class TransitionStorage:
+    """
+    Ring buffer that stores experiences (s, a, r, s_, not_done) as one
+    preallocated numpy array per field instead of a list of python tuples.
+
+    The arrays are allocated at the first insertion, when the shapes and the
+    types of the fields are known. A minibatch is then gathered with a single
+    fancy indexing per field and is directly ready to be fed to a network.
+    """
+
+    FIELDS = ('state', 'action', 'reward', 'next_state', 'not_done')
+
+    # Default storage type of each kind of field
+    DTYPES = {'pixels': np.uint8,
+              'vectors': np.float32,
+              'discrete_actions': np.int32,
+              'continuous_actions': np.float32,
+              'rewards': np.float32,
+              'not_dones': np.uint8}
+
+    def __init__(self, capacity, dtypes=None):
+        self.capacity = capacity
+        self.columns = None
+
+        # Storage type of each kind of field (see field_dtype)
+        self.dtypes = dict(self.DTYPES, **(dtypes or {}))
+
+        self.write = 0
+        self.n_entries = 0
+
+        # Indices of the experiences dropped early by the last call to add
+        self.evicted = []
+
+        self.rng = np.random.default_rng()
+
+    def __len__(self):
+        return self.n_entries
+
+    def field_dtype(self, field, value):
+        """
+        Return the type under which a field is stored, according to its kind :
+        integer states are pixels and integer actions are discrete actions.
+        The fields are cast back by the feed (or inside the graph for the
+        pixels) so they can be stored in a smaller type than the network uses.
+        """
+        if field == 'reward':
+            kind = 'rewards'
+        elif field == 'not_done':
+            kind = 'not_dones'
+        elif field == 'action':
+            kind = 'discrete_actions' if value.dtype.kind in 'iub' else 'continuous_actions'
+        else:
+            kind = 'pixels' if value.dtype.kind in 'iub' else 'vectors'
+        return np.dtype(self.dtypes[kind])
+
+    def bytes_per_transition(self):
+        """
+        Return the number of bytes used to store one experience.
+        """
+        return sum(column[0].nbytes for column in self.columns)
+
+    def report(self):
+        print("Replay storage : {} bytes per transition ({:.1f} MB for {} "
+              "transitions)".format(self.bytes_per_transition(),
+                                    self.bytes_per_transition() * self.capacity / 2**20,
+                                    self.capacity))
+
+    def allocate(self, experience):
+        """
+        Allocate one array of size capacity for each field of the experience.
+        """
+        self.columns = []
+        for field, value in zip(self.FIELDS, experience):
+            value = np.asarray(value)
+            self.columns.append(np.empty((self.capacity, *value.shape),
+                                         dtype=self.field_dtype(field, value)))
+
+    def add(self, experience):
+        """
+        Write an experience at the current position of the ring and return the
+        index where it has been stored.
+        """
+        if self.columns is None:
+            self.allocate(experience)
+            self.report()
+
+        idx = self.write
+        for column, value in zip(self.columns, experience):
+            column[idx] = value
+
+        self.write = (self.write + 1) % self.capacity
+        self.n_entries = min(self.n_entries + 1, self.capacity)
+        return idx
+
+    def get(self, idx):
+        """
+        Return the experiences stored at the indices idx as a tuple of arrays
+        (states, actions, rewards, next_states, not_dones).
+        """
+        return tuple(column[idx] for column in self.columns)
+
+    def sample_idx(self, batch_size):
+        """
+        Draw batch_size distinct indices uniformly among the stored experiences
+        (in O(batch_size) whatever the capacity).
+        """
+        batch_size = min(batch_size, self.n_entries)
+        return self.rng.choice(self.n_entries, batch_size, replace=False)
+
+    def get_state(self):
+        """
+        Return the content of the storage as a dict of arrays and counters.
+        """
+        return {'columns': self.columns,
+                'write': self.write,
+                'n_entries': self.n_entries,
+                'rng': self.rng.bit_generator.state}
+
+    def set_state(self, state):
+        """
+        Restore the content of the storage from a dict built by get_state.
+        """
+        if state['columns'] is not None:
+            self.columns = [np.asarray(column) for column in state['columns']]
+        self.write = state['write']
+        self.n_entries = state['n_entries']
+        self.rng.bit_generator.state = state['rng']
+
+
+class FrameStorage(TransitionStorage):
+    """
+    Storage for stacked pixel observations (HEIGHT x WIDTH x STACK arrays).
+
+    Two consecutive states share all their frames but one, and the next state
+    of an experience is the state of the following one : storing the stacks
+    would keep every frame about eight times. Here, each frame is stored once
+    (in its uint8 type) in a ring of frames, and each experience only keeps the
+    serial numbers of the frames making up its state and its next state. The
+    stacks are rebuilt when a batch is sampled.
+
+    A stack only references frames of its own episode (the reset frames are
+    stored as new frames), so a rebuilt state never straddles two episodes.
+
+    Frames are recognized by their content among the `window` last frames
+    stored. When the frame ring wraps, the oldest experiences that still
+    reference an overwritten frame are evicted (their indices are listed in
+    self.evicted).
+    """
+
+    def __init__(self, capacity, frame_capacity=None, window=32, dtypes=None):
+        super().__init__(capacity, dtypes)
+
+        self.window = window
+        self.frame_capacity = frame_capacity or capacity + capacity // 4 + 2 * window
+        self.frames = None
+
+        # Serial number of the next frame to store
+        self.nb_frames = 0
+        # Smallest frame serial referenced by the last experience
+        self.floor = 0
+
+        # Recently stored frames : content -> serial
+        self.recent = {}
+        self.recent_keys = deque()
+
+    def allocate(self, experience):
+        state, *others = experience
+        state = np.asarray(state)
+        height, width, stack = state.shape
+
+        self.frames = np.empty((self.frame_capacity, height, width),
+                               dtype=self.field_dtype('state', state))
+        self.state_refs = np.empty((self.capacity, stack), dtype=np.int64)
+        self.next_state_refs = np.empty((self.capacity, stack), dtype=np.int64)
+
+        # Keep regular columns for the action, the reward and not_done
+        self.columns = []
+        for field, value in zip(self.FIELDS, experience):
+            if field in ('state', 'next_state'):
+                continue
+            value = np.asarray(value)
+            self.columns.append(np.empty((self.capacity, *value.shape),
+                                         dtype=self.field_dtype(field, value)))
+
+    def evict(self, serial):
+        """
+        Drop the oldest experiences that reference a frame older than the one
+        which is going to be overwritten by the frame `serial`.
+        Since the experiences reference increasing frames, only the oldest ones
+        may be concerned.
+        """
+        limit = serial - self.frame_capacity
+        while self.n_entries > 0:
+            oldest = (self.write - self.n_entries) % self.capacity
+            if self.state_refs[oldest].min() > limit and \
+                    self.next_state_refs[oldest].min() > limit:
+                break
+            self.evicted.append(oldest)
+            self.n_entries -= 1
+
+    def store_frame(self, frame):
+        """
+        Return the serial of a frame, storing it if it has not been seen
+        recently.
+        """
+        key = frame.tobytes()
+        serial = self.recent.get(key)
+        if serial is not None and serial >= self.floor:
+            return serial
+
+        serial = self.nb_frames
+        self.evict(serial)
+        self.frames[serial % self.frame_capacity] = frame
+        self.nb_frames += 1
+
+        self.recent[key] = serial
+        self.recent_keys.append((key, serial))
+        if len(self.recent_keys) > self.window:
+            old_key, old_serial = self.recent_keys.popleft()
+            if self.recent.get(old_key) == old_serial:
+                del self.recent[old_key]
+
+        return serial
+
+    def add(self, experience):
+        if self.frames is None:
+            self.allocate(experience)
+            self.report()
+        self.evicted = []
+
+        state, action, reward, next_state, not_done = experience
+        state_refs = [self.store_frame(state[..., i]) for i in range(state.shape[-1])]
+        next_state_refs = [self.store_frame(next_state[..., i]) for i in range(next_state.shape[-1])]
+        self.floor = min(state_refs + next_state_refs)
+
+        idx = self.write
+        self.state_refs[idx] = state_refs
+        self.next_state_refs[idx] = next_state_refs
+        for column, value in zip(self.columns, (action, reward, not_done)):
+            column[idx] = value
+
+        self.write = (self.write + 1) % self.capacity
+        self.n_entries = min(self.n_entries + 1, self.capacity)
+        return idx
+
+    def bytes_per_transition(self):
+        # Frames are shared between experiences : count the average share of
+        # the frame ring taken by one experience
+        frame_bytes = self.frames[0].nbytes * self.frame_capacity / self.capacity
+        refs_bytes = self.state_refs[0].nbytes + self.next_state_refs[0].nbytes
+        return int(frame_bytes) + refs_bytes + super().bytes_per_transition()
+
+    def stack(self, refs):
+        """
+        Rebuild a batch of channel-last stacks from their frame serials.
+        """
+        frames = self.frames[refs % self.frame_capacity]
+        return np.ascontiguousarray(frames.transpose(0, 2, 3, 1))
+
+    def get(self, idx):
+        actions, rewards, not_dones = (column[idx] for column in self.columns)
+        return (self.stack(self.state_refs[idx]), actions, rewards,
+                self.stack(self.next_state_refs[idx]), not_dones)
+
+    def sample_idx(self, batch_size):
+        # The live experiences are the n_entries ones written before self.write
+        idx = super().sample_idx(batch_size)
+        return (self.write - self.n_entries + idx) % self.capacity
+
+    def get_state(self):
+        state = super().get_state()
+        if self.frames is not None:
+            state.update(frames=self.frames,
+                         state_refs=self.state_refs,
+                         next_state_refs=self.next_state_refs)
+        state.update(nb_frames=self.nb_frames, floor=self.floor)
+        return state
+
+    def set_state(self, state):
+        # The recent frames are not saved : the next frames will be stored
+        # again instead of being matched with the restored ones
+        super().set_state(state)
+        if 'frames' in state:
+            self.frames = np.asarray(state['frames'])
+            self.state_refs = np.asarray(state['state_refs'])
+            self.next_state_refs = np.asarray(state['next_state_refs'])
+        self.nb_frames = state['nb_frames']
+        self.floor = state['floor']
+
+
+class TieredStorage(TransitionStorage):
+    """
+    Storage whose capacity is bounded by the disk instead of the RAM.
+
+    The ram_capacity last experiences are kept in RAM columns. When one of them
+    is pushed out of this hot ring, it is spilled into fixed-size records of
+    memory-mapped files (one file per field, in a temporary directory under
+    `path`). The indices seen from the outside are the same as with a
+    TransitionStorage of the same capacity, so a SumTree can still give the
+    priorities of both tiers.
+    """
+
+    def __init__(self, capacity, ram_capacity, path='replay/', dtypes=None):
+        super().__init__(capacity, dtypes)
+
+        self.ram_capacity = min(ram_capacity, capacity)
+        self.path = path
+        self.hot_columns = None
+
+        # Total number of experiences added (the hot ring is indexed by it)
+        self.nb_added = 0
+
+    def allocate(self, experience):
+        os.makedirs(self.path, exist_ok=True)
+        self.directory = tempfile.TemporaryDirectory(prefix='replay_', dir=self.path)
+
+        self.hot_columns, self.columns = [], []
+        for field, value in zip(self.FIELDS, experience):
+            value = np.asarray(value)
+            dtype = self.field_dtype(field, value)
+            self.hot_columns.append(np.empty((self.ram_capacity, *value.shape),
+                                             dtype=dtype))
+            self.columns.append(np.memmap(os.path.join(self.directory.name, field + '.dat'),
+                                          dtype=dtype, mode='w+',
+                                          shape=(self.capacity, *value.shape)))
+
+    def add(self, experience):
+        if self.hot_columns is None:
+            self.allocate(experience)
+            self.report()
+
+        slot = self.nb_added % self.ram_capacity
+
+        # Spill the experience that leaves the hot ring to the disk
+        if self.nb_added >= self.ram_capacity:
+            cold_idx = (self.nb_added - self.ram_capacity) % self.capacity
+            for hot_column, column in zip(self.hot_columns, self.columns):
+                column[cold_idx] = hot_column[slot]
+
+        for hot_column, value in zip(self.hot_columns, experience):
+            hot_column[slot] = value
+
+        idx = self.write
+        self.nb_added += 1
+        self.write = (self.write + 1) % self.capacity
+        self.n_entries = min(self.n_entries + 1, self.capacity)
+        return idx
+
+    def get(self, idx):
+        idx = np.asarray(idx)
+
+        # Last serial number written at each index and its tier
+        serial = idx + self.capacity * ((self.nb_added - 1 - idx) // self.capacity)
+        hot = serial >= self.nb_added - self.ram_capacity
+        hot_pos, cold_pos = np.flatnonzero(hot), np.flatnonzero(~hot)
+
+        # Read the cold records in increasing order to walk the files forward
+        order = np.argsort(idx[cold_pos])
+        cold_pos = cold_pos[order]
+        cold_idx = idx[cold_pos]
+        hot_slot = serial[hot_pos] % self.ram_capacity
+
+        batch = []
+        for hot_column, column in zip(self.hot_columns, self.columns):
+            values = np.empty((len(idx), *column.shape[1:]), dtype=column.dtype)
+            values[hot_pos] = hot_column[hot_slot]
+            values[cold_pos] = column[cold_idx]
+            batch.append(values)
+        return tuple(batch)
+
+    def get_state(self):
+        state = super().get_state()
+        state.update(hot_columns=self.hot_columns, nb_added=self.nb_added)
+        return state
+
+    def set_state(self, state):
+        columns = state['columns']
+        state = dict(state, columns=None)
+        super().set_state(state)
+
+        if columns is not None:
+            # Copy the cold records into new memory-mapped files
+            self.allocate([column[0] for column in columns])
+            for column, saved in zip(self.columns, columns):
+                column[:] = saved
+            self.hot_columns = [np.asarray(column) for column in state['hot_columns']]
+        self.nb_added = state['nb_added']
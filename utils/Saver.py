@@ -1,14 +1,34 @@
-
 import os
+import shutil
+import pickle
+import numpy as np
 import tensorflow as tf
 
 from settings import Settings
 
 
+# Maximum size of the binary files in which the arrays of a state are written
+CHUNK_BYTES = 1 << 26
+
+
+class ArrayFile:
+    """
+    Reference to an array written in one or several chunk files, used in place
+    of the array in the pickled part of a training state.
+    """
+
+    def __init__(self, name, nb_chunks):
+        self.name = name
+        self.nb_chunks = nb_chunks
+
+
 class Saver:
     """
     This class provides an easy way to save the weights of a Network and to load
     them from a saved file on disk.
+
+    It can also save and restore the rest of a training state (experience
+    buffer, exploration schedules, random generator states, counters...).
     """
 
     def __init__(self, sess):
@@ -50,3 +70,104 @@ class Saver:
                 return False
         else:
             return False
+
+    def save_state(self, state, n_episode):
+        """
+        Save a training state in a directory 'State_<n_episode>' next to the
+        network weights.
+
+        The state is a nested structure of dicts, lists and tuples. Its numpy
+        arrays are written as raw .npy files (split in chunks of at most
+        CHUNK_BYTES) and the rest is pickled. The directory is written under a
+        temporary name and renamed at the end, so an interrupted save never
+        replaces the previous one.
+
+        Args:
+            state    : the training state to save
+            n_episode: the number of episodes the agent completed
+        """
+        print("Saving training state", n_episode, "...")
+
+        name = "State_" + str(n_episode)
+        path = Settings.MODEL_PATH + name
+        tmp_path = path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        arrays = []
+
+        def extract(value):
+            # Replace every array by a reference to its files
+            if isinstance(value, np.ndarray):
+                array_file = ArrayFile('array_' + str(len(arrays)), 0)
+                arrays.append((array_file, value))
+                return array_file
+            if isinstance(value, dict):
+                return {key: extract(v) for key, v in value.items()}
+            if isinstance(value, (list, tuple)):
+                return type(value)(extract(v) for v in value)
+            return value
+
+        meta = extract(state)
+
+        for array_file, array in arrays:
+            if array.ndim == 0 or len(array) == 0:
+                chunks = [array]
+            else:
+                rows = max(1, CHUNK_BYTES // max(1, array[0].nbytes))
+                chunks = [array[i:i + rows] for i in range(0, len(array), rows)]
+
+            for i, chunk in enumerate(chunks):
+                np.save(os.path.join(tmp_path, array_file.name + "." + str(i) + ".npy"), chunk)
+            array_file.nb_chunks = len(chunks)
+
+        with open(os.path.join(tmp_path, "state.pkl"), 'wb') as file:
+            pickle.dump(meta, file)
+
+        shutil.rmtree(path, ignore_errors=True)
+        os.rename(tmp_path, path)
+
+        # Keep track of the last state saved
+        with open(Settings.MODEL_PATH + "state_checkpoint", 'w') as file:
+            file.write(name)
+
+        print("Training state saved !")
+
+    def load_state(self):
+        """
+        Return the last training state saved, or None if the LOAD setting is
+        False or if no state is saved.
+        The arrays are read through memory-mapped files and copied once into
+        memory.
+        """
+        if not Settings.LOAD:
+            return None
+
+        try:
+            with open(Settings.MODEL_PATH + "state_checkpoint") as file:
+                path = Settings.MODEL_PATH + file.read().strip()
+            with open(os.path.join(path, "state.pkl"), 'rb') as file:
+                meta = pickle.load(file)
+        except OSError:
+            print("No training state is saved !\n")
+            return None
+
+        print("Loading training state...")
+
+        def restore(value):
+            if isinstance(value, ArrayFile):
+                chunks = [np.load(os.path.join(path, value.name + "." + str(i) + ".npy"),
+                                  mmap_mode='r')
+                          for i in range(value.nb_chunks)]
+                if chunks[0].ndim == 0:
+                    return np.array(chunks[0])
+                return np.concatenate(chunks)
+            if isinstance(value, dict):
+                return {key: restore(v) for key, v in value.items()}
+            if isinstance(value, (list, tuple)):
+                return type(value)(restore(v) for v in value)
+            return value
+
+        state = restore(meta)
+        print("Training state loaded !\n")
+        return state
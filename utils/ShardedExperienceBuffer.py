@@ -0,0 +1,166 @@
+import threading
+import numpy as np
+
+from ExperienceBuffer import RegularExperienceBuffer, PrioritizedExperienceBuffer
+from settings import Settings
+
+
+class ShardedExperienceBuffer:
+    """
+    Experience buffer split into independent shards, each one protected by its
+    own lock, to be shared between several actor threads and a learner thread.
+
+    Each actor writes into its own shard (through the view returned by the
+    method shard), so the actors never contend with each other, only with the
+    learner when it reads their shard. The learner draws its batches from all
+    the shards in proportion to their size (or to their total priority with
+    prioritized shards).
+
+    It has the same interface as the regular and prioritized buffers : the
+    indices it returns encode the shard they come from.
+    """
+
+    def __init__(self, nb_shards, prioritized=False):
+        self.prioritized = prioritized
+
+        capacity = max(1, Settings.BUFFER_SIZE // nb_shards)
+        if prioritized:
+            self.shards = [PrioritizedExperienceBuffer(capacity) for _ in range(nb_shards)]
+            # Leaf indices of a shard tree are lower than this offset
+            self.offset = 2 * self.shards[0].buffer.tree_capacity
+        else:
+            self.shards = [RegularExperienceBuffer(capacity) for _ in range(nb_shards)]
+            self.offset = capacity
+
+        self.locks = [threading.Lock() for _ in range(nb_shards)]
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.shards)
+
+    def shard(self, n):
+        """
+        Return a view of the buffer that writes into the shard n.
+        """
+        return ShardView(self, n)
+
+    def add(self, experience, shard=0):
+        with self.locks[shard]:
+            self.shards[shard].add(experience)
+
+    def split(self, idx):
+        """
+        Return the shard and the index inside this shard of global indices.
+        """
+        idx = np.asarray(idx)
+        return idx // self.offset, idx % self.offset
+
+    def sample_batch(self, batch_size=None):
+        batch_size = batch_size or Settings.BATCH_SIZE
+
+        if self.prioritized:
+            mass = np.array([shard.buffer.total() for shard in self.shards])
+        else:
+            mass = np.array([len(shard) for shard in self.shards], dtype=np.float64)
+        counts = np.random.multinomial(batch_size, mass / mass.sum())
+
+        batches, batch_idx = [], []
+        for n, count in enumerate(counts):
+            if count == 0:
+                continue
+            with self.locks[n]:
+                data, idx = self.shards[n].sample_batch(count)
+            batches.append(data)
+            batch_idx.append(n * self.offset + idx)
+
+        data = tuple(np.concatenate(column) for column in zip(*batches))
+        return data, np.concatenate(batch_idx)
+
+    def probabilities(self, idx):
+        """
+        Return the current probabilities of the global indices idx with
+        respect to the sampling over every shard, and the number of
+        experiences in the buffer.
+        """
+        shards, leaves = self.split(idx)
+        priorities = np.empty(len(leaves))
+        total, n_entries = 0, 0
+
+        for n, shard in enumerate(self.shards):
+            with self.locks[n]:
+                mask = shards == n
+                priorities[mask] = shard.buffer.sum_tree[leaves[mask]]
+                total += shard.buffer.total()
+                n_entries += shard.buffer.n_entries
+
+        return np.maximum(priorities, 1e-6 ** Settings.ALPHA) / total, n_entries
+
+    def weights(self, idx, beta, probabilities=None):
+        """
+        Compute the importance-sampling weights of the global indices idx from
+        their current priorities, or from the probabilities (as returned by
+        the method probabilities) with which they were drawn.
+        """
+        probs, n_entries = probabilities or self.probabilities(idx)
+        weights = (n_entries * probs) ** -beta
+        weights /= np.max(weights)
+
+        return weights
+
+    def get_versions(self, idx):
+        """
+        Return the versions of the global indices idx in their shard (see
+        PrioritizedExperienceBuffer.get_versions).
+        """
+        shards, leaves = self.split(idx)
+        versions = np.empty(len(leaves), dtype=np.int64)
+        for n in np.unique(shards):
+            mask = shards == n
+            with self.locks[n]:
+                versions[mask] = self.shards[n].get_versions(leaves[mask])
+        return versions
+
+    def sample(self, beta=None):
+        data, idx = self.sample_batch()
+        if self.prioritized:
+            return data, idx, self.weights(idx, beta)
+        return data
+
+    def update(self, idx, errors, versions=None):
+        if not self.prioritized:
+            return
+
+        shards, leaves = self.split(idx)
+        errors = np.asarray(errors)
+        for n in np.unique(shards):
+            mask = shards == n
+            with self.locks[n]:
+                self.shards[n].update(leaves[mask], errors[mask],
+                                      None if versions is None else versions[mask])
+
+    def get_state(self):
+        states = []
+        for lock, shard in zip(self.locks, self.shards):
+            with lock:
+                states.append(shard.get_state())
+        return {'shards': states}
+
+    def set_state(self, state):
+        for lock, shard, shard_state in zip(self.locks, self.shards, state['shards']):
+            with lock:
+                shard.set_state(shard_state)
+
+
+class ShardView:
+    """
+    Write access to a single shard of a ShardedExperienceBuffer.
+    """
+
+    def __init__(self, buffer, n):
+        self.buffer = buffer
+        self.n = n
+
+    def __len__(self):
+        return len(self.buffer.shards[self.n])
+
+    def add(self, experience):
+        self.buffer.add(experience, self.n)
@@ -0,0 +1,279 @@
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+from collections import deque
+
+from Environment import Environment
+
+
+def worker(pipe, env_fn, nb_envs):
+    """
+    Loop of a worker process : build its environments, then execute the
+    commands received through the pipe until 'close'.
+    The observations are written in the shared block, everything else is sent
+    back through the pipe.
+    """
+    envs = [env_fn() for _ in range(nb_envs)]
+
+    # Give the shape and the type of the observations to the parent so that it
+    # can allocate the shared block
+    state = np.asarray(envs[0].reset())
+    pipe.send((state.shape, state.dtype.str))
+
+    name, shape, dtype, start = pipe.recv()
+    block = shared_memory.SharedMemory(name=name)
+    states = np.ndarray(shape, dtype=dtype, buffer=block.buf)[:, start:start + nb_envs]
+
+    try:
+        while True:
+            command, *args = pipe.recv()
+
+            if command == 'act':
+                indices, slots, actions = args
+                rewards = np.zeros(len(indices))
+                dones = np.zeros(len(indices), dtype=bool)
+                infos = []
+                for i, (e, slot, action) in enumerate(zip(indices, slots, actions)):
+                    s_, rewards[i], dones[i], info = envs[e].act(action)
+                    if dones[i]:
+                        info = dict(info, terminal_state=s_)
+                        s_ = envs[e].reset()
+                    states[slot, e] = s_
+                    infos.append(info)
+                pipe.send((rewards, dones, infos))
+
+            elif command == 'reset':
+                indices, slots = args
+                for e, slot in zip(indices, slots):
+                    states[slot, e] = envs[e].reset()
+                pipe.send(None)
+
+            elif command == 'act_random':
+                pipe.send([env.act_random() for env in envs])
+
+            elif command == 'call':
+                e, method, method_args = args
+                pipe.send(getattr(envs[e], method)(*method_args))
+
+            elif command == 'close':
+                for env in envs:
+                    env.close()
+                pipe.send(None)
+                break
+    finally:
+        del states
+        block.close()
+
+
+class SubprocessEnvironment:
+    """
+    Vectorized environment whose sub-environments are stepped in worker
+    processes, so that heavy simulators run in parallel instead of being
+    serialized by the GIL. It has the same surface as VectorEnvironment.
+
+    The nb_envs environments are spread over nb_workers processes. The actions
+    are sent to the workers through pipes and the workers write the
+    observations in a shared-memory block : the batch of states returned by
+    reset and act is a view of this block (no copy nor pickling).
+    The block holds two batches used alternately by the calls to act, so the
+    states returned by a call stay valid after the next one (s and s_ of a
+    step can be used together) but not after the one after. They must be
+    copied to be kept longer.
+
+    A group of environments can also be stepped with step_async while the
+    network infers the actions of another group, and collected with
+    step_wait. The states of a group are then gathered in a new array. Each
+    message sent to a worker gets a ticket so that the replies of the groups
+    stepped by the same worker are not mixed up.
+
+    The workers are started with 'spawn' since the parent process already
+    runs the tensorflow threads ; env_fn must be picklable (a class or a
+    module-level function).
+    """
+
+    def __init__(self, nb_envs, nb_workers, env_fn=Environment):
+        """
+        Args:
+            nb_envs   : the number of environments stepped together
+            nb_workers: the number of processes among which they are spread
+            env_fn    : the function called in each worker to build an
+                        environment
+        """
+        self.nb_envs = nb_envs
+        nb_workers = min(nb_workers, nb_envs)
+
+        # Contiguous range of environments owned by each worker
+        bounds = np.linspace(0, nb_envs, nb_workers + 1).astype(int)
+        self.ranges = list(zip(bounds[:-1], bounds[1:]))
+
+        context = mp.get_context('spawn')
+        self.pipes, self.processes = [], []
+        for start, end in self.ranges:
+            pipe, worker_pipe = context.Pipe()
+            process = context.Process(target=worker,
+                                      args=(worker_pipe, env_fn, end - start),
+                                      daemon=True)
+            process.start()
+            self.pipes.append(pipe)
+            self.processes.append(process)
+
+        shapes = [pipe.recv() for pipe in self.pipes]
+        state_shape, dtype = shapes[0]
+        shape = (2, nb_envs, *state_shape)
+
+        self.block = shared_memory.SharedMemory(create=True,
+                                                size=int(np.prod(shape)) * np.dtype(dtype).itemsize)
+        self.buffers = np.ndarray(shape, dtype=dtype, buffer=self.block.buf)
+        for pipe, (start, end) in zip(self.pipes, self.ranges):
+            pipe.send((self.block.name, shape, dtype, start))
+
+        # Half of the block holding the current state of each environment
+        self.slots = np.zeros(nb_envs, dtype=np.int64)
+
+        # Number of messages sent to and received from each worker, and the
+        # replies received before they were asked for
+        self.sent = [0] * len(self.pipes)
+        self.received = [0] * len(self.pipes)
+        self.replies = [{} for _ in self.pipes]
+
+        # Groups started by step_async and not collected yet
+        self.pending = deque()
+        self.closed = False
+
+    def send(self, w, message):
+        """
+        Send a message to the worker w and return the ticket of its reply.
+        """
+        self.pipes[w].send(message)
+        self.sent[w] += 1
+        return self.sent[w] - 1
+
+    def receive(self, w, ticket):
+        """
+        Return the reply of the worker w with the given ticket.
+        """
+        while self.received[w] <= ticket:
+            self.replies[w][self.received[w]] = self.pipes[w].recv()
+            self.received[w] += 1
+        return self.replies[w].pop(ticket)
+
+    def split(self, envs):
+        """
+        Yield, for each worker owning some of the environments envs, its index,
+        the positions of these environments in envs and their local indices.
+        """
+        for w, (start, end) in enumerate(self.ranges):
+            positions = np.flatnonzero((envs >= start) & (envs < end))
+            if len(positions) > 0:
+                yield w, positions, (envs[positions] - start).tolist()
+
+    def get_states(self, envs):
+        """
+        Return the current states of the environments envs : a view of the
+        block when they are all in the same half, a copy otherwise.
+        """
+        if len(envs) == self.nb_envs and np.all(self.slots == self.slots[0]):
+            return self.buffers[self.slots[0]]
+        return self.buffers[self.slots[envs], envs]
+
+    def set_render(self, render):
+        self.call(0, 'set_render', render)
+
+    def set_gif(self, gif, name=None):
+        self.call(0, 'set_gif', gif, name)
+
+    def call(self, e, method, *args):
+        """
+        Call a method of the environment e in its worker and return the result.
+        """
+        for w, (start, end) in enumerate(self.ranges):
+            if start <= e < end:
+                return self.receive(w, self.send(w, ('call', e - start, method, args)))
+
+    def reset(self, envs=None):
+        """
+        Reset the given sub-environments (every one of them by default) and
+        return the current states of all of them.
+        """
+        envs = np.arange(self.nb_envs) if envs is None else np.asarray(envs)
+
+        # Every worker resets its environments at the same time
+        tickets = [(w, self.send(w, ('reset', indices, self.slots[envs[positions]].tolist())))
+                   for w, positions, indices in self.split(envs)]
+        for w, ticket in tickets:
+            self.receive(w, ticket)
+
+        return self.get_states(np.arange(self.nb_envs))
+
+    def act_random(self):
+        """
+        Return a batch of random actions.
+        """
+        tickets = [self.send(w, ('act_random',)) for w in range(len(self.pipes))]
+        return np.array([a for w, ticket in enumerate(tickets)
+                         for a in self.receive(w, ticket)])
+
+    def act(self, actions):
+        """
+        Apply one action in each sub-environment and reset those whose episode
+        is over. It must not be called while groups started by step_async are
+        pending.
+
+        Returns:
+            The batches of next states, rewards and dones and the list of infos.
+        """
+        self.step_async(actions)
+        return self.step_wait()
+
+    def step_async(self, actions, envs=None):
+        """
+        Send the actions of the sub-environments envs (every one of them by
+        default) to their workers without waiting for the results, which are
+        given by step_wait in the order of the calls to step_async.
+        """
+        envs = np.arange(self.nb_envs) if envs is None else np.asarray(envs)
+        actions = np.asarray(actions)
+
+        # Write the next states in the other half of the block
+        self.slots[envs] = 1 - self.slots[envs]
+
+        requests = []
+        for w, positions, indices in self.split(envs):
+            message = ('act', indices, self.slots[envs[positions]].tolist(),
+                       actions[positions])
+            requests.append((w, self.send(w, message), positions))
+        self.pending.append((envs, requests))
+
+    def step_wait(self):
+        """
+        Wait for the oldest group started with step_async and return the
+        batches of its next states, rewards and dones and the list of its infos.
+        """
+        envs, requests = self.pending.popleft()
+
+        rewards = np.zeros(len(envs))
+        dones = np.zeros(len(envs), dtype=bool)
+        infos = [None] * len(envs)
+        for w, ticket, positions in requests:
+            rewards[positions], dones[positions], info = self.receive(w, ticket)
+            for position, i in zip(positions, info):
+                infos[position] = i
+
+        return self.get_states(envs), rewards, dones, infos
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+
+        while self.pending:
+            self.step_wait()
+
+        tickets = [self.send(w, ('close',)) for w in range(len(self.pipes))]
+        for w, (ticket, process) in enumerate(zip(tickets, self.processes)):
+            self.receive(w, ticket)
+            process.join()
+
+        del self.buffers
+        self.block.close()
+        self.block.unlink()
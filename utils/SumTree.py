@@ -1,39 +1,73 @@
-
 import numpy as np
 
 class SumTree:
+    """
+    Array-backed binary tree that keeps, for each node, the sum and the max of
+    the priorities of its leaves.
+
+    The number of leaves is padded to the next power of two so that every leaf
+    lies at the same depth : a whole batch can then be walked down (sampling)
+    or up (priority update) the tree one level at a time with numpy arrays
+    instead of one recursive call per element.
+    """
 
     def __init__(self, capacity=100000):
         self.capacity = capacity
-        self.sum_tree = np.zeros(2 * capacity - 1)
-        self.max_tree = np.ones(2 * capacity - 1)
+
+        # Number of leaves (power of two >= capacity) and depth of the tree
+        self.tree_capacity = 1 << max(0, capacity - 1).bit_length()
+        self.depth = self.tree_capacity.bit_length() - 1
+
+        self.sum_tree = np.zeros(2 * self.tree_capacity - 1)
+        self.max_tree = np.zeros(2 * self.tree_capacity - 1)
         self.data = np.zeros(capacity, dtype=object)
 
+        # Empty leaves have a max priority of 1 (but the padding leaves never
+        # hold any data so they stay at 0)
+        leaves = self.tree_capacity - 1 + np.arange(capacity)
+        self.max_tree[leaves] = 1
+        self._propagate(leaves)
+
         self.write = 0
         self.n_entries = 0
 
-    def _propagate(self, idx, value):
-        parent = (idx - 1) // 2
-        left = 2 * parent + 1
-        right = left + 1
+    def _propagate(self, idx):
+        """
+        Recompute the sums and maxima of every ancestor of the leaves idx, one
+        level at a time. Each parent is recomputed from its two children so a
+        parent shared by several leaves is updated only once.
+        """
+        parents = np.asarray(idx)
+        for _ in range(self.depth):
+            parents = np.unique((parents - 1) // 2)
+            left = 2 * parents + 1
+            right = left + 1
 
-        self.sum_tree[parent] = self.sum_tree[left] + self.sum_tree[right]
-        self.max_tree[parent] = max(self.max_tree[left], self.max_tree[right])
+            self.sum_tree[parents] = self.sum_tree[left] + self.sum_tree[right]
+            self.max_tree[parents] = np.maximum(self.max_tree[left],
+                                                self.max_tree[right])
 
-        if parent != 0:
-            self._propagate(parent, value)
+    def _retrieve(self, values):
+        """
+        Walk down the tree with a batch of prefix sums and return the index of
+        the leaf each of them falls into.
+        """
+        values = np.array(values, dtype=np.float64, ndmin=1)
+        idx = np.zeros(len(values), dtype=np.int64)
 
-    def _retrieve(self, idx, value):
-        left = 2 * idx + 1
+        for _ in range(self.depth):
+            left = 2 * idx + 1
+            left_sum = self.sum_tree[left]
 
-        if left >= 2 * self.capacity - 1:
-            return idx
+            go_right = values > left_sum
+            values = np.where(go_right, values - left_sum, values)
+            idx = np.where(go_right, left + 1, left)
 
-        if value <= self.sum_tree[left]:
-            return self._retrieve(left, value)
-        else:
-            right = left + 1
-            return self._retrieve(right, value - self.sum_tree[left])
+        # Floating point errors may lead a value slightly past the last filled
+        # leaf : bring it back on the last leaf that holds data
+        data_idx = np.minimum(idx - self.tree_capacity + 1,
+                              max(self.n_entries, 1) - 1)
+        return data_idx + self.tree_capacity - 1
 
     def total(self):
         return self.sum_tree[0]
@@ -41,42 +75,72 @@ class SumTree:
     def max(self):
         return self.max_tree[0]
 
-    def add(self, value, data):
+    def add(self, value, data=None):
         self.data[self.write] = data
-        self.update(self.write + self.capacity - 1, value)
+        self.update(self.write + self.tree_capacity - 1, value)
 
         self.write = (self.write + 1) % self.capacity
         self.n_entries = min(self.n_entries + 1, self.capacity)
 
     def update(self, idx, value):
+        """
+        Set the priority of one leaf or of a whole batch of leaves and update
+        their ancestors in a single pass up the tree.
+        If a leaf appears several times in idx, its last value is kept, as if
+        the updates were applied one after the other.
+        """
+        idx = np.array(idx, dtype=np.int64, ndmin=1)
+        value = np.broadcast_to(np.asarray(value, dtype=np.float64), idx.shape)
+
+        # Keep the last occurrence of each leaf
+        idx, last = np.unique(idx[::-1], return_index=True)
+        value = value[::-1][last]
+
         self.sum_tree[idx] = self.max_tree[idx] = value
-        self._propagate(idx, value)
+        self._propagate(idx)
 
     def get(self, value):
-        idx = self._retrieve(0, value)
-        data_idx = idx - self.capacity + 1
+        idx = self._retrieve(value)[0]
+        data_idx = idx - self.tree_capacity + 1
 
         return self.data[data_idx], idx, self.sum_tree[idx]
 
-    def sample(self, batch_size):
-        batch_idx = [None] * batch_size
-        batch_priorities = [None] * batch_size
-        batch = [None] * batch_size
+    def sample_idx(self, batch_size):
+        """
+        Draw one leaf in each of batch_size segments of equal priority mass
+        and return the leaf indices with their priorities.
+        """
         segment = self.total() / batch_size
 
-        a = [segment*i for i in range(batch_size)]
-        b = [segment * (i+1) for i in range(batch_size)]
-        s = np.random.uniform(a, b)
+        a = segment * np.arange(batch_size)
+        s = np.random.uniform(a, a + segment)
+
+        batch_idx = self._retrieve(s)
+        return batch_idx, self.sum_tree[batch_idx]
 
-        for i in range(batch_size):
-            (batch[i], batch_idx[i], batch_priorities[i]) = self.get(s[i])
+    def sample(self, batch_size):
+        batch_idx, batch_priorities = self.sample_idx(batch_size)
+        batch = list(self.data[batch_idx - self.tree_capacity + 1])
 
         return batch, batch_idx, batch_priorities
 
+    def get_state(self):
+        return {'sum_tree': self.sum_tree,
+                'max_tree': self.max_tree,
+                'write': self.write,
+                'n_entries': self.n_entries}
+
+    def set_state(self, state):
+        self.sum_tree = np.asarray(state['sum_tree'])
+        self.max_tree = np.asarray(state['max_tree'])
+        self.write = state['write']
+        self.n_entries = state['n_entries']
+
     def __repr__(self):
         s = ""
-        last_line = " ".join([str(self.sum_tree[i+self.capacity-1]).center(5) for i in range(len(self.data))])
-        for i in range(4):
+        leaves = self.sum_tree[self.tree_capacity - 1:self.tree_capacity - 1 + self.capacity]
+        last_line = " ".join([str(leaf).center(5) for leaf in leaves])
+        for i in range(min(4, self.depth)):
             line = self.sum_tree[2**i-1:2**i-1+2**i]
             s += (" "*(len(last_line)//2**(i+1))).join([str(line[i]).center(5) for i in range(len(line))]).center(len(last_line)) + "\n"
         s += last_line
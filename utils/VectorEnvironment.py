@@ -0,0 +1,162 @@
+import threading
+import numpy as np
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import Environment as environment
+from Environment import Environment
+from SubprocessEnvironment import SubprocessEnvironment
+
+from settings import Settings
+
+
+def build_vector_env(nb_envs, env=None):
+    """
+    Build the vectorized environment given by the settings : the nb_envs
+    environments are stepped in ENV_WORKERS processes, or in the current
+    process if this setting is 0 (env is then used as the first environment).
+
+    The environments that provide a BatchEnvironment (EnvironmentFlappy)
+    simulate all their games at once in the current process.
+    """
+    nb_workers = getattr(Settings, 'ENV_WORKERS', 0)
+    if hasattr(environment, 'BatchEnvironment'):
+        return environment.BatchEnvironment(nb_envs)
+    if nb_workers > 0:
+        return SubprocessEnvironment(nb_envs, nb_workers)
+    return VectorEnvironment(nb_envs, env)
+
+
+class VectorEnvironment:
+    """
+    Wrapper that steps several Environment instances in lockstep, with batched
+    arrays in and out, so that an agent can choose the actions of every
+    environment with a single forward pass of its network.
+
+    Each sub-environment keeps its own frame stack and frame skip. When one of
+    them finishes its episode, it is reset at once : the state returned for it
+    is the first state of its next episode and its terminal state is given in
+    info['terminal_state'].
+
+    Only the first sub-environment is rendered and saved in gifs.
+
+    A group of sub-environments can also be stepped in a background thread
+    with step_async and step_wait, so that the network can infer the actions of
+    another group in the meantime (tensorflow releases the GIL while it runs).
+    """
+
+    def __init__(self, nb_envs, env=None):
+        """
+        Args:
+            nb_envs: the number of environments stepped together
+            env    : an existing Environment to use as the first one
+        """
+        self.nb_envs = nb_envs
+        self.envs = [env or Environment()]
+        self.envs += [Environment() for _ in range(nb_envs - 1)]
+
+        self.states = None
+        self.lock = threading.Lock()
+
+        # Thread stepping the groups given to step_async, one after the other
+        self.executor = None
+        self.pending = deque()
+
+    def set_render(self, render):
+        self.envs[0].set_render(render)
+
+    def set_gif(self, gif, name=None):
+        self.envs[0].set_gif(gif, name)
+
+    def reset(self, envs=None):
+        """
+        Reset the given sub-environments (every one of them by default) and
+        return the current states of all of them.
+        """
+        if envs is None or self.states is None:
+            envs = range(self.nb_envs)
+            states = np.stack([self.envs[e].reset() for e in envs])
+        else:
+            envs = list(envs)
+            states = [self.envs[e].reset() for e in envs]
+
+        with self.lock:
+            if len(envs) == self.nb_envs:
+                self.states = states
+            else:
+                # Copy the states so that the batch returned before stays valid
+                self.states = self.states.copy()
+                self.states[envs] = states
+            return self.states
+
+    def act_random(self):
+        """
+        Return a batch of random actions.
+        """
+        return np.array([env.act_random() for env in self.envs])
+
+    def act(self, actions):
+        """
+        Apply one action in each sub-environment and reset those whose episode
+        is over.
+
+        Returns:
+            The batches of next states, rewards and dones and the list of infos.
+        """
+        return self.step(actions, range(self.nb_envs))
+
+    def step(self, actions, envs):
+        """
+        Apply the actions in the sub-environments envs and return the batches
+        of their next states, rewards and dones and the list of their infos.
+        """
+        next_states = []
+        rewards = np.zeros(len(envs))
+        dones = np.zeros(len(envs), dtype=bool)
+        infos = []
+
+        for i, (e, action) in enumerate(zip(envs, actions)):
+            s_, rewards[i], dones[i], info = self.envs[e].act(action)
+
+            if dones[i]:
+                info = dict(info, terminal_state=s_)
+                s_ = self.envs[e].reset()
+
+            next_states.append(s_)
+            infos.append(info)
+
+        next_states = np.stack(next_states)
+        with self.lock:
+            if len(envs) == self.nb_envs:
+                self.states = next_states
+            else:
+                self.states = self.states.copy()
+                self.states[list(envs)] = next_states
+        return next_states, rewards, dones, infos
+
+    def step_async(self, actions, envs=None):
+        """
+        Start stepping the sub-environments envs (every one of them by default)
+        in the background. The results are given by step_wait, in the order of
+        the calls to step_async.
+        """
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=1)
+        envs = range(self.nb_envs) if envs is None else list(envs)
+        self.pending.append(self.executor.submit(self.step, actions, envs))
+
+    def step_wait(self):
+        """
+        Wait for the oldest group started with step_async and return the
+        batches of its next states, rewards and dones and the list of its infos.
+        """
+        return self.pending.popleft().result()
+
+    def close(self):
+        while self.pending:
+            self.step_wait()
+        if self.executor is not None:
+            self.executor.shutdown()
+
+        for env in self.envs:
+            env.close()
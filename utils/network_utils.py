@@ -1,4 +1,5 @@
 
+import numpy as np
 import tensorflow as tf
 
 
@@ -49,3 +50,33 @@ def l2_regularization(vars):
         if not 'bias' in var.name:
             reg += 1e-6 * tf.nn.l2_loss(var)
     return reg
+
+
+class ActRunner:
+    """
+    Pre-bound runner of the acting output of a network : the output and the
+    state placeholder are bound once with Session.make_callable, which skips
+    the processing of the fetches and of the feed_dict done by sess.run at
+    every call, and a single state is written in a preallocated batch of one
+    state instead of being wrapped in a new list.
+    """
+
+    def __init__(self, sess, output, state_ph, *feeds):
+        """
+        Args:
+            sess    : the tensorflow session in which to run the network
+            output  : the tensor computed for each batch of states
+            state_ph: the placeholder of the batch of states
+            feeds   : the other placeholders fed at each call, in the order
+                        of the arguments following the states
+        """
+        self.run_batch = sess.make_callable(output, [state_ph, *feeds])
+        self.state = np.zeros([1, *state_ph.shape.as_list()[1:]],
+                              dtype=state_ph.dtype.as_numpy_dtype)
+
+    def __call__(self, state, *args):
+        """
+        Return the output of the network for a single state.
+        """
+        self.state[0] = state
+        return self.run_batch(self.state, *args)[0]